@@ -0,0 +1,267 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  Offline benchmark suite for the prediction and training pipelines.
+
+  Every stage of the ML pipeline is timed separately (imports, load_thickness,
+  process_dataframe, scale_dataframe, augmentation, fit and cross-validation of
+  each candidate model, model.predict and CIF parsing) for a single structure
+  and for a batch of N structures built from the CIFs in examples/ and
+  synthetic formulas. Results are written as JSON so that runs from different
+  commits can be compared:
+
+      python benchmarks/run_benchmarks.py --output bench_new.json
+      python benchmarks/run_benchmarks.py --output bench_new.json --compare bench_old.json
+
+  Use --quick for a smoke run and --skip-training to time only the inference path.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+SRC = ROOT / "src"
+EXAMPLES = ROOT / "examples"
+
+
+class BenchmarkRecorder:
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def time(self, stage, scenario, fn, n=1, repeat=None):
+        """Run fn `repeat` times, record the wall times and return the last result."""
+        repeat = self.repeat if repeat is None else repeat
+        times = []
+        result = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            result = fn()
+            times.append(time.perf_counter() - start)
+        self.record(stage, scenario, times, n)
+        return result
+
+    def record(self, stage, scenario, times, n=1):
+        entry = {
+            "stage": stage,
+            "scenario": scenario,
+            "n": n,
+            "repeat": len(times),
+            "min_s": min(times),
+            "median_s": statistics.median(times),
+            "mean_s": statistics.fmean(times),
+        }
+        self.results.append(entry)
+        print(f"{stage:<40} {scenario:<12} n={n:<6} median {entry['median_s'] * 1e3:10.2f} ms")
+
+
+
+def time_import(module, repeat):
+    """Import time of a module in a fresh interpreter (the cost a batch worker pays)."""
+    code = (
+        "import sys, time; sys.path.insert(0, sys.argv[1]); "
+        f"t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    )
+    times = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code, str(SRC)], capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return times
+
+
+
+def synthetic_formulas(n, seed=101):
+    """Deterministic binary/ternary formulas over elements common in 2D materials."""
+    elements = ["Mo", "W", "Nb", "Ta", "Ti", "Zr", "Hf", "Sn", "Ge", "Pt", "Pd", "Re", "V", "Cr",
+                "S", "Se", "Te", "O", "N", "P", "I", "Br", "Cl"]
+    rng = random.Random(seed)
+    formulas = []
+    for _ in range(n):
+        picked = rng.sample(elements, rng.choice([2, 3]))
+        formulas.append("".join(f"{el}{rng.choice(['', '2', '3'])}" for el in picked))
+    return formulas
+
+
+
+def example_cifs():
+    return sorted(str(p) for p in EXAMPLES.glob("*/*.cif"))
+
+
+
+def run(args):
+    sys.path.insert(0, str(SRC))
+    bench = BenchmarkRecorder(args.repeat)
+
+    for module in ("structure_io", "model_export", "predict_thickness_2D"):
+        bench.record(f"import {module}", "cold", time_import(module, max(1, min(args.repeat, 3))))
+
+    import pandas as pd
+    import predict_thickness_2D as ptd
+    from structure_io import read_cif_formula, hill_formula
+    from ase.io import read
+
+    cifs = example_cifs()
+    batch_cifs = [cifs[i % len(cifs)] for i in range(args.batch_size)]
+    scenarios = {
+        "single": ["MoS2"],
+        "batch": synthetic_formulas(args.batch_size),
+    }
+
+    # CIF parsing
+    bench.time("cif scan (read_cif_formula)", "single", lambda: read_cif_formula(cifs[0]))
+    bench.time("cif parse (ase.io.read)", "single", lambda: read(cifs[0]))
+    bench.time("cif scan (read_cif_formula)", "batch", lambda: [read_cif_formula(f) for f in batch_cifs], n=len(batch_cifs))
+    bench.time("cif parse (ase.io.read)", "batch", lambda: [read(f) for f in batch_cifs], n=len(batch_cifs))
+    for i, cif in enumerate(cifs[:args.batch_size]):
+        scenarios["batch"][i] = hill_formula(read_cif_formula(cif))
+
+    # Training data preparation
+    data = bench.time("load_thickness", "training", ptd.load_thickness)
+    processed = bench.time("process_dataframe", "training", lambda: ptd.process_dataframe(data), n=len(data))
+    X, y, scaler, train_columns = bench.time("scale_dataframe (fit)", "training", lambda: ptd.scale_dataframe(processed), n=len(data))
+
+    augmenter = ptd.DataAugmenter(mean=0, std=0.1, num_augmented_samples=args.augmented_samples)
+    X_aug, y_aug = bench.time("augmentation", "training", lambda: augmenter.augment_and_shuffle(X, y),
+                              n=len(X) * args.augmented_samples)
+
+    # Featurization and scaling of the structures to predict
+    features = {}
+    for scenario, formulas in scenarios.items():
+        frame = pd.DataFrame([ptd.simplify_formula(f) for f in formulas], columns=["MaterialName"])
+        featurized = bench.time("process_dataframe", scenario, lambda: ptd.process_dataframe(frame), n=len(formulas))
+        features[scenario] = bench.time(
+            "scale_dataframe (transform)", scenario,
+            lambda: ptd.scale_dataframe(featurized, scaler=scaler, train_columns=train_columns)[0], n=len(formulas))
+
+    # Compiled feature schema (featurize + scale without pandas/matminer)
+    from model_export import CompiledFeatureSchema, element_tables
+
+    compiled = CompiledFeatureSchema({"columns": train_columns, "mean": list(scaler.mean_),
+                                      "scale": list(scaler.scale_), "elements": element_tables()})
+    for scenario, formulas in scenarios.items():
+        simplified = [ptd.simplify_formula(f) for f in formulas]
+        bench.time("compiled schema transform", scenario, lambda: compiled.transform(simplified), n=len(formulas))
+
+    # Candidate model fit, cross-validation and predict
+    if not args.skip_training:
+        from sklearn.model_selection import ShuffleSplit, cross_val_score
+
+        cv = ShuffleSplit(n_splits=args.cv_splits, test_size=ptd.test_size + 0.1, random_state=ptd.rndseem)
+        for model in ptd.classic_candidate_models():
+            name = model.__class__.__name__
+            bench.time(f"fit {name}", "training", lambda: model.fit(X_aug, y_aug), n=len(X_aug), repeat=1)
+            bench.time(f"cv {name}", "training", lambda: cross_val_score(model, X_aug, y_aug, cv=cv, scoring="r2"),
+                       n=args.cv_splits, repeat=1)
+            for scenario, X_pred in features.items():
+                bench.time(f"predict {name}", scenario, lambda: model.predict(X_pred), n=len(X_pred))
+
+        X_fit, X_val, y_fit, y_val = ptd.train_test_split(X_aug, y_aug, test_size=ptd.test_size, random_state=ptd.rndseem)
+        for selection, select in (("full", ptd.select_model_full_cv), ("halving", ptd.select_model_successive_halving)):
+            bench.time(f"model selection ({selection})", "training",
+                       lambda: select(ptd.classic_candidate_models(), X_fit, y_fit, X_val, y_val, n_splits=args.cv_splits),
+                       n=len(X_fit), repeat=1)
+
+    # Shipped pre-trained model (joblib) and its exported counterpart, if any
+    import joblib
+    from model_export import load_exported_model
+
+    pkl_path = EXAMPLES / "MoS2" / "ml_model" / "best_thickness_model.pkl"
+    if pkl_path.exists():
+        model = bench.time("joblib.load pretrained", "single", lambda: joblib.load(pkl_path))
+        if getattr(model, "n_features_in_", None) == X.shape[1]:
+            for scenario, X_pred in features.items():
+                bench.time("predict pretrained", scenario, lambda: model.predict(X_pred), n=len(X_pred))
+        exported = load_exported_model(str(pkl_path.parent), "classic")
+        if exported is not None and exported.manifest["n_features"] == X.shape[1]:
+            for scenario, X_pred in features.items():
+                bench.time("predict exported", scenario, lambda: exported.predict(X_pred.to_numpy()), n=len(X_pred))
+
+    return bench.results
+
+
+
+def git_revision():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r") as f:
+        baseline = {(r["stage"], r["scenario"]): r for r in json.load(f)["results"]}
+
+    print(f"\n{'stage':<40} {'scenario':<12} {'baseline ms':>12} {'current ms':>12} {'ratio':>8}")
+    for r in results:
+        old = baseline.get((r["stage"], r["scenario"]))
+        if old is None:
+            continue
+        ratio = r["median_s"] / old["median_s"] if old["median_s"] > 0 else float("inf")
+        print(f"{r['stage']:<40} {r['scenario']:<12} {old['median_s'] * 1e3:12.2f} {r['median_s'] * 1e3:12.2f} {ratio:8.2f}")
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description="THICK2D offline benchmark suite")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--compare", default=None, help="Earlier JSON result to compare against")
+    parser.add_argument("--repeat", type=int, default=5, help="Repetitions of the cheap stages")
+    parser.add_argument("--batch-size", type=int, default=100, help="Structures in the batch scenario")
+    parser.add_argument("--augmented-samples", type=int, default=50, help="num_augmented_samples for training")
+    parser.add_argument("--cv-splits", type=int, default=10, help="ShuffleSplit folds in the CV stage")
+    parser.add_argument("--skip-training", action="store_true", help="Skip the model fit/CV stages")
+    parser.add_argument("--quick", action="store_true", help="Small smoke run (repeat 1, batch 10, 5 samples, 2 folds)")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.repeat, args.batch_size, args.augmented_samples, args.cv_splits = 1, 10, 5, 2
+
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.compare) if args.compare else None
+
+    # Run from an empty directory so no thick2dtool.in or ml_model of the caller is picked up
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            results = run(args)
+        finally:
+            os.chdir(cwd)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nBenchmark results written to {output}")
+
+    if baseline:
+        compare(results, baseline)
+
+
+
+if __name__ == "__main__":
+    main()
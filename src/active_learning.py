@@ -0,0 +1,288 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+# Active learning over a directory of structures.
+# Every structure is first predicted with the saved thickness model of
+# <control dir>/ml_model (no training, no DFT) and ranked by its uncertainty:
+#   spread     ensemble/forest spread of ensemble.py (ensemble_size > 1 or a forest model)
+#   distance   distance in scaled feature space to the nearest training formula
+#              (the reference dataset plus mat_thickness.txt of the control directory)
+# The most uncertain `fraction` of the structures is relaxed with DFT through the
+# batch executors (optimize = True). The thickness of each relaxed layer, its
+# atomic extent along the vacuum direction plus vdwgap, is appended to
+# <control dir>/mat_thickness.txt, which the next training run with
+# add_thickness_data = True merges into the reference data; the same rows are
+# stored with source DFT in <control dir>/thick2d_results.db.
+#
+#   python active_learning.py <structure dir> <control file dir> <batch dir> [--fraction 0.1] [--uncertainty auto|spread|distance]
+#   python active_learning.py <structure dir> <control file dir> <batch dir> --collect
+
+import os
+import sys
+import math
+import argparse
+import numpy as np
+from executors import (list_structure_files, prepare_batch, job_state, read_control_values, add_executor_arguments,
+                       submit_batch, finish_batch, deduplicate_batch, clear_duplicates, batch_jobs, job_runtime)
+from results_store import ResultsStore, results_db_name
+from cost_model import CostModel, dft_runtimes_name
+from structure_io import reduced_formula
+
+
+screening_name = "screening.txt"
+learned_marker = "thick2d.learned"
+user_data_name = "mat_thickness.txt"
+
+
+
+def load_screening_model(model_dir):
+    """
+    Saved thickness model and feature schema of `model_dir`: the ensemble if
+    one was saved, else best_thickness_model.pkl, else the exported model.
+
+    Returns:
+    - (object, dict): Model and feature schema.
+    """
+    import joblib
+    from ensemble import ensemble_model_name
+    from model_export import load_feature_schema, load_exported_model
+
+    schema = load_feature_schema(model_dir)
+    if schema is None:
+        raise FileNotFoundError(f"No feature schema in {model_dir}; run thick2d once with use_ml_model = True to train a model.")
+    for name in (ensemble_model_name, "best_thickness_model.pkl"):
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path):
+            return joblib.load(path), schema
+    model = load_exported_model(model_dir, "classic")
+    if model is None:
+        raise FileNotFoundError(f"No classic thickness model in {model_dir}.")
+    return model, schema
+
+
+
+def training_formulas(reference_dir=None, data_path=None):
+    """Formulas the model was (or will be) trained on: the reference dataset plus the user data file."""
+    from reference_data import load_reference_dataset
+
+    formulas = list(load_reference_dataset(reference_dir).table["MaterialName"])
+    if data_path and os.path.exists(data_path):
+        with open(data_path, "r") as f:
+            formulas += [line.split()[0] for line in f if line.strip() and not line.startswith("#")]
+    return formulas
+
+
+
+def featurize_each(compiled, formulas):
+    """Scaled features of every formula that the compiled schema can featurize (rows, formulas kept)."""
+    rows, kept = [], []
+    for formula in formulas:
+        X = compiled.transform([formula])
+        if X is not None:
+            rows.append(X[0])
+            kept.append(formula)
+    width = len(compiled.columns)
+    return (np.array(rows, dtype=np.float64) if rows else np.zeros((0, width))), kept
+
+
+
+def nearest_distance(X, reference):
+    """Euclidean distance of every row of X to its nearest row of `reference` (inf without reference rows)."""
+    if len(reference) == 0:
+        return np.full(len(X), np.inf)
+    squared = (X ** 2).sum(axis=1)[:, None] - 2 * X @ reference.T + (reference ** 2).sum(axis=1)[None, :]
+    return np.sqrt(np.maximum(squared.min(axis=1), 0.0))
+
+
+
+def screen_structures(structure_dir, model_dir, uncertainty="auto", reference_dir=None, data_path=None,
+                      structure_files=None):
+    """
+    Predict the thickness of every structure of `structure_dir` with the saved
+    model and attach an uncertainty.
+
+    Args:
+    - structure_dir (str): Directory with the structure files.
+    - model_dir (str): ml_model directory with the saved model and feature schema.
+    - uncertainty (str): 'spread', 'distance' or 'auto' (spread when the model has one).
+    - reference_dir (str or None): Reference dataset (default: the shipped one).
+    - data_path (str or None): mat_thickness.txt with additional training data.
+    - structure_files (list or None): File names to screen (default: all structure files).
+
+    Returns:
+    - list: dicts with file, formula, thickness, uncertainty and method. Structures
+      whose formula cannot be featurized get thickness None and an infinite uncertainty.
+    """
+    from structure_io import read_structure_counts
+    from ensemble import prediction_spread
+    from model_export import CompiledFeatureSchema
+
+    model, schema = load_screening_model(model_dir)
+    compiled = CompiledFeatureSchema(schema)
+    if not compiled.compiled:
+        raise ValueError(f"The feature schema of {model_dir} has no element tables; retrain the model.")
+
+    results = []
+    for structure_file in structure_files if structure_files is not None else list_structure_files(structure_dir):
+        try:
+            formula = reduced_formula(read_structure_counts(os.path.join(structure_dir, structure_file)))
+        except Exception as e:
+            print(f"Skipping {structure_file}: {e}")
+            continue
+        results.append({"file": structure_file, "formula": formula, "thickness": None,
+                        "uncertainty": float("inf"), "method": "unknown"})
+
+    X, kept = featurize_each(compiled, [r["formula"] for r in results])
+    known = [r for r in results if r["formula"] in set(kept)]
+    if not known:
+        return results
+    X = np.array([X[kept.index(r["formula"])] for r in known])
+
+    predictions, spread = prediction_spread(model, X.astype(np.float32))
+    method = "spread" if spread is not None and uncertainty in ("auto", "spread") else "distance"
+    if uncertainty == "spread" and spread is None:
+        print("The saved model carries no spread (use ensemble_size > 1); ranking by feature distance.")
+    if method == "distance":
+        reference, _ = featurize_each(compiled, training_formulas(reference_dir, data_path))
+        spread = nearest_distance(X, reference)
+
+    for r, thickness, value in zip(known, np.ravel(predictions), np.ravel(spread)):
+        r.update(thickness=float(thickness), uncertainty=float(value), method=method)
+    return results
+
+
+
+def select_uncertain(results, fraction):
+    """The ceil(fraction * n) most uncertain screening results (at least one when there are any)."""
+    if not results or fraction <= 0:
+        return []
+    count = min(len(results), max(1, math.ceil(fraction * len(results))))
+    return sorted(results, key=lambda r: -r["uncertainty"])[:count]
+
+
+
+def write_screening(results, selected, path):
+    chosen = {r["file"] for r in selected}
+    with open(path, "w") as f:
+        f.write("#File, Formula, Thickness (Ang), Uncertainty, Method, Selected\n")
+        for r in sorted(results, key=lambda r: -r["uncertainty"]):
+            thickness = "" if r["thickness"] is None else f"{r['thickness']:.4f}"
+            f.write(f"{r['file']}, {r['formula']}, {thickness}, {r['uncertainty']:.4f}, {r['method']}, "
+                    f"{r['file'] in chosen}\n")
+
+
+
+def layer_thickness(atoms, vdwgap=3.5):
+    """
+    Thickness of a relaxed layer: the extent of the atoms along the normal of
+    the vacuum direction (slab height minus the vacuum gap) plus vdwgap.
+    """
+    from dft_setup import vacuum_axis
+
+    axis = vacuum_axis(atoms)
+    s = np.sort(atoms.get_scaled_positions(wrap=True)[:, axis])
+    gap = np.append(np.diff(s), 1.0 - s[-1] + s[0]).max()
+    others = [i for i in range(3) if i != axis]
+    area = np.linalg.norm(np.cross(atoms.cell[others[0]], atoms.cell[others[1]]))
+    height = abs(atoms.get_volume()) / area
+    return float((1.0 - gap) * height + vdwgap)
+
+
+
+def learn_from_jobs(jobs, data_path):
+    """
+    Append formula and relaxed-layer thickness of the finished DFT jobs to
+    `data_path` (mat_thickness.txt), once per job, and store them with source
+    DFT in the thick2d_results.db next to it.
+
+    Returns:
+    - int: Number of rows appended.
+    """
+    from ase.io import read
+
+    rows, results = [], []
+    for job in jobs:
+        structure = os.path.join(job, "OPT", "optimized_structure.cif")
+        if job_state(job) != "done" or not os.path.isfile(structure) or os.path.exists(os.path.join(job, learned_marker)):
+            continue
+        try:
+            atoms = read(structure)
+            vdwgap = float(read_control_values(os.path.join(job, "thick2dtool.in")).get("vdwgap", 3.5))
+            symbols = atoms.get_chemical_symbols()
+            formula = reduced_formula({s: symbols.count(s) for s in set(symbols)})
+            thickness = layer_thickness(atoms, vdwgap)
+            rows.append(f"{formula} {thickness:.4f}\n")
+            runtime = job_runtime(job)
+            results.append({"formula": formula, "thickness": thickness, "material_id": os.path.basename(job),
+                            "source": "DFT", "timings": {"job_s": runtime} if runtime is not None else None})
+        except Exception as e:
+            print(f"No thickness taken from {job}: {e}")
+            continue
+        open(os.path.join(job, learned_marker), "w").close()
+
+    if rows:
+        with open(data_path, "a") as f:
+            f.writelines(rows)
+        with ResultsStore(os.path.join(os.path.dirname(os.path.abspath(data_path)), results_db_name)) as store:
+            store.add_many(results)
+    return len(rows)
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Screen structures with the ML model and relax the most uncertain with DFT.")
+    parser.add_argument("structure_dir")
+    parser.add_argument("control_dir", help="directory with thick2dtool.in and ml_model/")
+    parser.add_argument("batch_dir")
+    parser.add_argument("--fraction", type=float, default=0.1, help="fraction of the structures sent to DFT")
+    parser.add_argument("--uncertainty", choices=["auto", "spread", "distance"], default="auto")
+    parser.add_argument("--model-dir", default=None, help="saved model (default: <control_dir>/ml_model)")
+    parser.add_argument("--collect", action="store_true", help="only collect finished DFT jobs into mat_thickness.txt")
+    parser.add_argument("--dedup", action="store_true", help="screen only one structure of each group of duplicates")
+    add_executor_arguments(parser)
+    args = parser.parse_args(argv)
+
+    control = read_control_values(os.path.join(args.control_dir, "thick2dtool.in"))
+    data_path = os.path.join(args.control_dir, user_data_name)
+    cost_model = CostModel(args.runtimes or os.path.join(args.control_dir, dft_runtimes_name))
+    os.makedirs(args.batch_dir, exist_ok=True)
+
+    if args.collect:
+        jobs, duplicates = batch_jobs(args.structure_dir, args.batch_dir)
+    else:
+        structure_files = deduplicate_batch(args.structure_dir, args.batch_dir) if args.dedup else None
+        if not args.dedup:
+            clear_duplicates(args.batch_dir)
+        results = screen_structures(args.structure_dir, args.model_dir or os.path.join(args.control_dir, "ml_model"),
+                                    args.uncertainty, control.get("reference_dataset"), data_path, structure_files)
+        selected = select_uncertain(results, args.fraction)
+        write_screening(results, selected, os.path.join(args.batch_dir, screening_name))
+        print(f"{len(results)} structures screened, {len(selected)} sent to DFT "
+              f"(see {os.path.join(args.batch_dir, screening_name)})")
+        jobs = prepare_batch(args.structure_dir, args.control_dir, args.batch_dir,
+                             structure_files={r["file"] for r in selected}, overrides={"optimize": "True"})
+        duplicates = batch_jobs(args.structure_dir, args.batch_dir)[1]
+        jobs = submit_batch(jobs, args, cost_model)
+
+    finish_batch(jobs, args.batch_dir, cost_model, duplicates)
+    added = learn_from_jobs(jobs, data_path)
+    if added:
+        print(f"{added} DFT thicknesses appended to {data_path}; retrain with add_thickness_data = True.")
+    return 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,187 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+# Relative cost of a DFT relaxation, used to submit batches longest-first.
+# The estimate is log-linear in the number of irreducible k-points, valence
+# electrons (ZVAL of the POTCARs, z_valence of the UPF files), cell volume and
+# atoms:  log t = c + a log Nk + b log Ne + v log V + n log Natoms.
+# Without data the plane-wave scaling a = 1, b = 2, v = 1, n = 0 is used.
+# Measured runtimes are stored in a JSON file and the coefficients are refitted
+# by ridge regression towards that prior, so the ordering improves as batches
+# finish. A job that did not relax from scratch (relaxed-structure cache hit,
+# completed OPT directory, resumed relaxation) leaves a thick2d.reused marker,
+# and its runtime is not recorded.
+
+import os
+import re
+import json
+import numpy as np
+
+
+dft_runtimes_name = "dft_runtimes.json"
+reused_relaxation_name = "thick2d.reused"
+
+# Potential files looked up per element, as in thick2d (VASP) and optimize_struct (QE)
+potcar_patterns = ("{0}", "{0}_pv", "{0}_sv", "{0}_GW", "{0}_sv_GW", "{0}_pv_GW")
+upf_patterns = ("{0}_pdojo.upf", "{0}.UPF", "{0}pz-vbc.UPF", "{0}_sv.UPF", "{0}.upf")
+
+_zval = re.compile(r'ZVAL\s*=\s*([-+\d.]+)')
+_upf_valence = re.compile(r'z_valence\s*=\s*"?\s*([-+\d.eE]+)|([-+\d.eE]+)\s+Z valence', re.IGNORECASE)
+_noble_gases = (0, 2, 10, 18, 36, 54, 86)
+
+feature_names = ("log_kpoints", "log_electrons", "log_volume", "log_atoms")
+prior_coefficients = np.array([0.0, 1.0, 2.0, 1.0, 0.0])
+
+
+
+def read_potcar_zval(path):
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            match = _zval.search(line)
+            if match:
+                return float(match.group(1))
+    return None
+
+
+
+def read_upf_valence(path):
+    with open(path, "r", errors="replace") as f:
+        for line in f:
+            match = _upf_valence.search(line)
+            if match:
+                return float(match.group(1) or match.group(2))
+    return None
+
+
+
+def outer_shell_electrons(atomic_number):
+    """Electrons outside the previous noble-gas core (used when no potential file is found)."""
+    return atomic_number - max(z for z in _noble_gases if z < atomic_number)
+
+
+
+def valence_electrons(symbol, potential_dir=None, code_type="VASP"):
+    """Valence electrons of `symbol` from its POTCAR/UPF in potential_dir, else its outer shell."""
+    if potential_dir:
+        if code_type.upper() == "QE":
+            candidates = [os.path.join(potential_dir, p.format(symbol)) for p in upf_patterns]
+            reader = read_upf_valence
+        else:
+            candidates = [os.path.join(potential_dir, p.format(symbol), "POTCAR") for p in potcar_patterns]
+            reader = read_potcar_zval
+        path = next((c for c in candidates if os.path.isfile(c)), None)
+        if path:
+            value = reader(path)
+            if value is not None:
+                return value
+    from ase.data import atomic_numbers
+    return outer_shell_electrons(atomic_numbers[symbol])
+
+
+
+def structure_features(atoms, potential_dir=None, code_type="VASP", kspacing=0.3):
+    """
+    Cost features of a relaxation of `atoms`.
+
+    Returns:
+    - dict: kpoints (irreducible estimate), electrons, volume (Å^3) and atoms.
+    """
+    from dft_setup import kpoint_mesh, irreducible_kpoints
+
+    symbols = atoms.get_chemical_symbols()
+    valence = {s: valence_electrons(s, potential_dir, code_type) for s in set(symbols)}
+    return {
+        "kpoints": irreducible_kpoints(kpoint_mesh(atoms, kspacing)),
+        "electrons": float(sum(valence[s] for s in symbols)),
+        "volume": float(atoms.get_volume()),
+        "atoms": len(atoms),
+    }
+
+
+
+def _design_row(features):
+    return [1.0] + [float(np.log(max(features[k], 1e-12))) for k in ("kpoints", "electrons", "volume", "atoms")]
+
+
+
+class CostModel:
+    """
+    Runtime estimate of DFT relaxations with measured runtimes stored in `path`.
+
+    Usage:
+        model = CostModel("dft_runtimes.json")
+        seconds = model.predict(structure_features(atoms, potential_dir))
+        model.record(features, runtime); model.save()
+    """
+
+    def __init__(self, path=None, regularization=1.0, min_records=3):
+        self.path = path
+        self.regularization = regularization
+        self.min_records = min_records
+        self.records = []
+        if path and os.path.isfile(path):
+            try:
+                with open(path, "r") as f:
+                    self.records = json.load(f).get("records", [])
+            except (OSError, ValueError):
+                self.records = []
+        self.coefficients = self.fit()
+
+    def fit(self):
+        """Ridge regression of log runtime towards the prior exponents (the intercept is free)."""
+        if len(self.records) < self.min_records:
+            return prior_coefficients.copy()
+        X = np.array([_design_row(r["features"]) for r in self.records])
+        y = np.log(np.array([max(r["runtime"], 1.0) for r in self.records]))
+        penalty = self.regularization * np.eye(X.shape[1])
+        penalty[0, 0] = 1e-8
+        delta = np.linalg.solve(X.T @ X + penalty, X.T @ (y - X @ prior_coefficients))
+        return prior_coefficients + delta
+
+    def predict(self, features):
+        """Estimated runtime in seconds (a relative cost until runtimes are recorded)."""
+        return float(np.exp(np.dot(_design_row(features), self.coefficients)))
+
+    def record(self, features, runtime, name=None):
+        self.records.append({"name": name, "features": features, "runtime": float(runtime)})
+        self.coefficients = self.fit()
+
+    def save(self):
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"feature_names": list(feature_names), "coefficients": self.coefficients.tolist(),
+                       "records": self.records}, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+
+def mark_reused_relaxation(directory, reason):
+    """Record in the job directory that its runtime is not that of a full relaxation."""
+    with open(os.path.join(directory, reused_relaxation_name), "a") as f:
+        f.write(reason + "\n")
+
+
+
+def reused_relaxation(directory):
+    return os.path.exists(os.path.join(directory, reused_relaxation_name))
+
+
+
+def longest_first(items, costs):
+    """Items sorted by decreasing cost (LPT order: the largest jobs start first)."""
+    order = sorted(range(len(items)), key=lambda i: -costs[i])
+    return [items[i] for i in order]
@@ -0,0 +1,173 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+# Duplicate structures of a batch, found before any ML or DFT work.
+# Every structure is reduced to its spglib-standardized primitive cell
+# (relaxed_cache.py) and bucketed by cheap invariants: reduced formula, space
+# group and atoms in the primitive cell. Within a bucket the representatives are
+# kept sorted by their lattice parameters, so a new structure is only compared
+# (relaxed_cache.structures_match) with representatives whose lengths are within
+# the tolerance; nothing is compared across buckets. Each structure maps to the
+# first equivalent structure seen, in file-name order.
+#
+#   python dedup.py <structure dir> [--output duplicates.txt]
+
+import os
+import sys
+import bisect
+import argparse
+from relaxed_cache import standardized_primitive, structures_match
+from structure_io import reduced_formula
+
+
+duplicates_name = "duplicates.txt"
+
+
+
+def structure_invariants(atoms, symprec=1e-2):
+    """
+    Bucket key and standardized primitive cell of a structure.
+
+    Returns:
+    - (tuple, Atoms): (reduced Hill formula, space group number, atoms in the primitive cell) and the cell.
+    """
+    primitive, dataset = standardized_primitive(atoms, symprec)
+    symbols = primitive.get_chemical_symbols()
+    formula = reduced_formula({s: symbols.count(s) for s in set(symbols)})
+    number = int(dataset.number) if dataset is not None else 1
+    return (formula, number, len(primitive)), primitive
+
+
+
+class DuplicateFinder:
+    """
+    Incremental duplicate search: add() structures one at a time and get the
+    name of their representative back. Only the primitive cells of the
+    representatives are kept.
+    """
+
+    def __init__(self, symprec=1e-2, ltol=0.02, angle_tol=1.0, stol=0.05):
+        self.symprec = symprec
+        self.ltol = ltol
+        self.angle_tol = angle_tol
+        self.stol = stol
+        # bucket -> sorted [(first lattice length, name)] and the primitive cells of the names
+        self.buckets = {}
+        self.primitives = {}
+        self.comparisons = 0
+
+    def add(self, name, atoms):
+        bucket, primitive = structure_invariants(atoms, self.symprec)
+        length = float(primitive.cell.cellpar()[0])
+        representatives = self.buckets.setdefault(bucket, [])
+        start = bisect.bisect_left(representatives, (length * (1 - self.ltol), ""))
+        for rep_length, rep_name in representatives[start:]:
+            if rep_length * (1 - self.ltol) > length:
+                break
+            self.comparisons += 1
+            if structures_match(primitive, self.primitives[rep_name], self.ltol, self.angle_tol, self.stol,
+                                primitive=True):
+                return rep_name
+        bisect.insort(representatives, (length, name))
+        self.primitives[name] = primitive
+        return name
+
+
+
+def find_duplicates(structures, **tolerances):
+    """
+    Map every (name, atoms) of `structures` to the name of its representative
+    (itself for the first structure of each group).
+    """
+    finder = DuplicateFinder(**tolerances)
+    return {name: finder.add(name, atoms) for name, atoms in structures}
+
+
+
+def deduplicate_directory(structure_dir, structure_files=None, **tolerances):
+    """
+    Representatives of the structure files of `structure_dir`.
+
+    Args:
+    - structure_dir (str): Directory with the structure files.
+    - structure_files (list or None): File names to consider (default: all structure files).
+    - tolerances: symprec, ltol, angle_tol and stol of DuplicateFinder.
+
+    Returns:
+    - dict: file name -> file name of its representative. Unreadable files represent themselves.
+    """
+    from executors import list_structure_files
+    from structure_io import read_structure
+
+    finder = DuplicateFinder(**tolerances)
+    mapping = {}
+    for structure_file in structure_files if structure_files is not None else list_structure_files(structure_dir):
+        try:
+            atoms = read_structure(os.path.join(structure_dir, structure_file))
+            mapping[structure_file] = finder.add(structure_file, atoms)
+        except Exception as e:
+            print(f"No duplicate check for {structure_file}: {e}")
+            mapping[structure_file] = structure_file
+    return mapping
+
+
+
+def representatives(mapping):
+    """File names that represent a group, in their original order."""
+    return [name for name, rep in mapping.items() if name == rep]
+
+
+
+def write_duplicates(mapping, path):
+    with open(path, "w") as f:
+        f.write("#Structure, Representative\n")
+        for name, rep in mapping.items():
+            if name != rep:
+                f.write(f"{name}, {rep}\n")
+
+
+
+def read_duplicates(path):
+    """Duplicate -> representative pairs of a duplicates.txt (empty if the file does not exist)."""
+    mapping = {}
+    if not os.path.isfile(path):
+        return mapping
+    with open(path, "r") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            name, rep = [field.strip() for field in line.split(",", 1)]
+            mapping[name] = rep
+    return mapping
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Find duplicate structures in a directory.")
+    parser.add_argument("structure_dir")
+    parser.add_argument("--output", default=None, help=f"duplicate list (default: <structure_dir>/{duplicates_name})")
+    parser.add_argument("--symprec", type=float, default=1e-2)
+    args = parser.parse_args(argv)
+
+    mapping = deduplicate_directory(args.structure_dir, symprec=args.symprec)
+    output = args.output or os.path.join(args.structure_dir, duplicates_name)
+    write_duplicates(mapping, output)
+    print(f"{len(mapping)} structures, {len(representatives(mapping))} unique; duplicates written to {output}")
+    return 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+# Per-structure DFT settings for optimize = True.
+# The k-point mesh follows a target spacing in reciprocal space (VASP KSPACING
+# convention, 2π included) along the in-plane directions and is 1 along the
+# vacuum direction. NPAR/KPAR (QE -nk/-nd) are chosen from the number of MPI
+# ranks, taken from `ncores`, the job_submit_command (mpirun -np N, srun -n N)
+# or the THICK2D_NCORES/SLURM_NTASKS/PBS_NP/NSLOTS environment variables.
+
+import os
+import shlex
+import numpy as np
+
+
+_mpi_launchers = ("mpirun", "mpiexec", "mpiexec.hydra", "orterun", "srun", "aprun")
+_rank_flags = ("-np", "-n", "--np", "--ntasks", "-ntasks")
+_core_env_vars = ("THICK2D_NCORES", "SLURM_NTASKS", "PBS_NP", "NSLOTS")
+
+
+
+def vacuum_axis(atoms):
+    """Index of the lattice vector with the widest empty gap between periodic images."""
+    scaled = atoms.get_scaled_positions(wrap=True)
+    lengths = atoms.cell.lengths()
+    gaps = []
+    for i in range(3):
+        s = np.sort(scaled[:, i])
+        steps = np.append(np.diff(s), 1.0 - s[-1] + s[0])
+        gaps.append(steps.max() * lengths[i])
+    return int(np.argmax(gaps))
+
+
+
+def kpoint_mesh(atoms, kspacing, vacuum=None):
+    """
+    Gamma-centred mesh with at most `kspacing` (1/Å, 2π included) between k-points.
+
+    Args:
+    - atoms (Atoms): Structure.
+    - kspacing (float): Target k-point spacing.
+    - vacuum (int or None): Non-periodic direction (one k-point); detected when None.
+
+    Returns:
+    - list: Number of k-points along the three reciprocal vectors.
+    """
+    vacuum = vacuum_axis(atoms) if vacuum is None else vacuum
+    reciprocal = 2 * np.pi * np.linalg.norm(atoms.cell.reciprocal(), axis=1)
+    mesh = [max(1, int(np.ceil(b / kspacing - 1e-6))) for b in reciprocal]
+    mesh[vacuum] = 1
+    return mesh
+
+
+
+def detect_cores(command=None, ncores=None):
+    """
+    Number of MPI ranks of the DFT job: `ncores` if given, else the rank count
+    of `command`, else the scheduler environment. Returns None when unknown.
+    """
+    if ncores not in (None, "", "auto"):
+        return int(ncores)
+    if command:
+        ranks = launcher_ranks(command)
+        if ranks:
+            return ranks
+    for name in _core_env_vars:
+        value = os.environ.get(name, "").split("(")[0]
+        if value.isdigit() and int(value) > 0:
+            return int(value)
+    return None
+
+
+
+def launcher_ranks(command):
+    """
+    Rank count given to the MPI launcher of `command` (mpirun -np N, srun --ntasks=N, ...),
+    or None. Only the options between the launcher and the program are read, so
+    flags of the program or of other commands are ignored.
+    """
+    try:
+        tokens = shlex.split(command)
+    except ValueError:
+        tokens = command.split()
+    for i, token in enumerate(tokens):
+        if os.path.basename(token) not in _mpi_launchers:
+            continue
+        previous = token
+        for j, arg in enumerate(tokens[i + 1:], start=i + 1):
+            if arg[:1] in (";", "|", "&", "<", ">"):
+                break
+            if not arg.startswith("-"):
+                # A word after a value (or right after the launcher) is the program
+                if not previous.startswith("-"):
+                    break
+                previous = arg
+                continue
+            flag, _, value = arg.partition("=")
+            if flag in _rank_flags:
+                value = value or (tokens[j + 1] if j + 1 < len(tokens) else "")
+                return int(value) if value.isdigit() else None
+            previous = arg
+    return None
+
+
+
+def _divisors(n):
+    return [d for d in range(1, n + 1) if n % d == 0]
+
+
+
+def irreducible_kpoints(mesh):
+    """Estimate of the irreducible k-points of a Gamma-centred mesh (time reversal only)."""
+    return (int(np.prod(mesh)) + 1) // 2
+
+
+
+def kpoint_groups(ncores, mesh, min_cores_per_group=4):
+    """Largest divisor of ncores not above the k-point count that keeps min_cores_per_group per group."""
+    nk = irreducible_kpoints(mesh)
+    fitting = [d for d in _divisors(ncores) if d <= nk and ncores // d >= min(min_cores_per_group, ncores)]
+    return max(fitting) if fitting else 1
+
+
+
+def vasp_parallel_settings(ncores, mesh):
+    """
+    KPAR and NPAR for `ncores` ranks: KPAR k-point groups, then NPAR close to
+    the square root of the ranks per group (a divisor of it).
+
+    Returns:
+    - dict: {'kpar': int, 'npar': int} (lowercase INCAR keys).
+    """
+    kpar = kpoint_groups(ncores, mesh)
+    per_group = ncores // kpar
+    npar = min(_divisors(per_group), key=lambda d: (abs(d - np.sqrt(per_group)), d))
+    return {'kpar': kpar, 'npar': npar}
+
+
+
+def qe_parallel_flags(ncores, mesh):
+    """pw.x pools (-nk) and linear-algebra group (-nd, a square) for `ncores` ranks."""
+    npool = kpoint_groups(ncores, mesh)
+    per_pool = ncores // npool
+    ndiag = int(np.sqrt(per_pool)) ** 2 if per_pool >= 4 else 1
+    return {'-nk': npool, '-nd': ndiag}
+
+
+
+def add_qe_parallel_flags(command, flags):
+    """Insert pw.x parallelization flags after the pw.x executable unless already present."""
+    words = command.split()
+    if any(w in ("-nk", "-npool", "-npools", "-nd", "-ndiag", "-northo") for w in words):
+        return command
+    position = next((i for i, w in enumerate(words) if os.path.basename(w) == "pw.x"), None)
+    if position is None:
+        return command
+    extra = [str(item) for flag in flags.items() for item in flag]
+    return " ".join(words[:position + 1] + extra + words[position + 1:])
@@ -0,0 +1,105 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+# Uncertainty of the classic thickness models (ensemble_size = k in thick2dtool.in).
+# The k best candidates of the model selection are kept, fitted, in
+# ml_model/ensemble_thickness_models.pkl. They are evaluated on the same scaled
+# feature matrix and the prediction is their mean; the spread is the standard
+# deviation of the members plus, for RandomForest/ExtraTrees members, the
+# variance between their trees (law of total variance). thick2d reports a spread
+# only in this ensemble mode; prediction_spread also gives a single forest model
+# its per-tree spread, which active_learning.py uses to rank structures. Saved
+# ensembles are not exported (model_export.py), so they always take the pkl path.
+
+import numpy as np
+
+
+ensemble_model_name = "ensemble_thickness_models.pkl"
+
+_forest_models = ("RandomForestRegressor", "ExtraTreesRegressor")
+
+
+
+def tree_predictions(model, X):
+    """Per-tree predictions (trees x rows) of a RandomForest/ExtraTrees model, or None."""
+    if model.__class__.__name__ not in _forest_models:
+        return None
+    X = np.asarray(X, dtype=np.float32)
+    return np.stack([tree.predict(X) for tree in model.estimators_])
+
+
+
+def tree_std(model, X):
+    """Standard deviation over the trees of a forest model per row, or None for other models."""
+    per_tree = tree_predictions(model, X)
+    return None if per_tree is None else per_tree.std(axis=0)
+
+
+
+class ThicknessEnsemble:
+    """
+    Top-k fitted thickness models with the predict() contract of a single model.
+
+    Attributes:
+    - models (list): Fitted estimators, best first.
+    - names (list): Algorithm names of the members.
+    """
+
+    def __init__(self, models, names=None):
+        self.models = list(models)
+        self.names = list(names) if names is not None else [m.__class__.__name__ for m in self.models]
+
+    def __len__(self):
+        return len(self.models)
+
+    def predict_members(self, X):
+        """Mean prediction and within-member variance of every member (members x rows each)."""
+        moments = [_moments(m, X) for m in self.models]
+        return np.stack([m for m, _ in moments]), np.stack([v for _, v in moments])
+
+    def predict(self, X):
+        return self.predict_members(X)[0].mean(axis=0)
+
+    def predict_with_spread(self, X):
+        """
+        Returns:
+        - (np.ndarray, np.ndarray): Mean prediction and spread per row.
+        """
+        means, within = self.predict_members(X)
+        return means.mean(axis=0), np.sqrt(means.var(axis=0) + within.mean(axis=0))
+
+
+
+def _moments(model, X):
+    # A forest prediction is the mean of its trees, so the trees give both moments at once
+    per_tree = tree_predictions(model, X)
+    if per_tree is None:
+        prediction = np.asarray(model.predict(X), dtype=np.float64).reshape(len(X))
+        return prediction, np.zeros(len(X))
+    return per_tree.mean(axis=0), per_tree.var(axis=0)
+
+
+
+def prediction_spread(model, X):
+    """
+    Predict with `model` and return (prediction, spread). The spread is None
+    for models that carry no uncertainty (single non-forest models, DNN).
+    """
+    if isinstance(model, ThicknessEnsemble):
+        return model.predict_with_spread(X)
+    if model.__class__.__name__ in _forest_models:
+        prediction, variance = _moments(model, X)
+        return prediction, np.sqrt(variance)
+    return model.predict(X), None
@@ -0,0 +1,558 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+# Batch execution of thick2d over a directory of structures.
+# prepare_batch turns every structure file into a job directory
+# (<batch>/<name>/ with the structure, a thick2dtool.in pointing at it with
+# throughput = True, the INCARs/KPOINTS-sd/qe_input.in next to the control
+# file, and symbolic links to its trained ml_model/ and mat_thickness.txt so the
+# jobs share one model instead of each training its own). A job runs `thick2d` in its directory and records its state in marker
+# files: thick2d.queued, thick2d.running, thick2d.done or thick2d.failed (the
+# last three hold the start and end times in seconds since the epoch).
+# Executors:
+#   LocalExecutor       pool of local subprocesses (e.g. inside one allocation)
+#   SlurmArrayExecutor  one SLURM array script for the whole batch
+#   FakeExecutor        runs a Python callable in-process instead of thick2d (tests, dry runs)
+# With optimize = True the jobs are submitted longest-first by the DFT cost
+# estimate of cost_model.py, and the runtimes of finished jobs are recorded in
+# dft_runtimes.json next to the control file to refine that estimate (except jobs
+# that reused an earlier relaxation and left a thick2d.reused marker).
+# The collected results go to <batch>/batch_thickness.txt and, indexed, to
+# <batch>/thick2d_results.db.
+# Only new and failed jobs are (re)submitted, so a batch can be resubmitted after
+# failures; remove the thick2d.queued/running marker of a job that was cancelled.
+#
+#   python executors.py <structure dir> <control file dir> <batch dir> [--executor local|slurm] [--workers N]
+#   python executors.py <structure dir> <control file dir> <batch dir> --collect
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import subprocess
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from cost_model import CostModel, structure_features, longest_first, dft_runtimes_name, reused_relaxation, \
+    reused_relaxation_name
+from results_store import ResultsStore, latest_result, results_db_name
+
+
+job_states = ("queued", "running", "done", "failed")
+structure_extensions = (".cif", ".vasp", ".poscar", ".xyz", ".extxyz", ".json", ".traj")
+shared_input_files = ("INCARs", "KPOINTS-sd", "qe_input.in")
+shared_model_files = ("ml_model", "mat_thickness.txt")
+batch_results_name = "batch_thickness.txt"
+
+_job_script = """cd "{directory}" || exit 1
+rm -f thick2d.queued thick2d.done thick2d.failed {reused_marker}
+date +%s > thick2d.running
+if {command} > thick2d.stdout 2>&1; then state=done; else state=failed; fi
+date +%s >> thick2d.running
+mv thick2d.running thick2d.$state
+"""
+
+
+
+def marker_path(directory, state):
+    return os.path.join(directory, f"thick2d.{state}")
+
+
+
+def job_state(directory):
+    """State of a job directory from its marker files ('new' when it has none)."""
+    for state in ("done", "failed", "running", "queued"):
+        if os.path.exists(marker_path(directory, state)):
+            return state
+    return "new"
+
+
+
+def set_job_state(directory, state, times=()):
+    for other in job_states:
+        if other != state and os.path.exists(marker_path(directory, other)):
+            os.remove(marker_path(directory, other))
+    with open(marker_path(directory, state), "w") as f:
+        f.writelines(f"{int(t)}\n" for t in times)
+
+
+
+def job_runtime(directory):
+    """Wall time in seconds of a finished job, or None."""
+    for state in ("done", "failed"):
+        try:
+            with open(marker_path(directory, state), "r") as f:
+                times = [int(line) for line in f if line.strip()]
+        except (OSError, ValueError):
+            continue
+        if len(times) >= 2:
+            return times[1] - times[0]
+    return None
+
+
+
+def list_structure_files(structure_dir):
+    return sorted(name for name in os.listdir(structure_dir)
+                  if name.lower().endswith(structure_extensions) or name.startswith(("POSCAR", "CONTCAR")))
+
+
+
+def read_control_values(path):
+    """Key/value pairs of a thick2dtool.in (keys as written, values as strings)."""
+    values = {}
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                key, value = line.split("=", 1)
+                values[key.strip()] = value.strip()
+    return values
+
+
+
+def is_true(value):
+    return str(value).lower() in ['true', 'yes', '1', 'on']
+
+
+
+def job_control_lines(control_lines, structure_file, overrides=None):
+    """thick2dtool.in lines of a job: its structure file, throughput = True and any `overrides`."""
+    settings = {"structure_file": structure_file, "throughput": "True", **(overrides or {})}
+    lines, seen = [], set()
+    for line in control_lines:
+        key = line.split("=", 1)[0].strip() if "=" in line and not line.lstrip().startswith("#") else None
+        if key in settings:
+            line = f"{key} = {settings[key]}\n"
+            seen.add(key)
+        lines.append(line)
+    lines += [f"{key} = {value}\n" for key, value in settings.items() if key not in seen]
+    return lines
+
+
+
+def job_directories(structure_dir, batch_dir, structure_files=None):
+    """(structure file, job directory) for every structure file (or those in `structure_files`)."""
+    jobs = []
+    names = Counter()
+    for structure_file in list_structure_files(structure_dir):
+        # Names are assigned over all files so that a subset gets the same job directories
+        name = os.path.splitext(structure_file)[0]
+        names[name] += 1
+        if names[name] > 1:
+            name = structure_file.replace(".", "_")
+        if structure_files is None or structure_file in structure_files:
+            jobs.append((structure_file, os.path.abspath(os.path.join(batch_dir, name))))
+    return jobs
+
+
+
+def deduplicate_batch(structure_dir, batch_dir, structure_files=None):
+    """
+    Representative structure files of a batch (dedup.py); the duplicates are
+    listed in <batch_dir>/duplicates.txt.
+
+    Returns:
+    - list: Structure files to run.
+    """
+    from dedup import deduplicate_directory, representatives, write_duplicates, duplicates_name
+
+    mapping = deduplicate_directory(structure_dir, structure_files)
+    os.makedirs(batch_dir, exist_ok=True)
+    write_duplicates(mapping, os.path.join(batch_dir, duplicates_name))
+    unique = representatives(mapping)
+    print(f"{len(mapping)} structures, {len(unique)} unique")
+    return unique
+
+
+
+def clear_duplicates(batch_dir):
+    """Forget the duplicates of an earlier --dedup run of the batch."""
+    from dedup import duplicates_name
+
+    path = os.path.join(batch_dir, duplicates_name)
+    if os.path.isfile(path):
+        os.remove(path)
+
+
+
+def batch_jobs(structure_dir, batch_dir):
+    """
+    Job directories of a prepared batch, without those of duplicate structures.
+
+    Returns:
+    - (list, dict): Job directories and duplicate job name -> representative job name.
+    """
+    from dedup import read_duplicates, duplicates_name
+
+    duplicates = read_duplicates(os.path.join(batch_dir, duplicates_name))
+    directories = dict(job_directories(structure_dir, batch_dir))
+    jobs = [directory for structure_file, directory in directories.items() if structure_file not in duplicates]
+    job_names = {os.path.basename(directories[f]): os.path.basename(directories[r])
+                 for f, r in duplicates.items() if f in directories and r in directories}
+    return jobs, job_names
+
+
+
+def prepare_batch(structure_dir, control_dir, batch_dir, structure_files=None, overrides=None):
+    """
+    Create one job directory per structure file.
+
+    Args:
+    - structure_dir (str): Directory with the structure files.
+    - control_dir (str): Directory with thick2dtool.in (and INCARs, KPOINTS-sd, qe_input.in,
+      ml_model/ and mat_thickness.txt, which are linked into every job).
+    - batch_dir (str): Directory that receives the job directories.
+    - structure_files (collection or None): Only these file names of structure_dir.
+    - overrides (dict or None): thick2dtool.in values set in every job, e.g. {'optimize': 'True'}.
+
+    Returns:
+    - list: Job directories, in the order of the structure files.
+    """
+    with open(os.path.join(control_dir, "thick2dtool.in"), "r") as f:
+        control_lines = f.readlines()
+
+    os.makedirs(batch_dir, exist_ok=True)
+    jobs = []
+    for structure_file, directory in job_directories(structure_dir, batch_dir, structure_files):
+        jobs.append(directory)
+        if job_state(directory) not in ("new", "failed"):
+            continue
+
+        os.makedirs(directory, exist_ok=True)
+        shutil.copy(os.path.join(structure_dir, structure_file), directory)
+        with open(os.path.join(directory, "thick2dtool.in"), "w") as f:
+            f.writelines(job_control_lines(control_lines, structure_file, overrides))
+        for input_file in shared_input_files:
+            if os.path.isfile(os.path.join(control_dir, input_file)):
+                shutil.copy(os.path.join(control_dir, input_file), directory)
+        for model_file in shared_model_files:
+            source, link = os.path.abspath(os.path.join(control_dir, model_file)), os.path.join(directory, model_file)
+            if os.path.exists(source) and not os.path.lexists(link):
+                os.symlink(source, link)
+
+    return jobs
+
+
+
+def job_features(directory):
+    """DFT cost features (cost_model.structure_features) of the structure of a job directory."""
+    from structure_io import read_structure
+
+    control = read_control_values(os.path.join(directory, "thick2dtool.in"))
+    atoms = read_structure(os.path.join(directory, control["structure_file"]))
+    # Without kspacing the job uses its KPOINTS-sd mesh; 0.3 1/Å stands in for it in the cost estimate
+    kspacing = float(control.get("kspacing", 0))
+    return structure_features(atoms, control.get("potential_dir"), control.get("code_type", "VASP"),
+                              kspacing=kspacing if kspacing > 0 else 0.3)
+
+
+
+def order_by_cost(jobs, cost_model):
+    """Jobs sorted longest-first by estimated cost; jobs whose cost cannot be estimated go first."""
+    costs = []
+    for job in jobs:
+        try:
+            costs.append(cost_model.predict(job_features(job)))
+        except Exception as e:
+            print(f"No cost estimate for {job}: {e}")
+            costs.append(float("inf"))
+    return longest_first(jobs, costs)
+
+
+
+def record_runtimes(jobs, cost_model):
+    """
+    Add the runtimes of finished DFT jobs that are not yet in the cost model, except
+    jobs that reused an earlier relaxation (cost_model.reused_relaxation). Returns the number added.
+    """
+    recorded = {r.get("name") for r in cost_model.records}
+    added = 0
+    for job in jobs:
+        runtime = job_runtime(job)
+        if job in recorded or job_state(job) != "done" or runtime is None or reused_relaxation(job):
+            continue
+        if not is_true(read_control_values(os.path.join(job, "thick2dtool.in")).get("optimize", "false")):
+            continue
+        try:
+            cost_model.record(job_features(job), runtime, name=job)
+            added += 1
+        except Exception as e:
+            print(f"Runtime of {job} not recorded: {e}")
+    if added:
+        cost_model.save()
+    return added
+
+
+
+def pending_jobs(jobs):
+    """Jobs that have not been submitted or have failed."""
+    return [job for job in jobs if job_state(job) in ("new", "failed")]
+
+
+
+def batch_status(jobs):
+    """Number of jobs per state."""
+    return Counter(job_state(job) for job in jobs)
+
+
+
+class LocalExecutor:
+    """Run the jobs as local subprocesses, `workers` at a time; submit() returns when all are finished."""
+
+    def __init__(self, workers=1, command="thick2d"):
+        self.workers = max(1, int(workers))
+        self.command = command
+
+    def run_job(self, directory):
+        script = _job_script.format(directory=directory, command=self.command, reused_marker=reused_relaxation_name)
+        subprocess.run(["bash", "-c", script], check=False)
+        return job_state(directory)
+
+    def submit(self, jobs):
+        jobs = pending_jobs(jobs)
+        for job in jobs:
+            set_job_state(job, "queued")
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(self.run_job, jobs))
+
+
+
+class SlurmArrayExecutor:
+    """
+    Write a SLURM array script with one task per pending job and submit it
+    with sbatch (submit=False only writes it and leaves the jobs pending).
+    The jobs run asynchronously; follow them with batch_status() and collect_results().
+    """
+
+    def __init__(self, command="thick2d", max_parallel=None, sbatch_options=(), submit=True,
+                 script_name="thick2d_array.sh"):
+        self.command = command
+        self.max_parallel = max_parallel
+        self.sbatch_options = list(sbatch_options)
+        self.submit_jobs = submit
+        self.script_name = script_name
+
+    def write_script(self, jobs, batch_dir):
+        job_list = os.path.join(batch_dir, "thick2d_jobs.txt")
+        with open(job_list, "w") as f:
+            f.writelines(f"{job}\n" for job in jobs)
+
+        array = f"0-{len(jobs) - 1}" + (f"%{self.max_parallel}" if self.max_parallel else "")
+        header = ["#!/bin/bash", "#SBATCH --job-name=thick2d", f"#SBATCH --array={array}",
+                  f"#SBATCH --output={os.path.join(batch_dir, 'slurm-%A_%a.out')}"]
+        header += [f"#SBATCH {option}" for option in self.sbatch_options]
+        body = f'directory=$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" "{job_list}")\n'
+        body += _job_script.format(directory="$directory", command=self.command,
+                                    reused_marker=reused_relaxation_name)
+
+        script_path = os.path.join(batch_dir, self.script_name)
+        with open(script_path, "w") as f:
+            f.write("\n".join(header) + "\n\n" + body)
+        return script_path
+
+    def submit(self, jobs, batch_dir=None):
+        jobs = pending_jobs(jobs)
+        if not jobs:
+            return None
+        batch_dir = batch_dir or os.path.dirname(jobs[0])
+        script_path = self.write_script(jobs, batch_dir)
+        if not self.submit_jobs:
+            print(f"SLURM array script written to {script_path}")
+            return script_path
+
+        # Marked only once sbatch accepted the array, so a failed submission leaves the jobs pending;
+        # tasks that already started keep their running/done marker
+        result = subprocess.run(["sbatch", script_path], capture_output=True, text=True, check=True)
+        print(result.stdout.strip())
+        for job in pending_jobs(jobs):
+            set_job_state(job, "queued")
+        return script_path
+
+
+
+class FakeExecutor:
+    """
+    Local stand-in: call `run(directory)` in-process for every pending job with
+    the same state transitions as a real job (an exception marks it failed).
+    """
+
+    def __init__(self, run):
+        self.run = run
+
+    def submit(self, jobs):
+        jobs = pending_jobs(jobs)
+        for job in jobs:
+            set_job_state(job, "queued")
+        states = []
+        for job in jobs:
+            start = time.time()
+            if reused_relaxation(job):
+                os.remove(os.path.join(job, reused_relaxation_name))
+            set_job_state(job, "running", [start])
+            try:
+                self.run(job)
+                state = "done"
+            except Exception as e:
+                print(f"Job {job} failed: {e}")
+                state = "failed"
+            set_job_state(job, state, [start, time.time()])
+            states.append(state)
+        return states
+
+
+
+def read_thickness_rows(path):
+    """Rows of a structure_thickness.txt: (material, thickness, material_id, spread or None)."""
+    rows = []
+    with open(path, "r") as f:
+        for line in f:
+            if line.startswith("#") or not line.strip():
+                continue
+            fields = [field.strip() for field in line.split(",")]
+            spread = float(fields[3]) if len(fields) > 3 and fields[3] else None
+            rows.append((fields[0], float(fields[1]), fields[2] if len(fields) > 2 and fields[2] else None, spread))
+    return rows
+
+
+
+def collect_results(jobs, output=None, duplicates=None):
+    """
+    Gather the predicted thicknesses of the finished jobs (and write them to
+    `output`, in the format of structure_thickness.txt, when given).
+    `duplicates` (job name -> representative job name) adds the result of the
+    representative for every duplicate structure that was not run.
+
+    Returns:
+    - list: dicts with job, material, thickness, material_id, spread, runtime,
+      and model_version and timings of the job's thick2d_results.db (None and {} without one).
+    """
+    results = []
+    for job in jobs:
+        path = os.path.join(job, "structure_thickness.txt")
+        if job_state(job) != "done" or not os.path.isfile(path):
+            continue
+        stored = latest_result(os.path.join(job, results_db_name)) or {}
+        for material, thickness, material_id, spread in read_thickness_rows(path)[-1:]:
+            results.append({"job": os.path.basename(job), "material": material, "thickness": thickness,
+                            "material_id": material_id, "spread": spread, "runtime": job_runtime(job),
+                            "model_version": stored.get("model_version"), "timings": stored.get("timings", {})})
+
+    by_job = {r["job"]: r for r in results}
+    for name, representative in (duplicates or {}).items():
+        if representative in by_job:
+            results.append({**by_job[representative], "job": name, "material_id": name, "runtime": None,
+                            "duplicate_of": representative})
+
+    if output:
+        with open(output, "w") as f:
+            f.write("#Material, Thickness (Ang), Material_id, Spread (Ang)\n")
+            for r in results:
+                spread = f", {r['spread']}" if r["spread"] is not None else ""
+                material_id = r["material_id"] if r["material_id"] is not None else ""
+                f.write(f"{r['material']}, {r['thickness']} , {material_id}{spread}\n")
+    return results
+
+
+
+def store_results(results, path):
+    """Write collected batch results to a new results database at `path` (see results_store.py)."""
+    if os.path.exists(path):
+        os.remove(path)
+    rows = []
+    for r in results:
+        timings = dict(r.get("timings") or {})
+        if r["runtime"] is not None:
+            timings["job_s"] = r["runtime"]
+        rows.append({"formula": r["material"], "thickness": r["thickness"], "material_id": r["material_id"],
+                     "spread": r["spread"], "model_version": r.get("model_version"), "source": "ML",
+                     "timings": timings})
+    with ResultsStore(path) as store:
+        store.add_many(rows)
+
+
+
+def add_executor_arguments(parser):
+    """Executor options shared by the batch command lines (executors.py, active_learning.py)."""
+    parser.add_argument("--executor", choices=["local", "slurm"], default="local")
+    parser.add_argument("--workers", type=int, default=1, help="parallel jobs of the local executor")
+    parser.add_argument("--max-parallel", type=int, default=None, help="array task limit of the SLURM executor")
+    parser.add_argument("--sbatch", action="append", default=[], help="extra #SBATCH option, e.g. '--time=04:00:00'")
+    parser.add_argument("--no-submit", action="store_true", help="only write the SLURM script")
+    parser.add_argument("--command", default="thick2d")
+    parser.add_argument("--schedule", choices=["cost", "name"], default="cost",
+                        help="submission order with optimize = True: longest estimated DFT cost first, or by name")
+    parser.add_argument("--runtimes", default=None, help=f"runtime records of the cost model (default: <control_dir>/{dft_runtimes_name})")
+
+
+
+def submit_batch(jobs, args, cost_model=None):
+    """Order `jobs` (longest-first with a cost model) and submit them with the executor selected in `args`."""
+    if cost_model is not None and args.schedule == "cost":
+        jobs = order_by_cost(jobs, cost_model)
+    if args.executor == "slurm":
+        SlurmArrayExecutor(args.command, args.max_parallel, args.sbatch, submit=not args.no_submit).submit(jobs, args.batch_dir)
+    else:
+        LocalExecutor(args.workers, args.command).submit(jobs)
+    return jobs
+
+
+
+def finish_batch(jobs, batch_dir, cost_model=None, duplicates=None):
+    """Collect the results, record the DFT runtimes and print the job states. Returns the results."""
+    output = os.path.join(batch_dir, batch_results_name)
+    results = collect_results(jobs, output, duplicates)
+    store_results(results, os.path.join(batch_dir, results_db_name))
+    if cost_model is not None:
+        added = record_runtimes(jobs, cost_model)
+        if added:
+            print(f"Recorded {added} DFT runtimes in {cost_model.path}")
+    status = batch_status(jobs)
+    print(", ".join(f"{state}: {status[state]}" for state in ("new",) + job_states if status[state]))
+    print(f"{len(results)} results written to {output} and {os.path.join(batch_dir, results_db_name)}")
+    return results
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run thick2d over a directory of structures.")
+    parser.add_argument("structure_dir")
+    parser.add_argument("control_dir", help="directory with thick2dtool.in")
+    parser.add_argument("batch_dir")
+    parser.add_argument("--collect", action="store_true", help="only collect the results of finished jobs")
+    parser.add_argument("--dedup", action="store_true", help="run only one structure of each group of duplicates")
+    add_executor_arguments(parser)
+    args = parser.parse_args(argv)
+
+    optimize = is_true(read_control_values(os.path.join(args.control_dir, "thick2dtool.in")).get("optimize", "false"))
+    cost_model = None
+    if optimize:
+        cost_model = CostModel(args.runtimes or os.path.join(args.control_dir, dft_runtimes_name))
+
+    if args.collect:
+        jobs, duplicates = batch_jobs(args.structure_dir, args.batch_dir)
+    else:
+        structure_files = deduplicate_batch(args.structure_dir, args.batch_dir) if args.dedup else None
+        if not args.dedup:
+            clear_duplicates(args.batch_dir)
+        jobs = prepare_batch(args.structure_dir, args.control_dir, args.batch_dir, structure_files)
+        duplicates = batch_jobs(args.structure_dir, args.batch_dir)[1]
+        jobs = submit_batch(jobs, args, cost_model)
+
+    finish_batch(jobs, args.batch_dir, cost_model, duplicates)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+# Opt-in hyperparameter search for the classic candidate models
+# (tune_hyperparameters = True in thick2dtool.in). Every model with a search
+# space is tuned with HalvingRandomSearchCV: random trials are scored on a small
+# subsample first and only the best third of them is promoted to the next,
+# larger budget, so bad trials are pruned early. Trials run in parallel in a
+# joblib process pool. The best parameters are stored in
+# ml_model/tuned_hyperparameters.json keyed by model and training-set hash, and
+# later runs on the same data reuse them without searching again.
+
+import os
+import json
+import hashlib
+import numpy as np
+from scipy.stats import randint, uniform, loguniform
+
+
+tuned_hyperparameters_name = "tuned_hyperparameters.json"
+
+
+SEARCH_SPACES = {
+    "RandomForestRegressor": {
+        "n_estimators": randint(100, 600),
+        "max_depth": [None, 8, 16, 32],
+        "min_samples_leaf": randint(1, 6),
+        "max_features": [1.0, "sqrt", 0.5],
+    },
+    "ExtraTreesRegressor": {
+        "n_estimators": randint(100, 600),
+        "max_depth": [None, 8, 16, 32],
+        "min_samples_leaf": randint(1, 6),
+        "max_features": [1.0, "sqrt", 0.5],
+    },
+    "DecisionTreeRegressor": {
+        "max_depth": [None, 4, 8, 16],
+        "min_samples_leaf": randint(1, 10),
+    },
+    "ExtraTreeRegressor": {
+        "max_depth": [None, 4, 8, 16],
+        "min_samples_leaf": randint(1, 10),
+    },
+    "AdaBoostRegressor": {
+        "n_estimators": randint(50, 400),
+        "learning_rate": loguniform(1e-2, 1.0),
+        "loss": ["linear", "square", "exponential"],
+    },
+    "GradientBoostingRegressor": {
+        "n_estimators": randint(100, 600),
+        "learning_rate": loguniform(1e-2, 3e-1),
+        "max_depth": randint(2, 7),
+        "subsample": uniform(0.6, 0.4),
+    },
+    "CatBoostRegressor": {
+        "iterations": randint(200, 1000),
+        "learning_rate": loguniform(1e-2, 3e-1),
+        "depth": randint(4, 9),
+        "l2_leaf_reg": loguniform(1.0, 10.0),
+    },
+}
+
+
+
+def dataset_digest(X, y, *settings):
+    """SHA-256 of the training rows, targets and any settings that change the fitted data."""
+    sha = hashlib.sha256()
+    sha.update(json.dumps([str(c) for c in getattr(X, "columns", [])]).encode())
+    sha.update(np.ascontiguousarray(np.asarray(X, dtype=np.float64)).tobytes())
+    sha.update(np.ascontiguousarray(np.asarray(y, dtype=np.float64)).tobytes())
+    sha.update(json.dumps([str(s) for s in settings]).encode())
+    return sha.hexdigest()
+
+
+
+def _json_value(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+
+def load_tuned_hyperparameters(cache_path):
+    try:
+        with open(cache_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+
+def save_tuned_hyperparameters(cache_path, tuned):
+    os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(tuned, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, cache_path)
+
+
+
+def tune_models(models, X, y, dataset_key, cache_path, cv, groups=None, n_candidates=20,
+                n_jobs=-1, random_state=None, param_prefix="", name=None):
+    """
+    Tune the hyperparameters of each model that has a search space and return
+    the models with the best parameters set (unfitted).
+
+    Args:
+    - models (list): Unfitted estimators.
+    - X, y: Training data used for the search.
+    - dataset_key (str): Hash of the training data (see dataset_digest); results
+      are cached per model and dataset_key.
+    - cache_path (str): JSON file holding the tuned parameters.
+    - cv: Cross-validation splitter used to score the trials.
+    - groups (array or None): Group labels for a group-aware splitter.
+    - n_candidates (int): Number of random trials in the first halving round.
+    - n_jobs (int): Parallel trials (-1 uses all cores).
+    - random_state (int or None): Seed of the trial sampler.
+    - param_prefix (str): Prefix of the tuned parameter names, e.g. 'estimator__'
+      when the models are wrapped in a meta-estimator.
+    - name (callable or None): Maps a model to its search-space name (defaults to
+      the class name).
+
+    Returns:
+    - list: The models, with tuned parameters where available.
+    """
+    from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+    from sklearn.model_selection import HalvingRandomSearchCV
+
+    name = name or (lambda model: model.__class__.__name__)
+    tuned = load_tuned_hyperparameters(cache_path)
+    result = []
+
+    for model in models:
+        Alg = name(model)
+        space = SEARCH_SPACES.get(Alg)
+        key = f"{Alg}:{dataset_key}"
+
+        if space is None:
+            result.append(model)
+            continue
+
+        if key in tuned:
+            params = tuned[key]["params"]
+            print(f"Using tuned hyperparameters for {Alg}: {params}")
+        else:
+            search = HalvingRandomSearchCV(
+                model,
+                {param_prefix + p: v for p, v in space.items()},
+                n_candidates=n_candidates,
+                factor=3,
+                resource="n_samples",
+                cv=cv,
+                scoring="r2",
+                n_jobs=n_jobs,
+                random_state=random_state,
+                refit=False,
+                error_score=np.nan,
+            )
+            try:
+                search.fit(X, y, groups=groups)
+            except Exception as e:
+                print(f"Hyperparameter search failed for {Alg}: {e}")
+                result.append(model)
+                continue
+            params = {p[len(param_prefix):]: _json_value(v) for p, v in search.best_params_.items()}
+            tuned[key] = {"params": params, "score": float(search.best_score_),
+                          "n_trials": int(len(search.cv_results_["params"]))}
+            save_tuned_hyperparameters(cache_path, tuned)
+            print(f"Tuned hyperparameters for {Alg} (CV R2 {search.best_score_:.3f}): {params}")
+
+        result.append(model.set_params(**{param_prefix + p: v for p, v in params.items()}))
+
+    return result
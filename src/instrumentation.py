@@ -0,0 +1,107 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+# Per-stage timing for thick2d.log. Each stage writes one INFO record whose
+# message is a JSON object (stage, status, wall/CPU seconds, peak RSS), e.g.
+#   2024-05-19 09:09:14 - INFO - {"stage": "predict", "status": "ok", "wall_s": 0.012, ...}
+# With `thick2d --profile`, stages opened with profile=True are also run under
+# cProfile and the stats are written to thick2d_profile/<stage>.prof. Profiled
+# stages nested inside another profiled stage are covered by the outer profile.
+
+import os
+import sys
+import json
+import time
+import logging
+import cProfile
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+profile_dir = "thick2d_profile"
+stage_logger = logging.getLogger("thick2d.stages")
+_profiler_active = False
+
+
+
+def profiling_requested():
+    return "--profile" in sys.argv[1:]
+
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (None where unavailable)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return round(peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024, 1)
+
+
+
+def log_stage_record(name, wall_s, cpu_s=None, status="ok", **fields):
+    record = {"stage": name, "status": status, "wall_s": round(wall_s, 6)}
+    if cpu_s is not None:
+        record["cpu_s"] = round(cpu_s, 6)
+    record["peak_rss_mb"] = peak_rss_mb()
+    record.update(fields)
+    stage_logger.info(json.dumps(record))
+    return record
+
+
+
+@contextmanager
+def stage(name, profile=False, **fields):
+    """
+    Time a pipeline stage and log it to thick2d.log as a JSON record.
+
+    Args:
+    - name (str): Stage name; nested stages are usually prefixed, e.g. 'train/cv'.
+    - profile (bool): Run the stage under cProfile when thick2d is started with --profile.
+    - **fields: Extra JSON-serializable values for the record. The yielded dict can
+      be updated inside the block to add more (e.g. sizes known only at the end);
+      it holds the wall time of the stage as 'wall_s' once the block has finished.
+    """
+    global _profiler_active
+    extra = dict(fields)
+    profiler = None
+    if profile and not _profiler_active and profiling_requested():
+        profiler = cProfile.Profile()
+        _profiler_active = True
+    status = "ok"
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield extra
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _profiler_active = False
+            os.makedirs(profile_dir, exist_ok=True)
+            profile_path = os.path.join(profile_dir, name.replace("/", "_") + ".prof")
+            profiler.dump_stats(profile_path)
+            extra["profile"] = profile_path
+        record = log_stage_record(name, time.perf_counter() - wall_start, time.process_time() - cpu_start,
+                                  status=status, **extra)
+        extra["wall_s"] = record["wall_s"]
@@ -0,0 +1,526 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+# Export of the trained thickness model to a lean inference artifact.
+# Only os/json/numpy are imported at module level; the converters (catboost,
+# skl2onnx, keras/tf2onnx) are imported when exporting and onnxruntime when
+# predicting, so loading an exported model does not pull in the training stack.
+# The CustomDNN is additionally stored as BatchNorm-folded NumPy weights (.npz)
+# and evaluated without TensorFlow or onnxruntime.
+# predict_exported is the whole composition-only prediction path (compiled feature
+# schema + exported model); thick2d calls it before importing predict_thickness_2D.
+# The manifest records the sha256 of the pickled/Keras model the export was made
+# from; an export whose source model changed (or is gone) is not loaded, and
+# train_and_save_best_model removes the old export before training.
+
+import os
+import re
+import json
+import numpy as np
+from math import gcd
+from structure_io import file_digest
+
+
+feature_schema_name = "thickness_features.json"
+
+# Predicted thicknesses are rounded to 0.1 mÅ, so the float32 output of an
+# exported model and the float64 output of the pickled model agree
+thickness_decimals = 4
+
+_formula_pattern = re.compile(r'(?:[A-Z][a-z]*\d*)+')
+_formula_token = re.compile(r'([A-Z][a-z]*)(\d*)')
+
+
+
+_activations = {
+    "linear": lambda x: x,
+    "relu": lambda x: np.maximum(x, 0.0),
+    "tanh": np.tanh,
+    "sigmoid": lambda x: 1.0 / (1.0 + np.exp(-x)),
+    "elu": lambda x: np.where(x > 0, x, np.expm1(x)),
+}
+
+# Layers that are the identity at inference time
+_inference_identity_layers = ("InputLayer", "Dropout", "GaussianNoise", "GaussianDropout")
+
+
+
+def _artifact_paths(directory, model_type):
+    base = os.path.join(directory, f"best_thickness_model_{model_type}")
+    return base + ".onnx", base + ".json"
+
+
+
+def _source_model_path(directory, model_type):
+    name = "best_thickness_model.keras" if model_type == "dnn" else "best_thickness_model.pkl"
+    return os.path.join(directory, name)
+
+
+
+def remove_exported_model(directory, model_type):
+    """Delete the manifest, ONNX file and NumPy weights exported for `model_type`."""
+    onnx_path, manifest_path = _artifact_paths(directory, model_type)
+    for path in (manifest_path, onnx_path, os.path.splitext(onnx_path)[0] + ".npz"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+
+def fold_dnn_weights(keras_model):
+    """
+    Reduce a Sequential Dense/BatchNormalization/Activation stack to a list of
+    affine layers. Each BatchNormalization (an affine map at inference) is folded
+    into the kernel and bias of the following Dense layer; Dropout and
+    GaussianNoise are dropped.
+
+    Returns:
+    - (list, list, list): Kernels, biases and activation names per layer.
+    """
+    kernels, biases, activations = [], [], []
+    scale, shift = None, None  # pending BatchNorm affine map
+
+    def flush_pending():
+        kernels.append(np.diag(scale))
+        biases.append(shift)
+        activations.append("linear")
+
+    for layer in keras_model.layers:
+        kind = layer.__class__.__name__
+        config = layer.get_config()
+
+        if kind == "Dense":
+            weights = layer.get_weights()
+            W = np.asarray(weights[0], dtype=np.float64)
+            b = np.asarray(weights[1], dtype=np.float64) if len(weights) > 1 else np.zeros(W.shape[1])
+            if scale is not None:
+                b = b + shift @ W
+                W = scale[:, None] * W
+                scale, shift = None, None
+            kernels.append(W)
+            biases.append(b)
+            activations.append(str(config.get("activation", "linear")))
+
+        elif kind == "BatchNormalization":
+            weights = [np.asarray(w, dtype=np.float64) for w in layer.get_weights()]
+            gamma = weights.pop(0) if config.get("scale", True) else 1.0
+            beta = weights.pop(0) if config.get("center", True) else 0.0
+            moving_mean, moving_var = weights
+            s = gamma / np.sqrt(moving_var + config.get("epsilon", 1e-3))
+            t = beta - moving_mean * s
+            if scale is None:
+                scale, shift = s * np.ones_like(moving_mean), t * np.ones_like(moving_mean)
+            else:
+                scale, shift = scale * s, shift * s + t
+
+        elif kind == "Activation":
+            if scale is not None:
+                flush_pending()
+                scale, shift = None, None
+            if not kernels or activations[-1] != "linear":
+                raise ValueError("Activation layer does not follow a linear layer.")
+            activations[-1] = str(config["activation"])
+
+        elif kind not in _inference_identity_layers:
+            raise ValueError(f"Layer type {kind} is not supported by the NumPy export.")
+
+    if scale is not None:
+        flush_pending()
+
+    unknown = set(activations) - set(_activations)
+    if unknown:
+        raise ValueError(f"Unsupported activation(s) for the NumPy export: {sorted(unknown)}")
+
+    return kernels, biases, activations
+
+
+
+def export_dnn_weights(model, npz_path):
+    """Save the BatchNorm-folded weights of a (Custom)DNN to a compressed .npz."""
+    keras_model = getattr(model, "model", model)
+    kernels, biases, activations = fold_dnn_weights(keras_model)
+    arrays = {"activations": np.array(activations)}
+    for i, (W, b) in enumerate(zip(kernels, biases)):
+        arrays[f"kernel_{i}"] = W
+        arrays[f"bias_{i}"] = b
+    np.savez_compressed(npz_path, **arrays)
+
+
+
+def _export_catboost(model, onnx_path, n_features):
+    model.save_model(onnx_path, format="onnx")
+
+
+
+def _export_sklearn(model, onnx_path, n_features):
+    from skl2onnx import to_onnx
+
+    onx = to_onnx(model, np.zeros((1, n_features), dtype=np.float32))
+    with open(onnx_path, "wb") as f:
+        f.write(onx.SerializeToString())
+
+
+
+def _export_keras(model, onnx_path, n_features):
+    keras_model = getattr(model, "model", model)
+    # Keras 3 only exports models that have been called at least once
+    keras_model.predict(np.zeros((1, n_features), dtype=np.float32), verbose=0)
+    try:
+        keras_model.export(onnx_path, format="onnx")
+    except (AttributeError, TypeError, ValueError):
+        import tensorflow as tf
+        import tf2onnx
+
+        signature = (tf.TensorSpec((None, n_features), tf.float32, name="input"),)
+        tf2onnx.convert.from_keras(keras_model, input_signature=signature, output_path=onnx_path)
+
+
+
+def export_inference_model(model, directory, model_type, n_features):
+    """
+    Compile the best model to ONNX next to the pickled/Keras model.
+
+    CatBoost uses its native ONNX writer, the scikit-learn trees go through
+    skl2onnx and the Keras CustomDNN through keras.export (tf2onnx for older
+    Keras). The CustomDNN is also written as folded NumPy weights. A missing
+    converter only skips that export. The manifest stores the sha256 of the
+    saved best_thickness_model.pkl/.keras, so the model must be saved first.
+
+    Args:
+    - model: The fitted best model (sklearn/CatBoost estimator or CustomDNN).
+    - directory (str): Model directory (ml_model).
+    - model_type (str): 'classic' or 'dnn'.
+    - n_features (int): Number of scaled input features.
+
+    Returns:
+    - str or None: Path of the exported file, or None if nothing was exported.
+    """
+    algorithm = model.__class__.__name__
+    onnx_path, manifest_path = _artifact_paths(directory, model_type)
+    files = {}
+
+    if model_type == "dnn":
+        npz_path = os.path.splitext(onnx_path)[0] + ".npz"
+        try:
+            export_dnn_weights(model, npz_path)
+            files["npz"] = os.path.basename(npz_path)
+            print(f"DNN weights exported to {npz_path}")
+        except ValueError as e:
+            print(f"Skipping NumPy export of {algorithm}: {e}")
+        exporter = _export_keras
+    elif algorithm == "CatBoostRegressor":
+        exporter = _export_catboost
+    else:
+        exporter = _export_sklearn
+
+    try:
+        exporter(model, onnx_path, n_features)
+        files["onnx"] = os.path.basename(onnx_path)
+        print(f"Inference model exported to {onnx_path}")
+    except Exception as e:
+        print(f"Skipping ONNX export of {algorithm}: {e}")
+
+    if not files:
+        return None
+
+    manifest = {
+        "model_type": model_type,
+        "algorithm": algorithm,
+        "files": files,
+        "n_features": int(n_features),
+    }
+    source_path = _source_model_path(directory, model_type)
+    if os.path.exists(source_path):
+        manifest["model_sha256"] = file_digest(source_path)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    return os.path.join(directory, files.get("onnx", files.get("npz")))
+
+
+
+def element_tables():
+    """
+    Per-element data of the composition featurizers (ElementFraction symbols,
+    Magpie s/p/d/f/total valence electrons for ValenceOrbital, periodictable
+    masses for MolWeight), so that CompiledFeatureSchema can featurize formulas
+    without matminer or pymatgen.
+    """
+    import periodictable
+    from pymatgen.core.periodic_table import Element
+    from matminer.featurizers.composition import ElementFraction, ValenceOrbital
+    from matminer.utils.data import MagpieData
+
+    symbols = ElementFraction().feature_labels()
+    magpie = MagpieData(impute_nan=True)
+    valence = []
+    mass = []
+    for symbol in symbols:
+        element = Element(symbol)
+        valence.append([float(magpie.get_elemental_property(element, f"N{orb}Valence")) for orb in ("s", "p", "d", "f", "")])
+        mass.append(float(getattr(periodictable, symbol).mass) if hasattr(periodictable, symbol) else None)
+
+    return {"symbols": symbols, "valence": valence, "valence_labels": ValenceOrbital().feature_labels(), "mass": mass}
+
+
+
+def save_feature_schema(directory, scaler, train_columns, dataset_sha256=None):
+    """
+    Store the training columns and StandardScaler statistics so that an exported
+    model can be used without refitting the scaler on the training set, the
+    hash of the reference dataset the model was trained on, and the element
+    tables of the featurizers (see CompiledFeatureSchema).
+    """
+    schema = {
+        "columns": list(train_columns),
+        "mean": [float(v) for v in scaler.mean_],
+        "scale": [float(v) for v in scaler.scale_],
+    }
+    if dataset_sha256 is not None:
+        schema["dataset_sha256"] = dataset_sha256
+    try:
+        schema["elements"] = element_tables()
+    except (ImportError, AttributeError, KeyError, ValueError) as e:
+        print(f"Element tables not stored with the feature schema: {e}")
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, feature_schema_name), "w") as f:
+        json.dump(schema, f)
+
+
+
+def load_feature_schema(directory):
+    path = os.path.join(directory, feature_schema_name)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+
+class CompiledFeatureSchema:
+    """
+    Feature schema compiled for inference: a fixed column -> index map plus the
+    element tables stored by save_feature_schema. transform() writes the
+    ElementFraction, ValenceOrbital and MolWeight features of each formula
+    straight into a preallocated matrix in schema column order and scales it
+    in one vectorized operation; no pandas, matminer or pymatgen is involved.
+    """
+
+    def __init__(self, schema):
+        self.columns = schema["columns"]
+        self.column_index = {column: i for i, column in enumerate(self.columns)}
+        self.mean = np.asarray(schema["mean"], dtype=np.float64)
+        self.scale = np.asarray(schema["scale"], dtype=np.float64)
+
+        elements = schema.get("elements")
+        self.compiled = elements is not None
+        if not self.compiled:
+            return
+        self.element_index = {symbol: i for i, symbol in enumerate(elements["symbols"])}
+        self.valence = np.asarray(elements["valence"], dtype=np.float64)
+        self.mass = elements["mass"]
+        # Target column of every element fraction / valence feature (-1: not a training column)
+        self.fraction_columns = np.array([self.column_index.get(s, -1) for s in elements["symbols"]])
+        self.valence_columns = np.array([self.column_index.get(label, -1) for label in elements["valence_labels"]])
+        self.molweight_column = self.column_index.get("MolWeight", -1)
+
+    def featurize_into(self, X, row, formula):
+        """Write the raw features of `formula` into X[row]. Returns False if it cannot be compiled."""
+        if not _formula_pattern.fullmatch(formula):
+            return False
+        counts = {}
+        for symbol, count in _formula_token.findall(formula):
+            if symbol not in self.element_index:
+                return False
+            counts[symbol] = counts.get(symbol, 0) + (int(count) if count else 1)
+
+        idx = np.array([self.element_index[s] for s in counts])
+        amounts = np.array(list(counts.values()), dtype=np.float64)
+        fractions = amounts / amounts.sum()
+
+        columns = self.fraction_columns[idx]
+        X[row, columns[columns >= 0]] = fractions[columns >= 0]
+
+        # Amount-weighted mean of the s, p, d, f and total valence electrons
+        avg = (self.valence[idx] * amounts[:, None]).sum(axis=0) / amounts.sum()
+        valence_features = np.concatenate([avg[:4], avg[:4] / avg[4]])
+        X[row, self.valence_columns[self.valence_columns >= 0]] = valence_features[self.valence_columns >= 0]
+
+        if self.molweight_column >= 0:
+            masses = [self.mass[i] for i in idx]
+            if any(m is None for m in masses):
+                return False
+            X[row, self.molweight_column] = sum(m * a for m, a in zip(masses, counts.values()))
+        return True
+
+    def transform(self, formulas):
+        """
+        Scaled float32 feature matrix of `formulas`, or None if the schema has
+        no element tables or a formula cannot be featurized this way.
+        """
+        if not self.compiled:
+            return None
+        X = np.zeros((len(formulas), len(self.columns)), dtype=np.float64)
+        for row, formula in enumerate(formulas):
+            if not self.featurize_into(X, row, formula):
+                return None
+        X -= self.mean
+        X /= self.scale
+        return X.astype(np.float32)
+
+
+
+class ExportedThicknessModel:
+    """
+    Thickness model loaded from an exported ONNX artifact.
+
+    predict() takes the scaled feature matrix (in the order of the feature
+    schema) and returns a 1-D array of thicknesses.
+    """
+
+    def __init__(self, onnx_path, manifest):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        options.log_severity_level = 3
+        self.manifest = manifest
+        self.session = onnxruntime.InferenceSession(onnx_path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        return self.session.run(None, {self.input_name: X})[0].reshape(len(X))
+
+
+
+class NumpyMLP:
+    """
+    CustomDNN evaluated with NumPy from the folded weights written by
+    export_dnn_weights. Same predict() contract as ExportedThicknessModel.
+    """
+
+    def __init__(self, npz_path, manifest):
+        with np.load(npz_path, allow_pickle=False) as data:
+            self.activations = [str(a) for a in data["activations"]]
+            self.kernels = [data[f"kernel_{i}"] for i in range(len(self.activations))]
+            self.biases = [data[f"bias_{i}"] for i in range(len(self.activations))]
+        self.manifest = manifest
+
+    def predict(self, X):
+        h = np.asarray(X, dtype=np.float64)
+        for W, b, activation in zip(self.kernels, self.biases, self.activations):
+            h = _activations[activation](h @ W + b)
+        return h.reshape(len(h))
+
+
+
+def load_exported_model(directory, model_type):
+    """
+    Load the exported model for `model_type`: the NumPy weights when present,
+    otherwise the ONNX file. Returns None when there is no usable artifact
+    (or only an ONNX file and onnxruntime is not installed) and when the
+    artifact was not exported from the current best_thickness_model.pkl/.keras.
+    """
+    _, manifest_path = _artifact_paths(directory, model_type)
+    if not os.path.exists(manifest_path):
+        return None
+
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+    source_path = _source_model_path(directory, model_type)
+    if not os.path.exists(source_path) or manifest.get("model_sha256") != file_digest(source_path):
+        print(f"The exported model in {directory} does not match {os.path.basename(source_path)}; not using it.")
+        return None
+    files = manifest.get("files", {})
+
+    npz_path = os.path.join(directory, files.get("npz", ""))
+    if files.get("npz") and os.path.exists(npz_path):
+        return NumpyMLP(npz_path, manifest)
+
+    onnx_path = os.path.join(directory, files.get("onnx", ""))
+    if files.get("onnx") and os.path.exists(onnx_path):
+        try:
+            return ExportedThicknessModel(onnx_path, manifest)
+        except ImportError:
+            return None
+
+    return None
+
+
+
+def simplify_formula(formula):
+    # Parse the formula into elements and their counts
+    elements = re.findall(r'([A-Z][a-z]*)(\d*)', formula)
+    elements = {element: int(count) if count else 1 for element, count in elements}
+
+    # Find the greatest common divisor of the counts
+    common_divisor = gcd(*elements.values())
+
+    # Simplify the formula
+    simplified_formula = ''.join(f"{element}{(count // common_divisor) if count > common_divisor else ''}" 
+                                 for element, count in elements.items())
+    
+    return simplified_formula
+
+
+
+def stack_thickness(predictions, spread, nlayers, vdwgap):
+    """
+    Thickness (and spread) of an nlayers stack from the predicted monolayer
+    values, rounded to thickness_decimals whatever model produced them.
+    A spread that is zero everywhere (members that agree exactly) becomes None.
+    """
+    predictions = np.asarray(predictions, dtype=np.float64)
+    if spread is not None:
+        spread = np.asarray(spread, dtype=np.float64)
+        if not np.any(spread):
+            spread = None
+    if nlayers > 1:
+        predictions = vdwgap + predictions * nlayers
+        spread = None if spread is None else spread * nlayers
+    predictions = np.round(predictions, thickness_decimals)
+    spread = None if spread is None else np.round(spread, thickness_decimals)
+    return predictions, spread
+
+
+
+def predict_exported(formulas, directory, model_type, dataset_sha256=None):
+    """
+    Monolayer thicknesses of `formulas` from the exported model of `directory`
+    and its compiled feature schema, with only NumPy (and onnxruntime for ONNX
+    artifacts) imported.
+
+    Args:
+    - formulas (list): Formulas, simplified as by simplify_formula.
+    - directory (str): ml_model directory.
+    - model_type (str): 'classic' or 'dnn'.
+    - dataset_sha256 (str or None): Hash of the current reference dataset; a schema saved for another one is not used.
+
+    Returns:
+    - (np.ndarray, str) or None: Predictions and the algorithm of the model, or None when there
+      is no exported model or compiled schema, the schema is outdated, or a formula cannot be featurized.
+    """
+    schema = load_feature_schema(directory)
+    if schema is None or (dataset_sha256 is not None and schema.get("dataset_sha256", dataset_sha256) != dataset_sha256):
+        return None
+    compiled = CompiledFeatureSchema(schema)
+    if not compiled.compiled:
+        return None
+    X = compiled.transform(formulas)
+    if X is None:
+        return None
+    model = load_exported_model(directory, model_type)
+    if model is None:
+        return None
+    return np.ravel(model.predict(X)), model.manifest['algorithm']
@@ -0,0 +1,214 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+# Budgeted Bayesian search of the input noise and layer width of the CustomDNN
+# (optimize_noise = True in thick2dtool.in). Each trial trains a small
+# GaussianNoise + Dense network for at most `epochs` epochs with early stopping
+# on the validation loss. Trials run in a pool of spawned worker processes that
+# receive the training data once; BayesianOptimization is driven through its
+# suggest/register interface so that a new point is proposed whenever a worker
+# becomes free. Results are cached per dataset hash in ml_model/noise_search.json.
+# Spawned workers import the main script again, so a script calling search_noise
+# must keep its work behind `if __name__ == "__main__":` (as thick2d does).
+
+import os
+import json
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+import multiprocessing
+
+
+noise_search_name = "noise_search.json"
+
+pbounds = {
+    'noise_amount': (0.01, 0.10),
+    'nodes': (50, 400)
+}
+
+_worker_data = None
+
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+
+def build_noise_model(input_dim, output_dim, n_layers, nodes, noise_amount, activation='relu', optimizer='adam', loss='mae'):
+    from tensorflow import keras
+    from tensorflow.keras import layers
+    from tensorflow.keras.layers import GaussianNoise
+
+    model_noise = keras.Sequential()
+
+    # Input layer with added Gaussian Noise
+    model_noise.add(keras.Input(shape=(input_dim,)))
+    model_noise.add(GaussianNoise(noise_amount))
+
+    # Hidden layers
+    for _ in range(n_layers):
+        model_noise.add(layers.Dense(int(nodes), activation=activation))
+
+    # Output layer
+    model_noise.add(layers.Dense(output_dim))
+
+    model_noise.compile(optimizer=optimizer, loss=loss, metrics=['mse'])
+    return model_noise
+
+
+
+def _init_worker(data, threads):
+    global _worker_data
+    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+    import tensorflow as tf
+
+    tf.get_logger().setLevel('ERROR')
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+    _worker_data = data
+
+
+
+def run_trial(params, settings):
+    """Train one trial network and return its best validation loss."""
+    from tensorflow.keras.callbacks import EarlyStopping
+
+    X_train, y_train, X_val, y_val = _worker_data
+    output_dim = 1 if np.ndim(y_train) == 1 else np.shape(y_train)[1]
+    model = build_noise_model(X_train.shape[1], output_dim, settings['n_layers'], params['nodes'],
+                              params['noise_amount'], activation=settings['activation'],
+                              optimizer=settings['optimizer'], loss=settings['loss'])
+    es = EarlyStopping(monitor='val_loss', patience=settings['patience'], restore_best_weights=True)
+    history = model.fit(X_train, y_train, validation_data=(X_val, y_val), epochs=settings['epochs'],
+                        batch_size=settings['batch_size'], callbacks=[es], verbose=0)
+    return float(np.min(history.history['val_loss']))
+
+
+
+def _suggest(optimizer):
+    try:
+        return optimizer.suggest()
+    except TypeError:  # bayesian-optimization < 2
+        from bayes_opt import UtilityFunction
+        return optimizer.suggest(UtilityFunction(kind="ucb", kappa=2.5, xi=0.0))
+
+
+
+def _random_point(rng):
+    return {name: float(rng.uniform(low, high)) for name, (low, high) in pbounds.items()}
+
+
+
+def _is_pending(point, pending):
+    return any(abs(point['nodes'] - p['nodes']) < 1 and abs(point['noise_amount'] - p['noise_amount']) < 1e-4
+               for p in pending)
+
+
+
+def search_noise(X_train, y_train, X_val, y_val, n_layers, n_trials=12, init_points=4, epochs=100, patience=10,
+                 batch_size=256, workers=None, activation='relu', optimizer='adam', loss='mae',
+                 cache_path=None, dataset_key=None, random_state=1):
+    """
+    Search the GaussianNoise amount and the layer width with a fixed trial budget.
+
+    Args:
+    - X_train, y_train, X_val, y_val (np.ndarray): Training and validation data of the trials.
+    - n_layers (int): Number of hidden layers of the trial networks.
+    - n_trials (int): Total number of trials (including init_points random ones).
+    - init_points (int): Random trials before the Gaussian-process suggestions.
+    - epochs (int): Maximum epochs per trial.
+    - patience (int): Early-stopping patience of each trial.
+    - batch_size (int): Batch size of the trials.
+    - workers (int or None): Parallel trials; defaults to the available cores (at most 4).
+    - cache_path (str or None): JSON file with results per dataset_key.
+    - dataset_key (str or None): Hash of the training data; no caching when None.
+
+    Returns:
+    - (float, int): Best noise amount and number of nodes per layer.
+    """
+    from bayes_opt import BayesianOptimization
+
+    cache = {}
+    if dataset_key:
+        dataset_key = f"{dataset_key}:layers={n_layers}:trials={n_trials}:epochs={epochs}"
+    if cache_path and dataset_key:
+        try:
+            with open(cache_path, "r") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+        if dataset_key in cache:
+            best = cache[dataset_key]
+            print(f"Using cached noise search: noise {best['noise_amount']:.4f}, nodes {best['nodes']}")
+            return best['noise_amount'], best['nodes']
+
+    settings = {'n_layers': n_layers, 'epochs': int(epochs), 'patience': int(patience), 'batch_size': int(batch_size),
+                'activation': activation, 'optimizer': optimizer, 'loss': loss}
+    cores = available_cores()
+    workers = max(1, min(workers or min(cores, 4), n_trials))
+    data = (np.asarray(X_train, dtype=np.float32), np.asarray(y_train, dtype=np.float32),
+            np.asarray(X_val, dtype=np.float32), np.asarray(y_val, dtype=np.float32))
+
+    bayes = BayesianOptimization(f=None, pbounds=pbounds, random_state=random_state, allow_duplicate_points=True, verbose=0)
+    rng = np.random.RandomState(random_state)
+
+    def next_point(pending):
+        if len(bayes.space) + len(pending) < init_points:
+            return _random_point(rng)
+        point = dict(_suggest(bayes))
+        # The GP does not know about running trials; avoid proposing the same point twice
+        return _random_point(rng) if _is_pending(point, pending) else point
+
+    def record(point, val_loss):
+        # BayesianOptimization maximizes, the validation loss is minimized
+        bayes.register(params=point, target=-val_loss)
+        print(f"Noise trial {len(bayes.space)}/{n_trials}: noise {point['noise_amount']:.4f}, "
+              f"nodes {int(point['nodes'])}, val_loss {val_loss:.4f}")
+
+    if workers == 1:
+        _init_worker(data, None)
+        for _ in range(n_trials):
+            point = next_point([])
+            record(point, run_trial({**point, 'nodes': int(point['nodes'])}, settings))
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(data, max(1, cores // workers))) as pool:
+            running = {}
+            submitted = 0
+            while submitted < n_trials or running:
+                while submitted < n_trials and len(running) < workers:
+                    point = next_point(list(running.values()))
+                    running[pool.submit(run_trial, {**point, 'nodes': int(point['nodes'])}, settings)] = point
+                    submitted += 1
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    record(running.pop(future), future.result())
+
+    best_params = bayes.max['params']
+    best_noise, best_nodes = float(best_params['noise_amount']), int(best_params['nodes'])
+
+    if cache_path and dataset_key:
+        cache[dataset_key] = {'noise_amount': best_noise, 'nodes': best_nodes, 'val_loss': -float(bayes.max['target']),
+                              'n_trials': n_trials, 'epochs': int(epochs)}
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        with open(cache_path, "w") as f:
+            json.dump(cache, f, indent=2)
+
+    return best_noise, best_nodes
@@ -13,6 +13,7 @@
 """ 
 
 import os
+import glob
 import shutil
 import numpy as np
 import copy
@@ -26,11 +27,29 @@ from ase.geometry import cell_to_cellpar, cellpar_to_cell
 from ase.spacegroup import get_spacegroup, crystal
 from pathlib import Path
 import json
-from read_write import read_options_from_input,write_incar, read_incars, read_and_write_kpoints,load_structure,modify_incar_and_restart
+from thick2d_read_write import read_options_from_input,write_incar, read_incars, read_and_write_kpoints,load_structure,modify_incar_and_restart
+from dft_setup import kpoint_mesh, detect_cores, vasp_parallel_settings, qe_parallel_flags, add_qe_parallel_flags
+from relaxed_cache import RelaxedStructureCache, settings_tag, default_relaxed_cache
+from cost_model import mark_reused_relaxation
 
 
 
 options = read_options_from_input()
+# native: one DFT job relaxes the structure itself (IBRION/NSW in INCARs, vc-relax in QE)
+# ase: the DFT code is driven step by step by ASE LBFGS (legacy)
+relax_mode = options.get("custom_options", {}).get("relax_mode", "native").lower()
+# k-point spacing in 1/Å (2π included) for an automatic mesh; unset or 0 uses the KPOINTS-sd mesh
+kspacing = float(options.get("custom_options", {}).get("kspacing", 0))
+# MPI ranks of a DFT job for NPAR/KPAR (-nk/-nd); auto reads job_submit_command or the environment
+ncores = options.get("custom_options", {}).get("ncores", "auto").lower()
+# reuse: keep WAVECAR/CHGCAR (QE outdir) while relaxing, restart from them, delete them once converged
+# keep: as reuse, without the cleanup; off: every DFT run starts from scratch as set in INCARs
+dft_restart = options.get("custom_options", {}).get("dft_restart", "reuse").lower()
+# Directory of relaxed structures shared between folders and projects (off disables it)
+relaxed_cache = options.get("custom_options", {}).get("relaxed_cache", default_relaxed_cache)
+# Job directory (thick2d imports this module there); runs that reuse an earlier relaxation are marked
+# in it so that their runtime does not enter the DFT cost model of executors.py
+job_directory = os.getcwd()
     
 def remove_spurious_distortion(pos):
     # Normalize and orthogonalize the cell vectors
@@ -150,6 +169,151 @@ def string_to_tupleold(s):
     return tuple(result)
     
 
+def vasp_sort_order(atoms):
+    """Atom order of the POSCAR written by the ASE Vasp calculator (grouped by species in order of appearance)."""
+    symbols = atoms.get_chemical_symbols()
+    species = sorted(set(symbols), key=symbols.index)
+    return [i for symbol in species for i, s in enumerate(symbols) if s == symbol]
+
+
+
+def update_from_contcar(atoms, contcar_atoms):
+    """Copy the cell and positions of a CONTCAR (species-sorted) onto `atoms` in its own atom order."""
+    positions = np.empty_like(contcar_atoms.positions)
+    positions[vasp_sort_order(atoms)] = contcar_atoms.positions
+    atoms.set_cell(contcar_atoms.get_cell())
+    atoms.set_positions(positions)
+    return atoms
+
+
+
+def same_composition(atoms, other):
+    return sorted(atoms.get_chemical_symbols()) == sorted(other.get_chemical_symbols())
+
+
+
+def vasp_restart_settings(calculator_settings):
+    """
+    Calculator settings that write WAVECAR/CHGCAR and let VASP restart from them
+    (ISTART/ICHARG left to VASP: WAVECAR is read whenever it exists).
+    """
+    settings = dict(calculator_settings)
+    if dft_restart == "off":
+        return settings
+    settings.pop('istart', None)
+    settings.pop('icharg', None)
+    settings['lwave'] = True
+    settings['lcharg'] = True
+    return settings
+
+
+
+def cleanup_restart_files(paths):
+    """Delete the restart files of a converged relaxation (dft_restart = reuse)."""
+    if dft_restart != "reuse":
+        return
+    for path in paths:
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        elif os.path.isfile(path):
+            os.remove(path)
+
+
+
+def relaxed_structure_cache():
+    if relaxed_cache.lower() in ("off", "none", "false", ""):
+        return None
+    return RelaxedStructureCache(os.path.abspath(os.path.expanduser(relaxed_cache)))
+
+
+
+def lookup_relaxed_structure(atoms, tag):
+    """Relaxed structure of an equivalent structure relaxed with the same settings before, or None."""
+    cache = relaxed_structure_cache()
+    if cache is None:
+        return None
+    try:
+        return cache.lookup(atoms, tag)
+    except Exception as e:
+        print(f"Relaxed-structure cache not used: {e}")
+        return None
+
+
+
+def store_relaxed_structure(atoms, relaxed, tag):
+    cache = relaxed_structure_cache()
+    if cache is None:
+        return
+    try:
+        cache.store(atoms, relaxed, tag, source=os.getcwd(), structure_file=options.get("structure_file"))
+    except Exception as e:
+        print(f"Relaxed structure not added to the relaxed-structure cache: {e}")
+
+
+
+def vasp_relaxation_converged(outcar_file="OUTCAR"):
+    if not os.path.isfile(outcar_file):
+        return False
+    with open(outcar_file, "r") as f:
+        return "reached required accuracy" in f.read()
+
+
+
+def run_native_relaxation_vasp(atoms, calculator_settings, max_retries=5):
+    """
+    Relax the structure with a single VASP job (relax_mode = native).
+
+    VASP relaxes ions and cell itself with the IBRION/ISIF/NSW of the INCARs,
+    so no outer ASE optimizer is needed. The relaxed geometry is read from
+    CONTCAR into `atoms`. A job that fails or runs out of ionic steps is
+    resubmitted from its CONTCAR with EDIFF reduced tenfold. Unless
+    dft_restart = off, WAVECAR/CHGCAR are kept between the jobs, an interrupted
+    relaxation in the same directory resumes from its CONTCAR, and the files
+    are removed after convergence.
+
+    Parameters:
+    - atoms (Atoms): Structure to relax; updated in place.
+    - calculator_settings (dict): Keyword arguments of the ASE Vasp calculator.
+    - max_retries (int): Resubmissions of an unconverged relaxation.
+
+    Returns:
+    - Atoms: The relaxed structure.
+    """
+    settings = vasp_restart_settings(calculator_settings)
+    settings.setdefault('ibrion', 2)
+    if int(settings.get('nsw', 0)) <= 0:
+        settings['nsw'] = 300
+
+    if dft_restart != "off" and os.path.isfile("CONTCAR") and os.path.getsize("CONTCAR") > 0:
+        previous = read("CONTCAR", format="vasp")
+        if same_composition(atoms, previous):
+            print("Resuming the relaxation from CONTCAR" + (" and WAVECAR" if os.path.isfile("WAVECAR") else ""))
+            update_from_contcar(atoms, previous)
+            mark_reused_relaxation(job_directory, "resumed from CONTCAR")
+
+    for retry_count in range(max_retries + 1):
+        atoms.calc = Vasp(**settings)
+        try:
+            atoms.get_potential_energy()
+        except Exception as e:
+            print(f"Caught an exception: {e}")
+        if os.path.isfile("CONTCAR") and os.path.getsize("CONTCAR") > 0:
+            update_from_contcar(atoms, read("CONTCAR", format="vasp"))
+
+        if vasp_relaxation_converged():
+            print("DFT Optimization Done!")
+            cleanup_restart_files(["WAVECAR", "CHGCAR", "CHG"])
+            return atoms
+
+        if retry_count < max_retries:
+            settings['ediff'] = float(settings.get('ediff', 1e-6)) / 10
+            print(f"Relaxation not converged; restarting from CONTCAR with EDIFF = {settings['ediff']}")
+
+    print("Maximum number of retries reached. Exiting.")
+    return atoms
+
+
+
 def check_vasp_optimization_completed(atoms, mode="DFT", output_dir="OPT"):
     """
     Checks if the VASP optimization has already been completed.
@@ -174,10 +338,10 @@ def check_vasp_optimization_completed(atoms, mode="DFT", output_dir="OPT"):
             content = f.read()
             if "reached required accuracy " in content:
                 optimized_atoms = read(contcar_file)
-                if set(atoms.get_chemical_symbols()) == set(optimized_atoms.get_chemical_symbols()):
+                if sorted(atoms.get_chemical_symbols()) == sorted(optimized_atoms.get_chemical_symbols()):
                     print("DFT Optimization already completed. Skipping...")
                     optimized = True
-                    write(os.path.join(output_dir, "CONTCAR"), atoms, format='vasp', direct=True)
+                    update_from_contcar(atoms, optimized_atoms)
                 else:
                     print("Structures in CONTCAR and initial atoms object do not match. Proceeding with optimization...")
 
@@ -302,6 +466,84 @@ def merge_qe_parameters(existing_params, new_step_data):
     return existing_params
     
 
+def qe_relaxation_converged(output_file="espresso.pwo"):
+    if not os.path.isfile(output_file):
+        return False
+    with open(output_file, "r") as f:
+        content = f.read()
+    return "End final coordinates" in content or "Final enthalpy" in content
+
+
+
+def run_native_relaxation_qe(atoms, qe_parameters, max_retries=5):
+    """
+    Relax the structure with a single pw.x relax/vc-relax run (relax_mode = native).
+
+    The final geometry is parsed from espresso.pwo into `atoms`. A run that
+    fails or does not converge is resubmitted from its last geometry; unless
+    dft_restart = off it continues with restart_mode = 'restart' from the
+    outdir, whose files are removed after convergence.
+
+    Parameters:
+    - atoms (Atoms): Structure to relax; updated in place.
+    - qe_parameters (dict): Keyword arguments of the ASE Espresso calculator.
+    - max_retries (int): Resubmissions of an unconverged relaxation.
+
+    Returns:
+    - Atoms: The relaxed structure.
+    """
+    control = qe_parameters['input_data'].setdefault('control', {})
+    if control.get('calculation') not in ('relax', 'vc-relax'):
+        control['calculation'] = 'vc-relax'
+    prefix = control.get('prefix', 'pwscf')
+    outdir = control.get('outdir', './')
+
+    if dft_restart != "off" and os.path.isfile("espresso.pwo"):
+        try:
+            previous = read("espresso.pwo", index=-1, format="espresso-out")
+            if same_composition(atoms, previous):
+                print("Resuming the relaxation from espresso.pwo")
+                atoms.set_cell(previous.get_cell())
+                atoms.set_positions(previous.get_positions())
+                mark_reused_relaxation(job_directory, "resumed from espresso.pwo")
+        except Exception:
+            pass
+
+    restart = dft_restart != "off" and os.path.isdir(os.path.join(outdir, prefix + '.save'))
+    if restart:
+        mark_reused_relaxation(job_directory, "restarted from " + os.path.join(outdir, prefix + '.save'))
+    for retry_count in range(max_retries + 1):
+        control['restart_mode'] = 'restart' if restart else 'from_scratch'
+        atoms.calc = Espresso(**qe_parameters)
+        try:
+            atoms.get_potential_energy()
+        except Exception as e:
+            print(f"Caught an exception: {e}")
+            # A failed restart is not retried as a restart
+            restart = not restart and dft_restart != "off" and os.path.isdir(os.path.join(outdir, prefix + '.save'))
+        else:
+            restart = dft_restart != "off" and os.path.isdir(os.path.join(outdir, prefix + '.save'))
+        try:
+            final = read("espresso.pwo", index=-1, format="espresso-out")
+            atoms.set_cell(final.get_cell())
+            atoms.set_positions(final.get_positions())
+        except Exception:
+            pass
+
+        if qe_relaxation_converged():
+            print("DFT Optimization Done!")
+            control['restart_mode'] = 'from_scratch'
+            cleanup_restart_files(glob.glob(os.path.join(outdir, prefix + '.*')))
+            return atoms
+
+        if retry_count < max_retries:
+            print("Relaxation not converged; restarting from the last geometry.")
+
+    print("Maximum number of retries reached. Exiting.")
+    return atoms
+
+
+
 def run_calculation_qe(atoms, qe_parameters, fmax=0.02, max_retries=5, retry_count=0):
     try:
         if atoms.get_calculator() is None:
@@ -328,6 +570,17 @@ def run_calculation_qe(atoms, qe_parameters, fmax=0.02, max_retries=5, retry_cou
     
 
 
+def dft_kpoints(atoms):
+    """k-point mesh of the relaxation: from kspacing, or the 'Static Calculation' mesh of KPOINTS-sd."""
+    if kspacing <= 0:
+        kpts, _ = read_and_write_kpoints('static', fileName="KPOINTS-sd", outputDirectory='OPT')
+        return kpts
+    kpts = kpoint_mesh(atoms, kspacing)
+    print(f"Using a {'x'.join(map(str, kpts))} k-point mesh (k-spacing {kspacing} 1/Å)")
+    return kpts
+
+
+
 struct = options.get("structure_file")
 atoms = load_structure(struct)
 atoms = remove_spurious_distortion(atoms)
@@ -352,22 +605,46 @@ def optimize_structure_vasp(mode="DFT"):
         
     cwd = os.getcwd()
     write_incar('opt', cwd, output_dir='OPT')
-    kpts, _ = read_and_write_kpoints('static', fileName="KPOINTS-sd", outputDirectory='OPT')
+    kpts = dft_kpoints(atoms)
     incar_settings = read_incars("opt", "INCAR", "OPT")
+    if kspacing > 0:
+        incar_settings['gamma'] = True
+    cores = detect_cores(options.get("job_submit_command"), ncores)
+    if cores:
+        incar_settings.update(vasp_parallel_settings(cores, kpts))
+        print(f"VASP parallelization for {cores} ranks: KPAR = {incar_settings['kpar']}, NPAR = {incar_settings['npar']}")
     atoms.set_calculator(Vasp(xc='PBE', kpts=kpts, **incar_settings))
 
 
     # Perform structure optimization
+    initial_atoms = atoms.copy()
+    cache_tag = settings_tag("VASP", {'xc': 'PBE', 'kpts': kpts, **incar_settings})
     optimized = check_vasp_optimization_completed(atoms)
+    cached_atoms = None if optimized else lookup_relaxed_structure(initial_atoms, cache_tag)
+    if optimized:
+        mark_reused_relaxation(job_directory, "completed relaxation in OPT")
+    elif cached_atoms is not None:
+        mark_reused_relaxation(job_directory, "relaxed-structure cache")
+    optimized = optimized or cached_atoms is not None
     with ChangeDir("OPT"):
         atoms.set_calculator(Vasp(xc='PBE', kpts=kpts, **incar_settings))
         calculator_settings = {'xc': 'PBE', 'kpts': kpts, **incar_settings}
 
         if not optimized: #and not use_saved_data:        
-            run_calculation_vasp(atoms,calculator_settings)
+            if relax_mode == "ase":
+                # Each LBFGS step is a VASP run; with WAVECAR kept the next step starts from it
+                calculator_settings = vasp_restart_settings(calculator_settings)
+                atoms.set_calculator(Vasp(**calculator_settings))
+                run_calculation_vasp(atoms,calculator_settings)
+                cleanup_restart_files(["WAVECAR", "CHGCAR", "CHG"])
+            else:
+                run_native_relaxation_vasp(atoms, calculator_settings)
             optimized = True
-      
-    optimized_atoms = Atoms(symbols=atoms.get_chemical_symbols(), positions=atoms.get_positions(), cell=atoms.get_cell(), pbc=True)
+        if cached_atoms is None and vasp_relaxation_converged():
+            store_relaxed_structure(initial_atoms, atoms, cache_tag)
+
+    relaxed_atoms = atoms if cached_atoms is None else cached_atoms
+    optimized_atoms = Atoms(symbols=relaxed_atoms.get_chemical_symbols(), positions=relaxed_atoms.get_positions(), cell=relaxed_atoms.get_cell(), pbc=True)
     structure_file = "OPT/optimized_structure.cif"
     write(structure_file, optimized_atoms)
     return optimized_atoms
@@ -394,7 +671,12 @@ def optimize_structure_qe(mode="DFT"):
     pseudopotentials = find_qe_pseudopotentials(atoms, base_path=base_path)
 
     optimized = check_optimization_completed_qe(atoms)
-    kpts, _ = read_and_write_kpoints('static', fileName="KPOINTS-sd", outputDirectory='OPT')
+    kpts = dft_kpoints(atoms)
+    qe_command = os.environ.get("ASE_ESPRESSO_COMMAND")
+    cores = detect_cores(qe_command or options.get("job_submit_command"), ncores)
+    if cores and qe_command:
+        os.environ["ASE_ESPRESSO_COMMAND"] = add_qe_parallel_flags(qe_command, qe_parallel_flags(cores, kpts))
+        print(f"pw.x command: {os.environ['ASE_ESPRESSO_COMMAND']}")
     #kpts = [2, 2, 1]
     
     qe_parameters = {
@@ -433,16 +715,31 @@ def optimize_structure_qe(mode="DFT"):
 
     with ChangeDir("OPT"):
         qe_parameters = update_qe_object("DFT Optimization", qe_parameters)
+        cache_tag = settings_tag("QE", qe_parameters)
         atoms.set_calculator(Espresso(**qe_parameters))
         calculator_settings = qe_parameters
         optimized_atoms = atoms.copy()
+        cached_atoms = None if optimized else lookup_relaxed_structure(atoms, cache_tag)
+        if optimized:
+            mark_reused_relaxation(job_directory, "completed relaxation in OPT")
+        elif cached_atoms is not None:
+            mark_reused_relaxation(job_directory, "relaxed-structure cache")
         
                 
-        if not optimized: #and not use_saved_data:        
-            run_calculation_qe(optimized_atoms,calculator_settings)
+        if cached_atoms is not None:
+            optimized_atoms = cached_atoms
+        elif not optimized: #and not use_saved_data:        
+            if relax_mode == "ase":
+                run_calculation_qe(optimized_atoms,calculator_settings)
+            else:
+                run_native_relaxation_qe(optimized_atoms, calculator_settings)
             optimized = True
+        elif os.path.isfile("optimized_structure.cif"):
+            optimized_atoms = read("optimized_structure.cif")
+        if cached_atoms is None and qe_relaxation_converged():
+            store_relaxed_structure(atoms, optimized_atoms, cache_tag)
 
-    optimized_atoms = Atoms(symbols=atoms.get_chemical_symbols(), positions=atoms.get_positions(), cell=atoms.get_cell(), pbc=True)
+    optimized_atoms = Atoms(symbols=optimized_atoms.get_chemical_symbols(), positions=optimized_atoms.get_positions(), cell=optimized_atoms.get_cell(), pbc=True)
     structure_file = "OPT/optimized_structure.cif"
     write(structure_file, optimized_atoms)
     return optimized_atoms
@@ -13,6 +13,7 @@
 
 """ 
 import os
+import time
 import pandas as pd
 import numpy as np
 import joblib
@@ -20,8 +21,17 @@ from ase import Atoms
 import re
 from math import gcd
 import periodictable
-from read_write import read_options_from_input
-from sklearn.model_selection import train_test_split, ShuffleSplit, cross_val_score
+from thick2d_read_write import read_options_from_input
+from model_export import (export_inference_model, remove_exported_model, save_feature_schema, load_feature_schema,
+                          load_exported_model, CompiledFeatureSchema, simplify_formula, stack_thickness)
+from hyperparameter_tuning import tune_models, dataset_digest, tuned_hyperparameters_name
+from noise_search import search_noise, build_noise_model, noise_search_name
+from thickness_store import ThicknessStore
+from reference_data import load_reference_dataset, read_manifest
+from ensemble import ThicknessEnsemble, ensemble_model_name
+from instrumentation import stage
+from sklearn.model_selection import train_test_split, ShuffleSplit, GroupShuffleSplit, cross_val_score
+from sklearn.base import BaseEstimator, RegressorMixin, clone
 from sklearn.ensemble import RandomForestRegressor, ExtraTreesRegressor, GradientBoostingRegressor, AdaBoostRegressor
 from sklearn.tree import DecisionTreeRegressor, ExtraTreeRegressor
 from sklearn.metrics import mean_squared_error, mean_absolute_error
@@ -36,22 +46,43 @@ from numpy import cross, linalg
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2' 
 os.environ['TF_ENABLE_ONEDNN_OPTS'] = '0'
 
-from tensorflow.keras.models import load_model
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras import layers, initializers, regularizers  # <-- Added regularizers
-from tensorflow.keras.layers import Dropout, BatchNormalization, GaussianNoise,Activation  # <-- Added Dropout and BatchNormalization
-from tensorflow.keras.callbacks import ReduceLROnPlateau, EarlyStopping, ModelCheckpoint
 from sklearn.metrics import r2_score
 from sklearn.model_selection import RandomizedSearchCV,GridSearchCV
 from bayes_opt import BayesianOptimization
-from tensorflow.keras.optimizers import Adam,Adadelta, RMSprop, Adagrad, SGD, Nadam
-from tensorflow.keras.callbacks import LearningRateScheduler 
 
+# TensorFlow is imported on first use (import_tensorflow) so that predictions
+# from exported NumPy/ONNX models never load it.
+tf = None
 
 
-#Suppress some tf warnings
-tf.get_logger().setLevel('ERROR')
+def import_tensorflow():
+    global tf, keras, load_model, layers, initializers, regularizers
+    global Dropout, BatchNormalization, GaussianNoise, Activation
+    global ReduceLROnPlateau, EarlyStopping, ModelCheckpoint, LearningRateScheduler
+    global Adam, Adadelta, RMSprop, Adagrad, SGD, Nadam
+    if tf is not None:
+        return
+
+    from tensorflow.keras.models import load_model
+    import tensorflow
+    from tensorflow import keras
+    from tensorflow.keras import layers, initializers, regularizers  # <-- Added regularizers
+    from tensorflow.keras.layers import Dropout, BatchNormalization, GaussianNoise,Activation  # <-- Added Dropout and BatchNormalization
+    from tensorflow.keras.callbacks import ReduceLROnPlateau, EarlyStopping, ModelCheckpoint
+    from tensorflow.keras.optimizers import Adam,Adadelta, RMSprop, Adagrad, SGD, Nadam
+    from tensorflow.keras.callbacks import LearningRateScheduler 
+
+    #Suppress some tf warnings
+    tensorflow.get_logger().setLevel('ERROR')
+
+    # Thread pools can only be sized before the TF runtime starts (0 keeps the TF default)
+    if tf_intra_op_threads > 0:
+        tensorflow.config.threading.set_intra_op_parallelism_threads(tf_intra_op_threads)
+    if tf_inter_op_threads > 0:
+        tensorflow.config.threading.set_inter_op_parallelism_threads(tf_inter_op_threads)
+    if xla_jit:
+        tensorflow.config.optimizer.set_jit(True)
+    tf = tensorflow
 
 
 
@@ -65,7 +96,26 @@ vdwgap = options.get("vdwgap",3.5)
 use_ml_model = options.get("use_ml_model",False)
 num_augmented_samples = int(options.get("num_augmented_samples", 50))
 add_thickness_data = options.get("add_thickness_data",False)
+export_model = options.get("export_model",True)
+model_selection = options.get("custom_options", {}).get("model_selection", "full").lower()
+cv_mode = options.get("custom_options", {}).get("cv_mode", "shuffle").lower()
+tune_hyperparameters = options.get("tune_hyperparameters",False)
+tuning_candidates = int(options.get("custom_options", {}).get("tuning_candidates", 20))
+optimize_noise = options.get("optimize_noise",False)
+noise_search_trials = int(options.get("custom_options", {}).get("noise_search_trials", 12))
+noise_search_epochs = int(options.get("custom_options", {}).get("noise_search_epochs", 100))
+noise_search_workers = int(options.get("custom_options", {}).get("noise_search_workers", 0)) or None
+dnn_epochs = int(options.get("custom_options", {}).get("dnn_epochs", 1000))
+dnn_batch_size = options.get("custom_options", {}).get("dnn_batch_size", "64").lower()
+dnn_patience = int(options.get("custom_options", {}).get("dnn_patience", 25))
+dnn_lr_schedule = options.get("custom_options", {}).get("dnn_lr_schedule", "plateau").lower()
+tf_intra_op_threads = int(options.get("custom_options", {}).get("tf_intra_op_threads", 0))
+tf_inter_op_threads = int(options.get("custom_options", {}).get("tf_inter_op_threads", 0))
+xla_jit = options.get("custom_options", {}).get("xla_jit", "false").lower() in ['true', 'yes', '1', 'on']
 user_data_path = os.path.join(os.getcwd(), 'mat_thickness.txt')
+thickness_store_path = options.get("custom_options", {}).get("thickness_store", os.path.join(os.getcwd(), 'mat_thickness.db'))
+reference_dataset_path = options.get("custom_options", {}).get("reference_dataset")
+ensemble_size = int(options.get("custom_options", {}).get("ensemble_size", 1))
 
 
 if add_thickness_data:
@@ -76,18 +126,79 @@ if add_thickness_data:
 rndseem=101
 test_size = 0.20
 
-def predict_thickness_2D(atoms, dir_modeldsave,num_augmented_samples):
-    # Load the existing data
-    existing_data = load_thickness()
-    if add_thickness_data:
-        user_thickness_data = load_user_thickness_data(user_data_path)
-        existing_data = augment_and_average_thickness_data(existing_data, user_thickness_data)
+def predict_thickness_2D(atoms, dir_modeldsave,num_augmented_samples, return_spread=False):
+    """
+    Predict the thickness of a 2D material.
+
+    `atoms` is either an ASE Atoms object or a Hill formula string (as returned
+    by structure_io.hill_formula) for composition-only runs, or a list of
+    formulas, which are featurized and predicted together (one model load for
+    a whole multi-structure input). With return_spread=True a (thickness,
+    spread) pair is returned; the spread is None unless ensemble mode
+    (ensemble_size > 1) is on (see ensemble.py).
+    """
+    # Get the chemical formula of the new data points
+    if isinstance(atoms, (list, tuple)):
+        chem_formulas = list(atoms)
+    elif isinstance(atoms, str):
+        chem_formulas = [atoms]
+    else:
+        chem_formulas = [atoms.get_chemical_formula(mode='hill', empirical=False)]
+    chem_formulas = [simplify_formula(formula) for formula in chem_formulas]
+    box_width = 85 
 
+    # A saved model trained on another version of the reference data is retrained
+    use_saved_model = use_ml_model
+    reference_sha256 = read_manifest(reference_dataset_path)["sha256"]
+    feature_schema = load_feature_schema(dir_modeldsave) if use_ml_model else None
+    if feature_schema is not None and feature_schema.get("dataset_sha256", reference_sha256) != reference_sha256:
+        print("The reference thickness data changed since the saved model was trained; retraining ...")
+        use_saved_model = False
+
+    h5_model_path = os.path.join(dir_modeldsave, 'best_thickness_model.keras')
+    pkl_model_path = os.path.join(dir_modeldsave, 'best_thickness_model.pkl')
+    ensemble_path = os.path.join(dir_modeldsave, ensemble_model_name)
+    use_ensemble = model_type == "classic" and ensemble_size > 1
+
+    # A saved ensemble only needs the compiled feature schema, not the training data
+    if use_saved_model and use_ensemble and feature_schema is not None and os.path.exists(ensemble_path):
+        X_scaled_single = CompiledFeatureSchema(feature_schema).transform(chem_formulas)
+        if X_scaled_single is not None:
+            with stage("predict/load_model", path=ensemble_path):
+                model = joblib.load(ensemble_path)
+            if len(model) >= ensemble_size:
+                print(f"Using saved ensemble of {', '.join(model.names)} to predict thickness.")
+                with stage("predict/model_predict", model="ThicknessEnsemble"):
+                    predictions, spread = model.predict_with_spread(X_scaled_single)
+                return layered_thickness(predictions, spread, return_spread)
+
+    # An exported model plus its feature schema needs neither the training data nor joblib/keras
+    exported_model = None
+    if use_saved_model and export_model and not use_ensemble:
+        exported_model = load_exported_model(dir_modeldsave, model_type)
+        if exported_model is not None and feature_schema is not None:
+            print(f"Using exported {exported_model.manifest['algorithm']} model to predict thickness.")
+            with stage("predict/featurize_structure"):
+                X_scaled_single = CompiledFeatureSchema(feature_schema).transform(chem_formulas)
+                if X_scaled_single is None:
+                    processed_single_data = process_dataframe(pd.DataFrame(chem_formulas, columns=['MaterialName']))
+                    X_scaled_single = scale_with_feature_schema(processed_single_data, feature_schema)
+            with stage("predict/model_predict", model=exported_model.manifest['algorithm']):
+                predictions = exported_model.predict(X_scaled_single)
+            return layered_thickness(predictions, None, return_spread)
+
+    # Load the existing data
+    with stage("predict/load_training_data") as record:
+        reference = load_reference_dataset(reference_dataset_path)
+        existing_data = reference.table
+        cached_features = reference.features if list(reference.columns) == feature_labels() else None
+        if add_thickness_data:
+            user_thickness_data, user_features = load_user_thickness_store(user_data_path, thickness_store_path)
+            existing_data = augment_and_average_thickness_data(existing_data, user_thickness_data)
+            cached_features = merge_cached_features(cached_features, user_features)
+        record["rows"] = len(existing_data)
+        record["dataset_sha256"] = reference.sha256
 
-    # Get the chemical formula of the new data point
-    chem_formula = atoms.get_chemical_formula(mode='hill', empirical=False)
-    chem_formula = simplify_formula(chem_formula)
-    box_width = 85 
     # Check if the material already exists in the existing data
     #if chem_formula in existing_data['MaterialName'].values:
     #    existing_thickness = existing_data[existing_data['MaterialName'] == chem_formula]['Thickness_Ang'].iloc[0]
@@ -96,74 +207,85 @@ def predict_thickness_2D(atoms, dir_modeldsave,num_augmented_samples):
 
     
     # Process and scale the existing data for training
-    processed_existing_data = process_dataframe(existing_data)
-    X_scaled_existing, y_existing, scaler, train_columns = scale_dataframe(processed_existing_data)
+    with stage("predict/featurize_training", profile=True):
+        processed_existing_data = process_dataframe(existing_data, cached_features=cached_features)
+    with stage("predict/scale_training"):
+        X_scaled_existing, y_existing, scaler, train_columns = scale_dataframe(processed_existing_data)
 
     #joblib.dump(scaler, 'scaler.save')  # Save the scaler
     #joblib.dump(train_columns, 'train_columns.save')
 
 
-    h5_model_path = os.path.join(dir_modeldsave, 'best_thickness_model.keras')
-    pkl_model_path = os.path.join(dir_modeldsave, 'best_thickness_model.pkl')
-
     model = None
-    if use_ml_model:
+    if use_saved_model:
         model_loaded = False  # Flag to check if the model is loaded
 
         if model_type =="dnn" and os.path.exists(h5_model_path):    
-            model = load_model(h5_model_path)
+            with stage("predict/load_model", path=h5_model_path):
+                import_tensorflow()
+                model = load_model(h5_model_path)
             print("Using saved DNN model to predict thickness.")
             model_loaded = True
-        elif model_type == "classic" and os.path.exists(pkl_model_path):
-            model = joblib.load(pkl_model_path)
+        elif use_ensemble and os.path.exists(ensemble_path):
+            with stage("predict/load_model", path=ensemble_path):
+                model = joblib.load(ensemble_path)
+            model_loaded = len(model) >= ensemble_size
+            if model_loaded:
+                print("Using saved ensemble model to predict thickness.")
+            else:
+                print(f"The saved ensemble has fewer than {ensemble_size} models, proceeding with full training...")
+        elif model_type == "classic" and not use_ensemble and os.path.exists(pkl_model_path):
+            with stage("predict/load_model", path=pkl_model_path):
+                model = joblib.load(pkl_model_path)
             print("Using saved non-DNN model to predict thickness.")
             model_loaded = True
         else:
             print("Pretrained model does not exist, proceeding with full training...")
 
+        if model_loaded and export_model and exported_model is None and not use_ensemble:
+            # Compile the saved model once so later runs can take the exported path
+            with stage("predict/export_model"):
+                export_inference_model(model, dir_modeldsave, model_type, len(train_columns))
+
         # If the model is not loaded due to absence of pre-trained models, train a new model
         if not model_loaded:
-            model_metrics, model = train_and_save_best_model(X_scaled_existing, y_existing, dir_modeldsave, num_augmented_samples, model_type)
+            with stage("train", profile=True, model_type=model_type):
+                model_metrics, model = train_and_save_best_model(X_scaled_existing, y_existing, dir_modeldsave, num_augmented_samples, model_type)
             print(f"Metrics of the trained models are:\n, {model_metrics}\n")
+        save_feature_schema(dir_modeldsave, scaler, train_columns, dataset_sha256=reference.sha256)
     else:
-        model_metrics, model = train_and_save_best_model(X_scaled_existing, y_existing, dir_modeldsave, num_augmented_samples, model_type)
+        with stage("train", profile=True, model_type=model_type):
+            model_metrics, model = train_and_save_best_model(X_scaled_existing, y_existing, dir_modeldsave, num_augmented_samples, model_type)
 
         print(f"Metrics of the trained models are:\n, {model_metrics}\n")
         print("Best model used in prediction")
+        save_feature_schema(dir_modeldsave, scaler, train_columns, dataset_sha256=reference.sha256)
 
-    processed_single_data = process_dataframe(pd.DataFrame([chem_formula], columns=['MaterialName']))
-    X_scaled_single, _, _, _ = scale_dataframe(processed_single_data, scaler=scaler, train_columns=train_columns)
+    with stage("predict/featurize_structure"):
+        processed_single_data = process_dataframe(pd.DataFrame(chem_formulas, columns=['MaterialName']))
+        X_scaled_single, _, _, _ = scale_dataframe(processed_single_data, scaler=scaler, train_columns=train_columns)
 
     
     if model_type =="dnn":
         X_scaled_single = X_scaled_single.to_numpy()
         
-    predictions = model.predict(X_scaled_single)
-    
-    if nlayers > 1:
-        predictions = vdwgap + predictions * nlayers
+    # A spread is only reported in ensemble mode, so every load path of a single model gives the same output
+    with stage("predict/model_predict", model=model.__class__.__name__):
+        if use_ensemble and isinstance(model, ThicknessEnsemble):
+            predictions, spread = model.predict_with_spread(X_scaled_single)
+        else:
+            predictions, spread = model.predict(X_scaled_single), None
 
     # Return the predictions
-    return predictions
+    return layered_thickness(predictions, spread, return_spread)
 
 
+def layered_thickness(predictions, spread=None, return_spread=False):
+    """Convert a monolayer thickness (and its spread) to that of an nlayers stack (see model_export.stack_thickness)."""
+    predictions, spread = stack_thickness(predictions, spread, nlayers, vdwgap)
+    return (predictions, spread) if return_spread else predictions
 
 
-def simplify_formula(formula):
-    # Parse the formula into elements and their counts
-    elements = re.findall('([A-Z][a-z]*)(\d*)', formula)
-    elements = {element: int(count) if count else 1 for element, count in elements}
-
-    # Find the greatest common divisor of the counts
-    common_divisor = gcd(*elements.values())
-
-    # Simplify the formula
-    simplified_formula = ''.join(f"{element}{(count // common_divisor) if count > common_divisor else ''}" 
-                                 for element, count in elements.items())
-    
-    return simplified_formula
-    
-    
 
 
 def process_dataframeold(data):
@@ -197,7 +319,8 @@ def process_dataframeold(data):
     
 
 
-def process_dataframe(data):
+def featurize_formulas(data):
+    """Composition features of each MaterialName (all featurizer columns, nothing dropped)."""
     data = pd.DataFrame(data)
     # Create Composition objects
     Comp = [Composition(value) for value in data["MaterialName"]]
@@ -208,10 +331,7 @@ def process_dataframe(data):
     vo = ValenceOrbital()
     data = ef.featurize_dataframe(data, 'Composition', ignore_errors=True)
     data = vo.featurize_dataframe(data, 'Composition', ignore_errors=True)
-    data = data.loc[:, (data != 0).any(axis=0)]
-    data = data.dropna(axis=1, how='all')  # Drop columns where all values are NaN
-    data = data.dropna()  # Drop rows where any value is NaN
-    
+
     # Define the molecular_weight function
     def molecular_weight(formula):
         try:
@@ -230,6 +350,55 @@ def process_dataframe(data):
 
     return data
 
+
+
+def feature_labels():
+    """Columns added by featurize_formulas, in order."""
+    return ElementFraction().feature_labels() + ValenceOrbital().feature_labels() + ['MolWeight']
+
+
+
+def merge_cached_features(*caches):
+    """Combine feature caches (DataFrames indexed by formula) with the current featurizer columns."""
+    caches = [c for c in caches if c is not None and list(c.columns) == feature_labels()]
+    if not caches:
+        return None
+    merged = pd.concat(caches)
+    return merged[~merged.index.duplicated()]
+
+
+
+def formula_features(formulas):
+    """Feature matrix (without MaterialName/Composition) of a list of formulas, for ThicknessStore."""
+    featurized = featurize_formulas(pd.DataFrame({"MaterialName": formulas}))
+    return featurized.drop(columns=["MaterialName", "Composition"])
+
+
+
+def process_dataframe(data, cached_features=None):
+    """
+    Featurize the MaterialName column and drop all-zero/all-NaN feature columns
+    and rows with missing features. Rows whose formula is in `cached_features`
+    (a DataFrame indexed by formula, see ThicknessStore.load) reuse those features.
+    """
+    data = pd.DataFrame(data)
+    if cached_features is not None and len(cached_features):
+        cached = data["MaterialName"].isin(cached_features.index).to_numpy()
+        hits = data[cached].copy()
+        hits.loc[:, 'Composition'] = [Composition(value) for value in hits["MaterialName"]]
+        hits = hits.join(cached_features, on="MaterialName")
+        parts = [featurize_formulas(data[~cached])] if (~cached).any() else []
+        # Keep the featurizer column order and the original row order
+        data = pd.concat(parts + [hits])[hits.columns].loc[data.index]
+    else:
+        data = featurize_formulas(data)
+
+    data = data.loc[:, (data != 0).any(axis=0)]
+    data = data.dropna(axis=1, how='all')  # Drop columns where all values are NaN
+    data = data.dropna()  # Drop rows where any value is NaN
+
+    return data
+
 def scale_dataframe(df, scaler=None, train_columns=None):
     if 'Thickness_Ang' in df.columns:
         X = df.drop(columns=["Thickness_Ang", "MaterialName", "Composition"], axis=1)
@@ -247,17 +416,26 @@ def scale_dataframe(df, scaler=None, train_columns=None):
         if train_columns is None:
             raise ValueError("train_columns must be provided for scaling prediction data.")
         
-        # Ensure the new data has the same columns as the training data
-        missing_cols = set(train_columns) - set(X.columns)
-        for col in missing_cols:
-            X[col] = 0  # Add missing columns with default value (e.g., 0)
-        X = X[train_columns]  # Reorder columns to match training data
+        # Match the training columns in one reindex (missing columns are 0)
+        X = X.reindex(columns=train_columns, fill_value=0)
         X_scaled = scaler.transform(X)
 
     X_scaled_df = pd.DataFrame(X_scaled, columns=train_columns)
     return X_scaled_df, y, scaler, train_columns
 
 
+def scale_with_feature_schema(df, feature_schema):
+    """
+    Scale featurized rows with the column order and scaler statistics saved by
+    model_export.save_feature_schema. Returns a float32 matrix.
+    """
+    X = df.drop(columns=[col for col in ("Thickness_Ang", "MaterialName", "Composition") if col in df.columns])
+    X = X.reindex(columns=feature_schema["columns"], fill_value=0)
+    mean = np.asarray(feature_schema["mean"])
+    scale = np.asarray(feature_schema["scale"])
+    return ((X.to_numpy(dtype=np.float64) - mean) / scale).astype(np.float32)
+
+
     
 
 def scale_dataframeold(df,scale_df=False):
@@ -282,8 +460,208 @@ def scale_dataframeold(df,scale_df=False):
 
 
 
+def classic_candidate_models():
+    """Unfitted candidate models compared when model_type = classic."""
+    return [
+        RandomForestRegressor(),
+        DecisionTreeRegressor(),
+        ExtraTreesRegressor(),
+      #  XGBRFRegressor(**hyper_params_xgb),
+        AdaBoostRegressor(),
+        GradientBoostingRegressor(),
+        ExtraTreeRegressor(),
+        CatBoostRegressor(loss_function='RMSE', silent=True)
+    ]
+
+
+
+def model_name(model):
+    return model_name(model.estimator) if isinstance(model, AugmentedRegressor) else model.__class__.__name__
+
+
+
+def classic_model_report(model, X_train, y_train, X_test, y_test, cv_scores):
+    """Row of the metrics table for a fitted model and its CV scores."""
+    pred = model.predict(X_test)
+    Train_Score = model.score(X_train, y_train)
+    dof = len(y_train) - X_train.shape[1] - 1
+    adj_R2 = 1 - (1 - Train_Score) * (len(y_train) - 1) / dof if dof > 0 else float('nan')
+    return {
+        'Algorithm': model_name(model),
+        'Model-Sc': round(Train_Score * 100, 2),
+        'Adj-Sc': round(adj_R2 * 100, 2),
+        #'Test-Sc': round(model.score(X_test, y_test) * 100, 2),
+        'CV-Sc': round(np.mean(cv_scores) * 100, 2),
+        'MSE': round(metrics.mean_squared_error(y_test, pred), 2),
+        'MAE': round(metrics.mean_absolute_error(y_test, pred), 2),
+        'STD': round(np.std(cv_scores), 2)
+    }
+
+
+
+def cv_splitter(n_splits, groups=None):
+    """ShuffleSplit, or GroupShuffleSplit when the rows carry groups (cv_mode = grouped)."""
+    if groups is None:
+        return ShuffleSplit(n_splits=n_splits, test_size=test_size + 0.1, random_state=rndseem)
+    return GroupShuffleSplit(n_splits=n_splits, test_size=test_size + 0.1, random_state=rndseem)
+
+
+
+def row_groups(X):
+    """Group id per row; identical feature rows (the same formula) share a group."""
+    return pd.util.hash_pandas_object(X, index=False).factorize()[0]
+
+
+
+def select_model_full_cv(MLA, X_train, y_train, X_test, y_test, n_splits=10, groups=None):
+    """
+    Fit and cross-validate every candidate on the full training set and keep the
+    best mean CV score (model_selection = full).
+    """
+    algorithms = []
+    best_model = None
+    best_score = -float('inf')
+
+    cv = cv_splitter(n_splits, groups)
+
+    for model in MLA:
+        Alg = model_name(model)
+        try:
+            with stage(f"train/fit/{Alg}", rows=len(X_train)):
+                if Alg == 'XGBRFRegressor':
+                    model.fit(X_train, y_train, eval_set=[(X_test, y_test)])
+                else:
+                    model.fit(X_train, y_train)
+
+            with stage(f"train/cv/{Alg}", folds=cv.get_n_splits()):
+                cross_validation = cross_val_score(model, X_train, y_train, groups=groups, cv=cv, scoring='r2')
+
+            if cross_validation.mean() > best_score:
+                best_score = cross_validation.mean()
+                best_model = model
+
+            algorithms.append(classic_model_report(model, X_train, y_train, X_test, y_test, cross_validation))
+
+        except Exception as e:
+            print(f"Exception occurred in {Alg}: {e}")
+
+    return pd.DataFrame(algorithms), best_model
+
+
+
+def select_model_successive_halving(MLA, X_train, y_train, X_test, y_test, n_splits=10, eta=3, min_splits=3, groups=None):
+    """
+    Successive halving over the candidate models (model_selection = halving).
+
+    Each round scores the surviving candidates by cross-validation on a random
+    subsample of the training rows and keeps the best 1/eta of them; the
+    subsample grows by eta per round until the last round, which uses all rows
+    and the full n_splits folds. Only the winner is fitted on the full training
+    set. With the seven default candidates and eta = 3 this is a 3-fold round
+    on a third of the rows, then full 10-fold CV for the best three.
+
+    Returns:
+    - (pd.DataFrame, model): Metrics table (eliminated candidates only report
+      the CV score of the last round they took part in) and the fitted winner.
+    """
+    candidates = list(MLA)
+    n_rounds = max(1, int(np.ceil(np.log(len(candidates)) / np.log(eta))))
+    rng = np.random.RandomState(rndseem)
+    results = {}
+
+    for round_idx in range(n_rounds):
+        last_round = round_idx == n_rounds - 1
+        fraction = float(eta) ** (round_idx - n_rounds + 1)
+        n_rows = len(X_train) if last_round else max(int(len(X_train) * fraction), 10 * min_splits)
+        rows = np.sort(rng.choice(len(X_train), size=min(n_rows, len(X_train)), replace=False))
+        X_round, y_round = X_train.iloc[rows], y_train.iloc[rows]
+        groups_round = None if groups is None else np.asarray(groups)[rows]
+        splits = n_splits if last_round else min(min_splits, n_splits)
+        cv = cv_splitter(splits, groups_round)
+
+        scores = []
+        for model in candidates:
+            Alg = model_name(model)
+            try:
+                with stage(f"train/cv/{Alg}", folds=splits, rows=len(rows), round=round_idx):
+                    cross_validation = cross_val_score(model, X_round, y_round, groups=groups_round, cv=cv, scoring='r2')
+            except Exception as e:
+                print(f"Exception occurred in {Alg}: {e}")
+                continue
+            scores.append((cross_validation.mean(), model))
+            results[Alg] = {'Algorithm': Alg, 'CV-Sc': round(cross_validation.mean() * 100, 2),
+                            'STD': round(cross_validation.std(), 2), 'Round': round_idx, 'Rows': len(rows),
+                            '_cv': cross_validation}
+
+        scores.sort(key=lambda item: item[0], reverse=True)
+        n_keep = 1 if last_round else max(1, int(np.ceil(len(scores) / eta)))
+        candidates = [model for _, model in scores[:n_keep]]
+        dropped = [model_name(model) for _, model in scores[n_keep:]]
+        if dropped and not last_round:
+            print(f"Model selection round {round_idx + 1}: dropped {', '.join(dropped)}")
+        if not candidates:
+            return pd.DataFrame(), None
+
+    best_model = candidates[0]
+    Alg = model_name(best_model)
+    with stage(f"train/fit/{Alg}", rows=len(X_train)):
+        best_model.fit(X_train, y_train)
+
+    report = classic_model_report(best_model, X_train, y_train, X_test, y_test, results[Alg]['_cv'])
+    results[Alg].update(report)
+    algorithms = pd.DataFrame([{k: v for k, v in row.items() if k != '_cv'} for row in results.values()])
+    columns = ['Algorithm', 'Model-Sc', 'Adj-Sc', 'CV-Sc', 'MSE', 'MAE', 'STD', 'Round', 'Rows']
+    algorithms = algorithms.sort_values(['Round', 'CV-Sc'], ascending=False, ignore_index=True)
+    return algorithms[columns], best_model
+
+
+
+def fit_ensemble(MLA, algorithms, best_model, X_train, y_train, size, refit=True):
+    """
+    Fitted top-`size` candidates of the model selection (ensemble_size > 1).
+
+    Args:
+    - MLA (list): Candidate models passed to the selection.
+    - algorithms (pd.DataFrame): Selection table; halving tables are ranked by
+      round and CV score, full-CV tables by CV score.
+    - best_model: The fitted winner, always the first member.
+    - X_train, y_train: Training data of the selection.
+    - size (int): Number of members.
+    - refit (bool): Fit the other members (False when the selection already
+      fitted every candidate, model_selection = full).
+
+    Returns:
+    - ThicknessEnsemble: The members, unwrapped from AugmentedRegressor.
+    """
+    if 'Round' not in algorithms:
+        algorithms = algorithms.sort_values('CV-Sc', ascending=False, ignore_index=True)
+    by_name = {model_name(model): model for model in MLA}
+    members = [best_model]
+    for Alg in algorithms['Algorithm']:
+        if len(members) >= size:
+            break
+        model = by_name.get(Alg)
+        if model is None or model is best_model:
+            continue
+        if refit:
+            try:
+                with stage(f"train/fit/{Alg}", rows=len(X_train), ensemble=True):
+                    model.fit(X_train, y_train)
+            except Exception as e:
+                print(f"Exception occurred in {Alg}: {e}")
+                continue
+        members.append(model)
+
+    members = [model.estimator_ if isinstance(model, AugmentedRegressor) else model for model in members]
+    return ThicknessEnsemble(members, names=[model.__class__.__name__ for model in members])
+
+
+
 def train_and_save_best_model(X, Y, directory, num_augmented_samples, model_type, test_size=test_size, rndseem=rndseem):
 
+    # An export of the previous model must not outlive it (export_model off or a failed export)
+    remove_exported_model(directory, model_type)
+
     if model_type == "classic":
         print("Training non-DNN model to predict 2D thickness ...! Be patient ...")
     elif model_type == "dnn":
@@ -291,8 +669,7 @@ def train_and_save_best_model(X, Y, directory, num_augmented_samples, model_type
     X_train_n, X_test, y_train_n, y_test = train_test_split(X, Y, test_size=test_size, random_state=rndseem)
      
     if model_type == "dnn":
-        epochs = 1000
-        optimize_noise = False
+        epochs = dnn_epochs
         data_agumentation = True
         early_stopping = True
         best_noise = 0.08
@@ -310,15 +687,17 @@ def train_and_save_best_model(X, Y, directory, num_augmented_samples, model_type
           X_train_np = X_train_n.to_numpy()
           y_train_np = y_train_n.to_numpy()
           augmenter = DataAugmenterDNN(mean=0, std=best_noise, num_augmented_samples=num_augmented_samples)
-          augmented_X_train, augmented_y_train = augmenter.augment_and_shuffle(X_train_np, y_train_np)
+          with stage("train/augment", rows=len(X_train_np) * num_augmented_samples):
+            augmented_X_train, augmented_y_train = augmenter.augment_and_shuffle(X_train_np, y_train_np)
 
           if optimize_noise:
             X_train_main, X_val, y_train_main, y_val = train_test_split(augmented_X_train, augmented_y_train, test_size=test_size, random_state=rndseem)
-            best_noise,best_node = nn_temp.find_best_noise(X_train_main, y_train_main, X_val, y_val)
+            with stage("train/noise_search", profile=True, trials=noise_search_trials):
+              best_noise,best_node = nn_temp.find_best_noise(X_train_main, y_train_main, X_val, y_val,
+                                                             cache_path=os.path.join(directory, noise_search_name),
+                                                             dataset_key=dataset_digest(X_train_n, y_train_n, num_augmented_samples))
             print(f"Best noise value: {best_noise}")
-            hidden_layers=(hidden_layers[1], best_node)
-            epochs = int(best_node)
-            best_noise = best_noise
+            hidden_layers=(hidden_layers[0], best_node)
           else:
             best_noise = best_noise #Default value
 
@@ -327,18 +706,21 @@ def train_and_save_best_model(X, Y, directory, num_augmented_samples, model_type
           model_nn = CustomDNN(input_dim=X_train_n.shape[1], output_dim=1,
                                   hidden_layers=hidden_layers, activation='relu', noise_std=best_noise,
                                   epochs=epochs, optimize_noise=optimize_noise)
-          mdl_history,best_model = model_nn.train(augmented_X_train, augmented_y_train, X_test, y_test, model_checkpoint_path=model_checkpoint_path, early_stopping=early_stopping, epochs=epochs)
+          batch_size = model_nn.find_batch_size(augmented_X_train, augmented_y_train) if dnn_batch_size == "auto" else int(dnn_batch_size)
+          with stage("train/fit/CustomDNN", rows=len(augmented_X_train), batch_size=batch_size, epochs=epochs):
+            mdl_history,best_model = model_nn.train(augmented_X_train, augmented_y_train, X_test, y_test, model_checkpoint_path=model_checkpoint_path, early_stopping=early_stopping, epochs=epochs, patience=dnn_patience, batch_size=batch_size, lr_schedule=dnn_lr_schedule)
           y_pred_train = model_nn.predict(augmented_X_train)
           r2_train = model_nn.r2_score(y_pred_train, augmented_y_train)
         else:
 
           if optimize_noise:
-            X_train_main, X_val, y_train_main, y_val = train_test_split(X_main, y_main, test_size=test_size, random_state=rndseem)
-            best_noise,best_node = nn_temp.find_best_noise(X_train_main, y_train_main, X_val, y_val)
+            X_train_main, X_val, y_train_main, y_val = train_test_split(X_train_n, y_train_n, test_size=test_size, random_state=rndseem)
+            with stage("train/noise_search", profile=True, trials=noise_search_trials):
+              best_noise,best_node = nn_temp.find_best_noise(X_train_main, y_train_main, X_val, y_val,
+                                                             cache_path=os.path.join(directory, noise_search_name),
+                                                             dataset_key=dataset_digest(X_train_n, y_train_n))
             print(f"Best noise value: {best_noise}")
-            hidden_layers=(hidden_layers[1], best_node)
-            epochs = int(best_node)
-            best_noise = best_noise
+            hidden_layers=(hidden_layers[0], best_node)
           else:
             best_noise = best_noise #Default value
 
@@ -346,7 +728,8 @@ def train_and_save_best_model(X, Y, directory, num_augmented_samples, model_type
           model_nn = CustomDNN(input_dim=X_train_n.shape[1], output_dim=y_train_n.shape[1],
                                   hidden_layers=hidden_layers, activation='relu', noise_std=best_noise,
                                   epochs=epochs, optimize_noise=optimize_noise)
-          mdl_history = model_nn.train(X_train_n, y_train_n, X_test, y_test, model_checkpoint_path=model_checkpoint_path, early_stopping=early_stopping, epochs=epochs) # 
+          batch_size = model_nn.find_batch_size(X_train_n.to_numpy(), y_train_n.to_numpy()) if dnn_batch_size == "auto" else int(dnn_batch_size)
+          mdl_history = model_nn.train(X_train_n, y_train_n, X_test, y_test, model_checkpoint_path=model_checkpoint_path, early_stopping=early_stopping, epochs=epochs, patience=dnn_patience, batch_size=batch_size, lr_schedule=dnn_lr_schedule) # 
           y_pred_train = model_nn.predict(X_train_n)
           r2_train = model_nn.r2_score(y_pred_train, y_train_n)
           #hist = pd.DataFrame(mdl_history.history)
@@ -359,20 +742,24 @@ def train_and_save_best_model(X, Y, directory, num_augmented_samples, model_type
         r2 = model_nn.r2_score(y_test, y_pred)
         best_model = model_nn
 
-        algorithms = algorithms.append({
+        algorithms = pd.concat([algorithms, pd.DataFrame([{
             'Model-Sc': round(r2_train * 100, 2),
             'Test-Sc': round(r2 * 100, 2),
             'MSE': round(test_loss[0], 2),
-        }, ignore_index=True)
+        }])], ignore_index=True)
 
         if not os.path.exists(directory):
             os.makedirs(directory)
 
         print(f"DNN model saved to {directory}/best_thickness_model.keras")
+        if export_model:
+            export_inference_model(best_model, directory, model_type, X_train_n.shape[1])
                     
     elif model_type == "classic":
-        augmenter = DataAugmenter(mean=0, std=0.1, num_augmented_samples=num_augmented_samples)
-        X_train, y_train = augmenter.augment_and_shuffle(X_train_n, y_train_n)
+        if cv_mode != "grouped":
+            augmenter = DataAugmenter(mean=0, std=0.1, num_augmented_samples=num_augmented_samples)
+            with stage("train/augment", rows=len(X_train_n) * num_augmented_samples):
+                X_train, y_train = augmenter.augment_and_shuffle(X_train_n, y_train_n)
 
 
         # Define models and their hyperparameters
@@ -382,60 +769,42 @@ def train_and_save_best_model(X, Y, directory, num_augmented_samples, model_type
             'eval_metric': mean_absolute_error
         }
 
-        MLA = [
-            RandomForestRegressor(),
-            DecisionTreeRegressor(),
-            ExtraTreesRegressor(),
-          #  XGBRFRegressor(**hyper_params_xgb),
-            AdaBoostRegressor(),
-            GradientBoostingRegressor(),
-            ExtraTreeRegressor(),
-            CatBoostRegressor(loss_function='RMSE', silent=True)
-        ]
-
-        # Initialize variables to store results
-        algorithms = pd.DataFrame()
-        best_model = None
-        best_score = -float('inf')
-
-        cv = ShuffleSplit(n_splits=10, test_size=test_size + 0.1, random_state=rndseem)
+        MLA = classic_candidate_models()
 
-        for model in MLA:
-            try:
-                Alg = model.__class__.__name__
-                if Alg == 'XGBRFRegressor':
-                    model.fit(X_train, y_train, eval_set=[(X_test, y_test)])
-                else:
-                    model.fit(X_train, y_train)
+        if cv_mode == "grouped":
+            # Cross-validate on the original rows grouped by material and augment
+            # only the training part of each fold, so that noisy copies of a
+            # validation material are never trained on. Fewer folds are needed
+            # as the scores are no longer inflated by leaked copies.
+            MLA = [AugmentedRegressor(model, num_augmented_samples=num_augmented_samples, random_state=rndseem) for model in MLA]
+            X_train, y_train = X_train_n, y_train_n
+            selection_args = dict(n_splits=5, groups=row_groups(X_train_n))
+        else:
+            selection_args = dict(n_splits=10)
+
+        if tune_hyperparameters:
+            groups = selection_args.get("groups")
+            with stage("train/tune", profile=True, candidates=tuning_candidates):
+                MLA = tune_models(MLA, X_train, y_train,
+                                  dataset_key=dataset_digest(X_train_n, y_train_n, num_augmented_samples, cv_mode),
+                                  cache_path=os.path.join(directory, tuned_hyperparameters_name),
+                                  cv=cv_splitter(5, groups), groups=groups, n_candidates=tuning_candidates,
+                                  random_state=rndseem, param_prefix="estimator__" if cv_mode == "grouped" else "",
+                                  name=model_name)
+
+        if model_selection == "halving":
+            algorithms, best_model = select_model_successive_halving(MLA, X_train, y_train, X_test, y_test, **selection_args)
+        else:
+            algorithms, best_model = select_model_full_cv(MLA, X_train, y_train, X_test, y_test, **selection_args)
 
-                cross_validation = cross_val_score(model, X_train, y_train, cv=cv, scoring='r2')
-                mean_cv_score = cross_validation.mean()
-                pred = model.predict(X_test)
-                adj_R2 = 1 - (1 - model.score(X_train, y_train)) * (len(y_train) - 1) / (len(y_train) - X_train.shape[1] - 1)
-                Train_Score = model.score(X_train, y_train)
-                Test_Score = model.score(X_test, y_test)
-                MSE = metrics.mean_squared_error(y_test, pred)
-                MAE = metrics.mean_absolute_error(y_test, pred)
-                STD = cross_validation.std()
-
-                if mean_cv_score > best_score:
-                    best_score = mean_cv_score
-                    best_model = model
-
-                algorithms = algorithms.append({
-                    'Algorithm': Alg,
-                    'Model-Sc': round(Train_Score * 100, 2),
-                    'Adj-Sc': round(adj_R2 * 100, 2),
-                    #'Test-Sc': round(Test_Score * 100, 2),
-                    'CV-Sc': round(mean_cv_score * 100, 2),
-                    'MSE': round(MSE, 2),
-                    'MAE': round(MAE, 2),
-                    'STD': round(STD, 2)
-                }, ignore_index=True)
+        ensemble = None
+        if ensemble_size > 1 and best_model is not None:
+            with stage("train/ensemble", size=ensemble_size):
+                ensemble = fit_ensemble(MLA, algorithms, best_model, X_train, y_train, ensemble_size,
+                                        refit=model_selection == "halving")
 
-            except Exception as e:
-                print(f"Exception occurred in {Alg}: {e}")
-                pass
+        if isinstance(best_model, AugmentedRegressor):
+            best_model = best_model.estimator_
 
         # Save the best model
         if best_model is not None:
@@ -447,6 +816,13 @@ def train_and_save_best_model(X, Y, directory, num_augmented_samples, model_type
             model_path = os.path.join(directory, 'best_thickness_model.pkl')
             joblib.dump(best_model, model_path)
             print(f"Best model saved to {model_path}")
+            if export_model:
+                export_inference_model(best_model, directory, model_type, X_train.shape[1])
+            if ensemble is not None:
+                ensemble_path = os.path.join(directory, ensemble_model_name)
+                joblib.dump(ensemble, ensemble_path)
+                print(f"Ensemble of {', '.join(ensemble.names)} saved to {ensemble_path}")
+                best_model = ensemble
         else:
             print("No best model found to save.")
             
@@ -477,62 +853,46 @@ def load_user_thickness_data(file_path):
         return pd.DataFrame()  # Return an empty DataFrame on failure
         
         
-def augment_and_average_thickness_data(original_data, new_data):
-    # Combine the original and new datasets
-    combined_data = pd.concat([original_data, new_data])
+def load_user_thickness_store(file_path, store_path):
+    """
+    Ingest the rows appended to `file_path` since the last run into the
+    ThicknessStore at `store_path`, featurize new formulas and return the
+    per-formula sums/counts and the cached features.
+    """
+    with ThicknessStore(store_path) as store:
+        n_new = store.ingest(file_path)
+        if n_new:
+            print(f"{n_new} new records ingested from {file_path}.")
+        with stage("predict/featurize_user_data"):
+            store.update_features(formula_features)
+        return store.load()
+
 
-    avg_data = combined_data.groupby('MaterialName', as_index=False)['Thickness_Ang'].mean()
-    print(f"{len(new_data)} new records added to the thickness database for ML training.")
+def augment_and_average_thickness_data(original_data, new_data):
+    """
+    Average the thickness of each material over the original rows and the user
+    data. `new_data` has either one row per record (MaterialName,
+    Thickness_Ang) or per-formula running sums (MaterialName, Thickness_Sum,
+    Count) from ThicknessStore; both give the same mean.
+    """
+    if 'Count' not in new_data.columns:
+        new_data = new_data.assign(Thickness_Sum=new_data['Thickness_Ang'], Count=1)
+    original = original_data.assign(Thickness_Sum=original_data['Thickness_Ang'], Count=1)
+    combined_data = pd.concat([original, new_data[['MaterialName', 'Thickness_Sum', 'Count']]])
+
+    sums = combined_data.groupby('MaterialName', as_index=False)[['Thickness_Sum', 'Count']].sum()
+    avg_data = pd.DataFrame({'MaterialName': sums['MaterialName'],
+                             'Thickness_Ang': sums['Thickness_Sum'] / sums['Count']})
+    print(f"{int(new_data['Count'].sum())} new records added to the thickness database for ML training.")
     return avg_data
 
 
 def load_thickness():
-
-    data = {
-        "MaterialName": ["C", "MoS2", "WS2", "MoSe2", "WSe2", "BN", "MoTe2", "WTe2", "NbSe2", "TaS2", 
-                          "TaSe2", "Bi2Se3", "Bi2Te3", "SnS2", "SnSe2", "HfS2", "HfSe2", "ZrS2", "ZrSe2", "TiS2", 
-                          "TiSe2", "ReS2", "ReSe2", "CuI", "P", "Bi2Te3", "NbSe2", "SnS2", "MoTe2", "WTe2", 
-                          "NbSe2", "TaS2", "TaSe2", "FeSe", "NiTe2", "PtS2", "PtSe2", "PtTe2", "PdTe2", "VS2", 
-                          "VSe2", "MnSe2", "CrS2", "CrSe2", "FePS3", "WS2", "InSe", "SiC", "Si", "Ge",
-                          "ZnO", "ZnS", "ZnSe", "CdO", "CdS", "CdSe", "MgO",
-                          "PbTe", "PbSe", "SnSe", "SnTe", "GeTe", "SiTe",
-                          "GeSe", "SnSe", "SnTe", "GeTe","GeO",
-                          ],
-        "Thickness_Ang": [3.43, 6.5, 6.2, 6.7, 6.4, 3.4, 10.8, 9.9, 6.7, 6.4, 
-                          6.6, 15, 16, 6.1, 6.5, 6.5, 6.8, 6.4, 6.7, 6, 
-                          6.3, 7.2, 7, 2.8, 6.5, 12, 8, 5.8, 10.8, 9.9, 
-                          6.7, 6.4, 6.6, 6.2, 7.27, 4.9, 5.9, 6.8, 6.8, 5.9, 
-                          6.32, 6.8, 6.16, 6.6, 7.9, 6.2, 6.1, 3.1, 0.67, 0.67,
-                          3.05, 3.45, 3.75, 3.4, 3.75, 3.95, 2.3,
-                          6.35,  # Average of 6.2 - 6.5
-                          5.95,  # Average of 5.8 - 6.1
-                          5.55,  # Average of 5.4 - 5.7
-                          5.85,  # Average of 5.7 - 6.0
-                          5.15,  # Average of 5.0 - 5.3
-                          4.85,   # Average of 4.7 - 5.0                          
-                          5.55, 4.95, 5.05, 5.15, 4.35,
-                          ]
-        }
-
-
-
-    df = pd.DataFrame(data)
-    df_avg = df.groupby('MaterialName', as_index=False)['Thickness_Ang'].mean()
-    data = df_avg.drop_duplicates(subset=['MaterialName'])
-
-    #data = data.set_index('MaterialName')
-
-    return data
-    
-    
-
-    df = pd.DataFrame(data)
-    df_avg = df.groupby('MaterialName', as_index=False)['Thickness_Ang'].mean()
-    data = df_avg.drop_duplicates(subset=['MaterialName'])
-
-    #data = data.set_index('MaterialName')
-
-    return data
+    """
+    Reference thickness table (MaterialName, Thickness_Ang; one row per formula)
+    from the versioned dataset in thick2d_data/ or `reference_dataset`.
+    """
+    return load_reference_dataset(reference_dataset_path).table
 
 
 # Augment data to sparse dataset to improve performance
@@ -579,6 +939,36 @@ class DataAugmenter:
         
 
 
+class AugmentedRegressor(BaseEstimator, RegressorMixin):
+    """
+    Regressor that augments its training data in fit() (Gaussian noise copies of
+    each row, as DataAugmenter) and predicts with the wrapped estimator. Used in
+    cross-validation so that augmentation happens inside each training fold.
+    """
+    def __init__(self, estimator, num_augmented_samples=2, mean=0, std=0.10, random_state=None):
+        self.estimator = estimator
+        self.num_augmented_samples = num_augmented_samples
+        self.mean = mean
+        self.std = std
+        self.random_state = random_state
+
+    def fit(self, X, y):
+        rng = np.random.RandomState(self.random_state)
+        X_aug = np.repeat(np.asarray(X, dtype=float), self.num_augmented_samples, axis=0)
+        X_aug += rng.normal(self.mean, self.std, X_aug.shape)
+        y_aug = np.repeat(np.asarray(y), self.num_augmented_samples, axis=0)
+        order = rng.permutation(len(X_aug))
+        X_aug, y_aug = X_aug[order], y_aug[order]
+        if isinstance(X, pd.DataFrame):
+            X_aug = pd.DataFrame(X_aug, columns=X.columns)
+        self.estimator_ = clone(self.estimator).fit(X_aug, y_aug)
+        return self
+
+    def predict(self, X):
+        return self.estimator_.predict(X)
+
+
+
 class DataAugmenterDNN:
     def __init__(self, mean=0, std=0.10, num_augmented_samples=2):
         self.mean = mean
@@ -631,10 +1021,9 @@ class CustomDNN:
         # Initialize optimize_noise
         self.optimize_noise = optimize_noise
 
+        import_tensorflow()
+        # noise_std is the searched value when optimize_noise is set (see find_best_noise)
         self.best_noise = self.noise_std
-        if self.optimize_noise:
-            self.best_noise_tmp, _ = self.find_best_noise(X_train_main, y_train_main, X_val, y_val)
-            self.best_noise = self.best_noise_tmp
 
         self.model = self.build_model()
 
@@ -644,49 +1033,28 @@ class CustomDNN:
         if nodes is None:
             nodes = self.nodes_per_layer
 
-        model_noise = keras.Sequential()
-
-        # Input layer with added Gaussian Noise
-        model_noise.add(GaussianNoise(noise_amount, input_shape=(self.input_dim,)))
-
-        # Hidden layers
-        for _ in range(self.n_layers):
-            model_noise.add(layers.Dense(self.nodes_per_layer, activation=self.activation))
-
-        # Output layer
-        model_noise.add(layers.Dense(self.output_dim))
-
-        # Compile the model
-        model_noise.compile(optimizer=self.optimizer, loss=self.loss, metrics=['mse'])
-
-        return model_noise
+        return build_noise_model(self.input_dim, self.output_dim, self.n_layers, nodes, noise_amount,
+                                 activation=self.activation, optimizer=self.optimizer, loss=self.loss)
 
-    def find_best_noise(self, X_train_main, y_train_main, X_val, y_val):
-        def objective(noise_amount, nodes):
-            nodes = int(nodes)
-            model_find_best_noise = self.create_model_noise(noise_amount=noise_amount, nodes=nodes)
-            history = model_find_best_noise.fit(X_train_main, y_train_main, validation_data=(X_val, y_val), epochs=self.epochs, verbose=0)
-            return history.history['val_loss'][-1]
-
-        pbounds = {
-            'noise_amount': (0.01, 0.10),
-            'nodes': (50, 400)
-        }
-
-        optimizer = BayesianOptimization(
-            f=objective,
-            pbounds=pbounds,
-            random_state=1,
-        )
+    def find_best_noise(self, X_train_main, y_train_main, X_val, y_val, n_trials=None, epochs=None, workers=None,
+                        cache_path=None, dataset_key=None):
+        """
+        Bayesian search of the input noise and the nodes per layer (see noise_search.search_noise).
+        The budget defaults to noise_search_trials / noise_search_epochs / noise_search_workers
+        from thick2dtool.in; each trial stops early after 10 epochs without improvement.
 
-        optimizer.maximize(init_points=5, n_iter=15)
-        best_noise = optimizer.max['params']['noise_amount']
-        best_nodes = optimizer.max['params']['nodes']
+        Returns:
+        - (float, int): Best noise amount and nodes per layer.
+        """
+        best_noise, best_nodes = search_noise(
+            X_train_main, y_train_main, X_val, y_val, n_layers=self.n_layers,
+            n_trials=n_trials or noise_search_trials, epochs=epochs or noise_search_epochs,
+            workers=workers or noise_search_workers, activation=self.activation,
+            optimizer=self.optimizer, loss=self.loss, cache_path=cache_path, dataset_key=dataset_key)
 
         print(f"Best noise amount: {best_noise:.4f}")
         print(f"Best nodes: {int(best_nodes)}")
 
-        #print(optimizer.max)
         return best_noise,best_nodes
 
     def build_model(self):
@@ -717,10 +1085,44 @@ class CustomDNN:
             model.add(Dropout(0.25))  # Add dropout to prevent overfitting
         model.add(layers.Dense(self.output_dim, name="output_layer"))
 
-        model.compile(loss=self.loss, optimizer=self.optimizer, metrics=['mse'])
+        compile_args = {"jit_compile": True} if xla_jit else {}
+        model.compile(loss=self.loss, optimizer=self.optimizer, metrics=['mse'], **compile_args)
 
         return model
 
+    def find_batch_size(self, X, y, candidates=(32, 64, 128, 256, 512, 1024, 2048), steps=5, min_steps_per_epoch=20, tolerance=0.9):
+        """
+        Pick a batch size for the available cores by timing a few training steps of
+        a copy of the model for each candidate. The smallest batch size within
+        `tolerance` of the best throughput (samples/s) is returned, so that small
+        batches are kept when larger ones buy little; batch sizes that leave fewer
+        than `min_steps_per_epoch` updates per epoch are not considered.
+
+        Returns:
+        - int: The selected batch size.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        y = np.asarray(y, dtype=np.float32)
+        candidates = [b for b in candidates if b * min_steps_per_epoch <= len(X)] or [min(candidates)]
+
+        probe = keras.models.clone_model(self.model)
+        compile_args = {"jit_compile": True} if xla_jit else {}
+        probe.compile(loss=self.loss, optimizer=self.optimizer, **compile_args)
+
+        throughput = {}
+        for batch_size in candidates:
+            X_batch, y_batch = X[:batch_size], y[:batch_size]
+            probe.train_on_batch(X_batch, y_batch)  # warm-up (tracing/compilation)
+            start = time.perf_counter()
+            for _ in range(steps):
+                probe.train_on_batch(X_batch, y_batch)
+            throughput[batch_size] = batch_size * steps / (time.perf_counter() - start)
+
+        best = max(throughput.values())
+        batch_size = min(b for b, rate in throughput.items() if rate >= tolerance * best)
+        print(f"Selected batch size {batch_size} ({throughput[batch_size]:.0f} samples/s)")
+        return batch_size
+
 
     def preprocess_data(self, X, y):
         # Scale the targets
@@ -739,9 +1141,12 @@ class CustomDNN:
         self.scaler_y = sc_y
         return X_scaled, y_scaled
 
-    def train(self, X_train, y_train, X_val=None, y_val=None, patience=25, model_checkpoint_path="best_thickness_model.keras", early_stopping=False,epochs=None):
+    def train(self, X_train, y_train, X_val=None, y_val=None, patience=25, model_checkpoint_path="best_thickness_model.keras", early_stopping=False,epochs=None, batch_size=64, lr_schedule="plateau"):
         """
         Train the neural network model.
+
+        lr_schedule is 'plateau' (ReduceLROnPlateau on val_loss), 'cosine' (cosine
+        decay over the epochs), 'exponential' (x0.95 per epoch) or 'constant'.
         """
         if epochs is None:
           epochs = self.epochs
@@ -757,25 +1162,34 @@ class CustomDNN:
             es = EarlyStopping(verbose=1, patience=patience)
             callbacks.append(es)
 
-        lrd = ReduceLROnPlateau(monitor='val_loss',
-                        factor=0.20,  # Reduce the learning rate by
-                        patience=patience,
-                        verbose=1,
-                        mode='min',
-                        threshold_mode='rel',
-                        min_delta=1e-4,  # Minimum change to consider as improvement
-                        cooldown=5,  # Wait for 5 epochs before potentially applying further reductions
-                        min_lr=1e-6)  # Set a floor for the learning rate
+        if lr_schedule == "plateau":
+            lrd = ReduceLROnPlateau(monitor='val_loss',
+                            factor=0.20,  # Reduce the learning rate by
+                            patience=patience,
+                            verbose=1,
+                            mode='min',
+                            threshold_mode='rel',
+                            min_delta=1e-4,  # Minimum change to consider as improvement
+                            cooldown=5,  # Wait for 5 epochs before potentially applying further reductions
+                            min_lr=1e-6)  # Set a floor for the learning rate
+            callbacks.append(lrd)
+        elif lr_schedule in ("cosine", "exponential"):
+            lr0 = float(keras.ops.convert_to_numpy(self.model.optimizer.learning_rate)) if hasattr(keras, "ops") else float(keras.backend.get_value(self.model.optimizer.learning_rate))
+            if lr_schedule == "cosine":
+                schedule = lambda epoch: 1e-6 + 0.5 * (lr0 - 1e-6) * (1 + np.cos(np.pi * epoch / epochs))
+            else:
+                schedule = lambda epoch: max(lr0 * 0.95 ** epoch, 1e-6)
+            callbacks.append(LearningRateScheduler(schedule))
 
         model_checkpoint = ModelCheckpoint(model_checkpoint_path, save_best_only=True, save_weights_only=False, monitor='val_loss', mode='min', verbose=1)
         #self.model.save(model_checkpoint_path)
-        callbacks.extend([lrd, model_checkpoint]) #, self.lr_scheduler
+        callbacks.append(model_checkpoint) #, self.lr_scheduler
 
         mdl_history = self.model.fit(X_train, y_train,
                                      epochs=epochs,
                                      validation_data=validation_data,
                                      shuffle = True,
-                                     batch_size = 64,
+                                     batch_size = batch_size,
                                      callbacks=callbacks)
         self.model.load_weights(model_checkpoint_path)
 
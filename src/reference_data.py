@@ -0,0 +1,149 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+# Versioned reference thickness dataset used to train the thickness models.
+# A dataset is a directory with
+#   manifest.json   version, row count, feature columns and the SHA-256 of the content
+#   formulas.npy    unique formulas (fixed-width unicode)
+#   thickness.npy   mean thickness per formula (float64)
+#   features.npy    featurize_formulas output per formula (float64, rows x columns)
+#   thickness.csv   the source table (optional; repeated formulas allowed)
+# The .npy files are memory-mapped, so loading does not parse or copy the data.
+# The shipped dataset lives in thick2d_data/; another one can be used with
+# `reference_dataset = <directory>` in thick2dtool.in. Build one from a CSV with
+#   python reference_data.py <MaterialName,Thickness_Ang csv> <output directory> [version]
+
+import os
+import sys
+import json
+import hashlib
+import numpy as np
+
+
+default_reference_dataset = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                         "thick2d_data", "thickness_reference_v1")
+manifest_name = "manifest.json"
+
+
+
+def content_digest(formulas, thickness, features, columns):
+    sha = hashlib.sha256()
+    sha.update(json.dumps([str(f) for f in formulas]).encode())
+    sha.update(np.ascontiguousarray(thickness, dtype=np.float64).tobytes())
+    sha.update(json.dumps([str(c) for c in columns]).encode())
+    sha.update(np.ascontiguousarray(features, dtype=np.float64).tobytes())
+    return sha.hexdigest()
+
+
+
+class ReferenceDataset:
+    """
+    Memory-mapped reference dataset.
+
+    Attributes:
+    - table (pd.DataFrame): MaterialName and Thickness_Ang, one row per formula.
+    - features (pd.DataFrame): Precomputed features indexed by formula.
+    - sha256 (str): Content hash from the manifest.
+    - version (str): Dataset version.
+    """
+
+    def __init__(self, directory, verify=False):
+        import pandas as pd
+
+        with open(os.path.join(directory, manifest_name), "r") as f:
+            self.manifest = json.load(f)
+        self.directory = directory
+        self.version = self.manifest["version"]
+        self.sha256 = self.manifest["sha256"]
+        self.columns = self.manifest["feature_columns"]
+
+        formulas = np.load(os.path.join(directory, "formulas.npy"), allow_pickle=False)
+        thickness = np.load(os.path.join(directory, "thickness.npy"), mmap_mode="r", allow_pickle=False)
+        features = np.load(os.path.join(directory, "features.npy"), mmap_mode="r", allow_pickle=False)
+
+        if verify and content_digest(formulas, thickness, features, self.columns) != self.sha256:
+            raise ValueError(f"Reference dataset {directory} does not match its manifest hash.")
+
+        names = [str(f) for f in formulas]
+        self.table = pd.DataFrame({"MaterialName": names, "Thickness_Ang": np.asarray(thickness)})
+        self.features = pd.DataFrame(features, columns=self.columns,
+                                     index=pd.Index(names, name="MaterialName"), copy=False)
+
+
+
+def read_manifest(directory=None):
+    with open(os.path.join(directory or default_reference_dataset, manifest_name), "r") as f:
+        return json.load(f)
+
+
+
+def load_reference_dataset(directory=None, verify=False):
+    return ReferenceDataset(directory or default_reference_dataset, verify=verify)
+
+
+
+def build_reference_dataset(csv_path, directory, featurize, version="1"):
+    """
+    Build a dataset directory from a CSV with MaterialName and Thickness_Ang
+    columns ('#' starts a comment). Repeated formulas are averaged.
+
+    Args:
+    - csv_path (str): Source table.
+    - directory (str): Output dataset directory.
+    - featurize (callable): list of formulas -> pd.DataFrame of features.
+    - version (str): Dataset version stored in the manifest.
+
+    Returns:
+    - str: Content hash of the dataset.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(csv_path, comment="#", skipinitialspace=True)
+    df["MaterialName"] = df["MaterialName"].str.strip()
+    table = df.groupby("MaterialName", as_index=False)["Thickness_Ang"].mean()
+
+    formulas = table["MaterialName"].to_numpy(dtype=str)
+    thickness = table["Thickness_Ang"].to_numpy(dtype=np.float64)
+    features_df = featurize(list(formulas))
+    columns = [str(c) for c in features_df.columns]
+    features = features_df.to_numpy(dtype=np.float64)
+    digest = content_digest(formulas, thickness, features, columns)
+
+    os.makedirs(directory, exist_ok=True)
+    np.save(os.path.join(directory, "formulas.npy"), formulas)
+    np.save(os.path.join(directory, "thickness.npy"), thickness)
+    np.save(os.path.join(directory, "features.npy"), features)
+    manifest = {
+        "version": str(version),
+        "sha256": digest,
+        "n_rows": int(len(formulas)),
+        "feature_columns": columns,
+        "source": os.path.basename(csv_path),
+    }
+    with open(os.path.join(directory, manifest_name), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return digest
+
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("Usage: python reference_data.py <thickness.csv> <output directory> [version]")
+        sys.exit(1)
+    from predict_thickness_2D import formula_features
+
+    digest = build_reference_dataset(sys.argv[1], sys.argv[2], formula_features,
+                                     version=sys.argv[3] if len(sys.argv) > 3 else "1")
+    print(f"Reference dataset written to {sys.argv[2]} (sha256 {digest})")
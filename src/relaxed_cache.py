@@ -0,0 +1,210 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+# Content-addressed store of relaxed structures (relaxed_cache in thick2dtool.in).
+# A structure is reduced to its spglib-standardized primitive cell. Its bucket
+# is the hash of the formula, space group, atoms in the primitive cell and the
+# DFT settings tag; its key adds the (species, site symmetry) sites and the rounded
+# lattice parameters. An entry is a directory
+#   <cache>/<bucket>/<key>-<id>/   input.extxyz  relaxed.extxyz  meta.json
+# written to a temporary name and renamed, so concurrent batch jobs can share a
+# cache. A lookup tries the entries with the same key first and then the rest of
+# the bucket; either way the match is confirmed with tolerances on the lattice
+# parameters and on the nearest-neighbour distances of every species, so
+# rounding at a bin edge, a supercell or a shifted origin still finds the entry.
+
+import os
+import json
+import time
+import hashlib
+import numpy as np
+
+
+default_relaxed_cache = os.path.join(os.path.expanduser("~"), ".thick2d", "relaxed_structures")
+
+# Calculator settings that do not change the relaxed structure
+volatile_settings = ("kpar", "npar", "ncore", "istart", "icharg", "lwave", "lcharg", "directory", "command",
+                     "txt", "outdir", "restart_mode", "pseudo_dir", "prefix")
+
+
+
+def _digest(obj):
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+
+
+def settings_tag(code_type, settings, ignore=volatile_settings):
+    """Hash of the DFT code and calculator settings, without parallelization, restart and path keys."""
+    def strip(value):
+        if isinstance(value, dict):
+            return {str(k): strip(v) for k, v in value.items() if str(k).lower() not in ignore}
+        if isinstance(value, (list, tuple, np.ndarray)):
+            return [strip(v) for v in value]
+        if isinstance(value, np.generic):
+            return value.item()
+        return value
+    return _digest([code_type.upper(), strip(settings)])[:16]
+
+
+
+def standardized_primitive(atoms, symprec=1e-2):
+    """spglib-standardized primitive cell of `atoms` and its symmetry dataset."""
+    import spglib
+    from ase import Atoms
+
+    cell = (np.asarray(atoms.cell), atoms.get_scaled_positions(wrap=True), atoms.numbers)
+    standardized = spglib.standardize_cell(cell, to_primitive=True, symprec=symprec)
+    if standardized is None:
+        primitive = Atoms(numbers=atoms.numbers, cell=atoms.cell, scaled_positions=atoms.get_scaled_positions(wrap=True), pbc=True)
+    else:
+        lattice, positions, numbers = standardized
+        primitive = Atoms(numbers=numbers, cell=lattice, scaled_positions=positions, pbc=True)
+    dataset = spglib.get_symmetry_dataset((np.asarray(primitive.cell), primitive.get_scaled_positions(), primitive.numbers),
+                                          symprec=symprec)
+    return primitive, dataset
+
+
+
+def structure_keys(atoms, tag="", symprec=1e-2, length_step=0.05, angle_step=0.5):
+    """
+    Canonical hashes of a structure.
+
+    Returns:
+    - (str, str, Atoms): Bucket hash (formula, space group, primitive size, tag),
+      key hash (bucket plus site symmetries and rounded lattice) and the standardized primitive cell.
+    """
+    primitive, dataset = standardized_primitive(atoms, symprec)
+    number = int(dataset.number) if dataset is not None else 1
+    # Site symmetries, unlike Wyckoff letters, do not depend on the origin spglib picks
+    site_symmetries = list(dataset.site_symmetry_symbols) if dataset is not None else ["1"] * len(primitive)
+    bucket = _digest([primitive.get_chemical_formula(mode="hill"), number, len(primitive), tag])[:24]
+    cellpar = primitive.cell.cellpar()
+    rounded = [round(v / length_step) for v in cellpar[:3]] + [round(v / angle_step) for v in cellpar[3:]]
+    sites = sorted(zip(primitive.get_chemical_symbols(), site_symmetries))
+    return bucket, _digest([bucket, sites, rounded])[:24], primitive
+
+
+
+def distance_fingerprints(atoms, neighbours=12, cutoff=6.0):
+    """Per species, the sorted distances of every atom to its `neighbours` nearest atoms."""
+    from ase.neighborlist import neighbor_list
+
+    i, d = neighbor_list("id", atoms, cutoff)
+    symbols = np.array(atoms.get_chemical_symbols())
+    fingerprints = {}
+    for species in set(symbols):
+        rows = []
+        for index in np.flatnonzero(symbols == species):
+            nearest = np.sort(d[i == index])[:neighbours]
+            rows.append(np.pad(nearest, (0, neighbours - len(nearest)), constant_values=cutoff))
+        fingerprints[species] = np.sort(np.concatenate(rows))
+    return fingerprints
+
+
+
+def structures_match(a, b, ltol=0.02, angle_tol=1.0, stol=0.05, symprec=1e-2, primitive=False):
+    """
+    True if two structures are the same within tolerances: relative lattice
+    lengths `ltol` and angles `angle_tol` (degrees) of the standardized
+    primitive cells, and `stol` (Å) on the nearest-neighbour distances.
+    primitive=True skips the standardization of cells that already are.
+    """
+    if not primitive:
+        a = standardized_primitive(a, symprec)[0]
+        b = standardized_primitive(b, symprec)[0]
+    if len(a) != len(b) or sorted(a.get_chemical_symbols()) != sorted(b.get_chemical_symbols()):
+        return False
+    pa, pb = a.cell.cellpar(), b.cell.cellpar()
+    if np.any(np.abs(pa[:3] - pb[:3]) > ltol * np.maximum(pa[:3], pb[:3])) or np.any(np.abs(pa[3:] - pb[3:]) > angle_tol):
+        return False
+    fa, fb = distance_fingerprints(a), distance_fingerprints(b)
+    return all(np.abs(fa[s] - fb[s]).max() <= stol for s in fa)
+
+
+
+class RelaxedStructureCache:
+    """
+    Relaxed structures keyed by canonical structure hashes (see module comment).
+
+    Usage:
+        cache = RelaxedStructureCache(directory)
+        relaxed = cache.lookup(atoms, tag)            # None on a miss
+        cache.store(atoms, relaxed, tag, source=os.getcwd())
+    """
+
+    def __init__(self, directory=None, symprec=1e-2):
+        self.directory = directory or default_relaxed_cache
+        self.symprec = symprec
+
+    def _entries(self, bucket, key):
+        bucket_dir = os.path.join(self.directory, bucket)
+        if not os.path.isdir(bucket_dir):
+            return []
+        names = [n for n in os.listdir(bucket_dir) if not n.startswith(".")]
+        # Entries with the same key first, the rest of the bucket as the tolerance fallback
+        names.sort(key=lambda n: (not n.startswith(key + "-"), n))
+        return [os.path.join(bucket_dir, n) for n in names]
+
+    def find(self, atoms, tag=""):
+        """Directory of the entry matching `atoms`, or None."""
+        from ase.io import read
+
+        bucket, key, primitive = structure_keys(atoms, tag, self.symprec)
+        for entry in self._entries(bucket, key):
+            try:
+                cached = standardized_primitive(read(os.path.join(entry, "input.extxyz")), self.symprec)[0]
+            except Exception:
+                continue
+            if structures_match(primitive, cached, symprec=self.symprec, primitive=True):
+                return entry
+        return None
+
+    def lookup(self, atoms, tag=""):
+        """Relaxed structure of a matching entry (in the cell of that entry), or None."""
+        from ase.io import read
+
+        entry = self.find(atoms, tag)
+        if entry is None:
+            return None
+        with open(os.path.join(entry, "meta.json"), "r") as f:
+            meta = json.load(f)
+        print(f"Relaxed structure found in the relaxed-structure cache ({meta.get('source', entry)})")
+        return read(os.path.join(entry, "relaxed.extxyz"))
+
+    def store(self, atoms, relaxed, tag="", **metadata):
+        """Add a relaxation unless a matching entry exists. Returns the entry directory."""
+        from ase import Atoms
+        from ase.io import write
+
+        entry = self.find(atoms, tag)
+        if entry is not None:
+            return entry
+        bucket, key, _ = structure_keys(atoms, tag, self.symprec)
+        bucket_dir = os.path.join(self.directory, bucket)
+        os.makedirs(bucket_dir, exist_ok=True)
+        entry_id = hashlib.sha256(f"{os.getpid()} {time.time()}".encode()).hexdigest()[:8]
+        tmp_dir = os.path.join(bucket_dir, f".{key}-{entry_id}.tmp")
+        os.makedirs(tmp_dir)
+        for name, structure in (("input.extxyz", atoms), ("relaxed.extxyz", relaxed)):
+            # Geometry only: an attached calculator is not written (or run)
+            write(os.path.join(tmp_dir, name), Atoms(numbers=structure.numbers, positions=structure.positions,
+                                                     cell=structure.cell, pbc=structure.pbc))
+        meta = {"formula": atoms.get_chemical_formula(mode="hill"), "tag": tag, "key": key,
+                "created": time.time(), **metadata}
+        with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+            json.dump(meta, f, indent=2, default=str)
+        entry = os.path.join(bucket_dir, f"{key}-{entry_id}")
+        os.rename(tmp_dir, entry)
+        return entry
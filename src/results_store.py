@@ -0,0 +1,295 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+# Indexed SQLite store of thickness results (thick2d_results.db).
+# thick2d adds a row per predicted structure next to thick2d.out and
+# structure_thickness.txt, executors.py gathers the rows of a batch in
+# <batch>/thick2d_results.db, and active_learning.py records DFT thicknesses.
+# Every row keeps the reduced formula, material ID, thickness and spread, the
+# model version (model type and reference-dataset hash), its source
+#   ML       predicted by the thickness model
+#   DFT      relaxed-layer extent from a DFT relaxation (active_learning.py)
+#   lookup   imported from a thickness table, e.g. the shipped ThicknessDatabase
+# and the stage timings as JSON. Formula, thickness and material ID are indexed,
+# and a (element, result) table answers element membership, so questions such as
+# "Mo-containing materials thinner than 7 Å" do not scan the table.
+#
+#   python results_store.py query [--db thick2d_results.db] [--element Mo] [--max-thickness 7]
+#   python results_store.py import <structure_thickness.txt> ... [--source lookup] [--model-version NAME]
+
+import os
+import sys
+import json
+import sqlite3
+import argparse
+from datetime import datetime
+from structure_io import formula_counts, reduced_formula
+
+
+results_db_name = "thick2d_results.db"
+result_sources = ("ML", "DFT", "lookup")
+
+_schema = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    formula TEXT NOT NULL,
+    name TEXT,
+    material_id TEXT,
+    thickness REAL NOT NULL,
+    spread REAL,
+    model_version TEXT,
+    source TEXT NOT NULL,
+    timings TEXT,
+    created TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_formula ON results (formula);
+CREATE INDEX IF NOT EXISTS results_thickness ON results (thickness);
+CREATE INDEX IF NOT EXISTS results_material_id ON results (material_id);
+CREATE TABLE IF NOT EXISTS result_elements (
+    element TEXT NOT NULL,
+    result_id INTEGER NOT NULL,
+    PRIMARY KEY (element, result_id)
+) WITHOUT ROWID;
+"""
+
+_columns = ("id", "formula", "name", "material_id", "thickness", "spread", "model_version", "source", "timings", "created")
+
+
+
+def formula_key(formula):
+    """
+    Reduced Hill formula and elements of a formula or structure name
+    ('Mo2S4' -> 'MoS2', ['Mo', 'S']); formulas with fractional counts are kept as given.
+    """
+    counts = formula_counts(formula)
+    if not counts:
+        raise ValueError(f"No elements in formula '{formula}'")
+    if all(float(n).is_integer() for n in counts.values()):
+        return reduced_formula(counts), sorted(counts)
+    return formula.strip(), sorted(counts)
+
+
+
+def model_version(model_dir, model_type):
+    """
+    Model type and the first 12 characters of the hash of the reference
+    dataset the saved model of `model_dir` was trained on ('classic/7a1c536c41ec').
+    """
+    from model_export import load_feature_schema
+
+    schema = load_feature_schema(model_dir) or {}
+    sha256 = schema.get("dataset_sha256")
+    return f"{model_type}/{sha256[:12]}" if sha256 else model_type
+
+
+
+class ResultsStore:
+    """
+    Thickness results with formula, element-membership and thickness indexes.
+
+    Usage:
+        with ResultsStore("thick2d_results.db") as store:
+            store.add("MoS2", 6.5, material_id="mp-2815", model_version="classic/7a1c536c41ec")
+            thin = store.query(elements=["Mo"], max_thickness=7.0)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def _insert(self, row, created):
+        source = row.get("source", "ML")
+        if source not in result_sources:
+            raise ValueError(f"Unknown result source '{source}'; expected one of {', '.join(result_sources)}")
+        name = row["formula"]
+        formula, elements = formula_key(name)
+        spread = row.get("spread")
+        timings = row.get("timings")
+        cursor = self.conn.execute(
+            "INSERT INTO results (formula, name, material_id, thickness, spread, model_version, source, timings, created) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (formula, name, row.get("material_id"), float(row["thickness"]),
+             None if spread is None else float(spread), row.get("model_version"), source,
+             json.dumps(timings) if timings else None, created))
+        self.conn.executemany("INSERT INTO result_elements (element, result_id) VALUES (?, ?)",
+                              [(element, cursor.lastrowid) for element in elements])
+        return cursor.lastrowid
+
+    def add(self, formula, thickness, material_id=None, spread=None, model_version=None, source="ML", timings=None):
+        """
+        Store one result.
+
+        Args:
+        - formula (str): Formula or structure name; it is stored as given and as reduced Hill formula.
+        - thickness (float): Thickness in Å.
+        - material_id (str or None): Material ID (structure file name, database ID, ...).
+        - spread (float or None): Uncertainty of the thickness in Å.
+        - model_version (str or None): See model_version().
+        - source (str): 'ML', 'DFT' or 'lookup'.
+        - timings (dict or None): Stage wall times in s, e.g. {'predict_s': 1.2}.
+
+        Returns:
+        - int: Row ID of the result.
+        """
+        return self.add_many([{"formula": formula, "thickness": thickness, "material_id": material_id,
+                               "spread": spread, "model_version": model_version, "source": source,
+                               "timings": timings}])[0]
+
+    def add_many(self, rows):
+        """Store dicts with the keys of add() in one transaction. Returns their row IDs."""
+        created = datetime.now().isoformat(timespec="seconds")
+        with self.conn:
+            return [self._insert(row, created) for row in rows]
+
+    def query(self, elements=(), formula=None, min_thickness=None, max_thickness=None, source=None,
+              material_id=None, limit=None):
+        """
+        Results that contain all `elements` and match the other filters, thinnest first.
+
+        Args:
+        - elements (iterable): Element symbols every result must contain.
+        - formula (str or None): Formula, compared after reduction ('Mo2S4' matches 'MoS2').
+        - min_thickness (float or None): Smallest thickness in Å (inclusive).
+        - max_thickness (float or None): Thickness in Å the results are thinner than (exclusive).
+        - source (str or None): 'ML', 'DFT' or 'lookup'.
+        - material_id (str or None): Material ID.
+        - limit (int or None): Largest number of results.
+
+        Returns:
+        - list: dicts with the columns of the results table (timings decoded).
+        """
+        clauses, params = [], []
+        for element in elements:
+            clauses.append("id IN (SELECT result_id FROM result_elements WHERE element = ?)")
+            params.append(element)
+        if formula is not None:
+            clauses.append("formula = ?")
+            params.append(formula_key(formula)[0])
+        if min_thickness is not None:
+            clauses.append("thickness >= ?")
+            params.append(float(min_thickness))
+        if max_thickness is not None:
+            clauses.append("thickness < ?")
+            params.append(float(max_thickness))
+        if source is not None:
+            clauses.append("source = ?")
+            params.append(source)
+        if material_id is not None:
+            clauses.append("material_id = ?")
+            params.append(material_id)
+        sql = f"SELECT {', '.join(_columns)} FROM results"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY thickness, id"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [self._as_dict(row) for row in self.conn.execute(sql, params)]
+
+    def latest(self):
+        """The most recently stored result, or None."""
+        row = self.conn.execute(f"SELECT {', '.join(_columns)} FROM results ORDER BY id DESC LIMIT 1").fetchone()
+        return None if row is None else self._as_dict(row)
+
+    @staticmethod
+    def _as_dict(row):
+        result = dict(zip(_columns, row))
+        result["timings"] = json.loads(result["timings"]) if result["timings"] else {}
+        return result
+
+    def import_thickness_file(self, path, source="lookup", model_version=None):
+        """
+        Store the rows of a structure_thickness.txt-style table
+        ('<material>, <thickness> [, <material id> [, <spread>]]').
+
+        Returns:
+        - int: Number of rows stored.
+        """
+        from executors import read_thickness_rows
+
+        rows = [{"formula": material, "thickness": thickness, "material_id": material_id, "spread": spread,
+                 "model_version": model_version, "source": source}
+                for material, thickness, material_id, spread in read_thickness_rows(path)]
+        return len(self.add_many(rows))
+
+
+
+def latest_result(path):
+    """The last result of the results database at `path`, or None when there is none."""
+    if not os.path.isfile(path):
+        return None
+    with ResultsStore(path) as store:
+        return store.latest()
+
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Query or fill a THICK2D results database.")
+    parser.add_argument("--db", default=results_db_name, help=f"results database (default: ./{results_db_name})")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    query = commands.add_parser("query", help="list results, thinnest first")
+    query.add_argument("--element", action="append", default=[], help="element every result contains (repeatable)")
+    query.add_argument("--formula", default=None)
+    query.add_argument("--min-thickness", type=float, default=None)
+    query.add_argument("--max-thickness", type=float, default=None, help="only results thinner than this (Å)")
+    query.add_argument("--source", choices=result_sources, default=None)
+    query.add_argument("--material-id", default=None)
+    query.add_argument("--limit", type=int, default=None)
+
+    imports = commands.add_parser("import", help="store the rows of structure_thickness.txt files")
+    imports.add_argument("files", nargs="+")
+    imports.add_argument("--source", choices=result_sources, default="lookup")
+    imports.add_argument("--model-version", default=None)
+    args = parser.parse_args(argv)
+
+    if args.command == "query" and not os.path.isfile(args.db):
+        print(f"No results database {args.db}")
+        return 1
+
+    with ResultsStore(args.db) as store:
+        if args.command == "import":
+            for path in args.files:
+                added = store.import_thickness_file(path, args.source, args.model_version)
+                print(f"{added} results of {path} stored in {args.db}")
+            return 0
+
+        results = store.query(args.element, args.formula, args.min_thickness, args.max_thickness, args.source,
+                              args.material_id, args.limit)
+        print("#Material, Thickness (Ang), Material_id, Spread (Ang), Source, Model version")
+        for r in results:
+            spread = "" if r["spread"] is None else r["spread"]
+            print(f"{r['name']}, {r['thickness']}, {r['material_id'] or ''}, {spread}, {r['source']}, "
+                  f"{r['model_version'] or ''}")
+        print(f"{len(results)} results")
+    return 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
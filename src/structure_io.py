@@ -0,0 +1,444 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+import os
+import re
+import json
+import pickle
+import hashlib
+import zipfile
+import tarfile
+from io import StringIO
+from contextlib import nullcontext
+from collections import Counter
+from functools import reduce
+from math import gcd
+
+
+archive_extensions = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz", ".zip")
+container_extensions = (".extxyz", ".traj", ".db") + archive_extensions
+archive_member_extensions = (".cif", ".vasp", ".poscar")
+# Frame / row keys holding the material id of a structure in a container
+id_keys = ("material_id", "mat_id", "name")
+
+_cif_token = re.compile(r"'[^']*'|\"[^\"]*\"|\S+")
+_element_symbol = re.compile(r"([A-Z][a-z]?)")
+_formula_count = re.compile(r"([A-Z][a-z]?)(\d*\.?\d*)|([(\[])|([)\]])(\d*\.?\d*)")
+
+_symop_tags = ("_space_group_symop_operation_xyz", "_symmetry_equiv_pos_as_xyz")
+_spacegroup_number_tags = ("_space_group_it_number", "_symmetry_int_tables_number")
+_spacegroup_name_tags = ("_space_group_name_h-m_alt", "_symmetry_space_group_name_h-m")
+
+
+
+def _cif_tokens(line):
+    return [tok[1:-1] if tok[0] in "'\"" else tok for tok in _cif_token.findall(line)]
+
+
+
+def _element_from_site(symbol):
+    match = _element_symbol.match(symbol.strip())
+    return match.group(1) if match else None
+
+
+
+def scan_cif(filename):
+    """
+    Stream a CIF file once and collect the header items and the _atom_site_ loop.
+
+    Only the first data block is read. No coordinates are converted and no Atoms
+    object is built.
+
+    Args:
+    - filename (str or file): Path to the CIF file, or an open text stream.
+
+    Returns:
+    - (dict, dict): Single-valued items (lower-case tag -> value) and the
+      atom-site / symmetry-operation loops (lower-case tag -> list of values).
+    """
+    items = {}
+    loops = {}
+    loop_tags = None
+    loop_values = []
+    in_text_field = False
+    blocks = 0
+    pending_tag = None
+
+    def close_loop():
+        if loop_tags:
+            n = len(loop_tags)
+            for i, tag in enumerate(loop_tags):
+                loops[tag] = loop_values[i::n][:len(loop_values) // n]
+
+    with open(filename, "r", errors="replace") if isinstance(filename, (str, os.PathLike)) else nullcontext(filename) as f:
+        for raw in f:
+            if in_text_field:
+                if raw.startswith(";"):
+                    in_text_field = False
+                    if pending_tag is not None:
+                        items[pending_tag] = ""
+                        pending_tag = None
+                    elif loop_tags is not None:
+                        loop_values.append("")
+                continue
+            if raw.startswith(";"):
+                in_text_field = True
+                continue
+
+            line = raw.strip()
+            if not line or line.startswith("#"):
+                continue
+            lower = line.lower()
+
+            if lower.startswith("data_"):
+                blocks += 1
+                if blocks > 1:
+                    break
+                continue
+
+            if lower.startswith("loop_"):
+                close_loop()
+                loop_tags, loop_values = [], []
+                continue
+
+            if line.startswith("_"):
+                tokens = _cif_tokens(line)
+                tag = tokens[0].lower()
+                if loop_tags is not None and not loop_values:
+                    loop_tags.append(tag)
+                    continue
+                close_loop()
+                loop_tags, loop_values = None, []
+                if len(tokens) > 1:
+                    items[tag] = " ".join(tokens[1:])
+                else:
+                    pending_tag = tag
+                continue
+
+            if pending_tag is not None:
+                items[pending_tag] = " ".join(_cif_tokens(line))
+                pending_tag = None
+            elif loop_tags is not None:
+                loop_values.extend(_cif_tokens(line))
+
+    close_loop()
+    return items, loops
+
+
+
+def _as_float(value, default=None):
+    try:
+        return float(re.sub(r"\(\d+\)$", "", value))
+    except (TypeError, ValueError):
+        return default
+
+
+
+def _is_p1(items, loops):
+    for tag in _symop_tags:
+        if tag in loops:
+            return len(loops[tag]) == 1
+        if tag in items:
+            return True
+    for tag in _spacegroup_number_tags:
+        if tag in items:
+            return _as_float(items[tag]) == 1
+    for tag in _spacegroup_name_tags:
+        if tag in items:
+            return items[tag].replace(" ", "").upper() == "P1"
+    return False
+
+
+
+def _round_counts(counts):
+    rounded = {}
+    for symbol, count in counts.items():
+        if abs(count - round(count)) > 1e-3 or round(count) < 1:
+            return None
+        rounded[symbol] = int(round(count))
+    return rounded
+
+
+
+def read_cif_formula(filename):
+    """
+    Read the cell composition of a CIF file without a full ASE parse.
+
+    The atom-site labels (or type symbols) and occupancies are summed in a single
+    pass. This is only exact when the sites are already the full cell, so the
+    scan is trusted for P1 files, for files that carry
+    _atom_site_symmetry_multiplicity, or for files with both
+    _chemical_formula_sum and _cell_formula_units_Z.
+
+    Args:
+    - filename (str or file): Path to the CIF file, or an open text stream.
+
+    Returns:
+    - dict or None: Element symbol -> number of atoms in the cell, or None if the
+      composition cannot be determined without expanding the symmetry.
+    """
+    items, loops = scan_cif(filename)
+
+    symbols = loops.get("_atom_site_type_symbol") or loops.get("_atom_site_label")
+    if symbols:
+        occupancies = loops.get("_atom_site_occupancy", [])
+        multiplicities = loops.get("_atom_site_symmetry_multiplicity")
+        if multiplicities is None and not _is_p1(items, loops):
+            symbols = None
+        else:
+            counts = Counter()
+            for i, site in enumerate(symbols):
+                element = _element_from_site(site)
+                if element is None:
+                    return None
+                occupancy = _as_float(occupancies[i], 1.0) if i < len(occupancies) else 1.0
+                multiplicity = _as_float(multiplicities[i], 1.0) if multiplicities else 1.0
+                counts[element] += occupancy * multiplicity
+            return _round_counts(counts)
+
+    formula_sum = items.get("_chemical_formula_sum")
+    z = _as_float(items.get("_cell_formula_units_z"))
+    if formula_sum and z:
+        counts = Counter()
+        for element, count in re.findall(r"([A-Z][a-z]?)\s*([0-9.]*)", formula_sum):
+            counts[element] += (float(count) if count else 1.0) * z
+        return _round_counts(counts)
+
+    return None
+
+
+
+def hill_formula(counts):
+    """
+    Build a Hill-ordered formula (the ordering of Atoms.get_chemical_formula(mode='hill')).
+    """
+    if "C" in counts:
+        order = ["C"] + (["H"] if "H" in counts else []) + sorted(s for s in counts if s not in ("C", "H"))
+    else:
+        order = sorted(counts)
+    return "".join(f"{s}{counts[s] if counts[s] > 1 else ''}" for s in order)
+
+
+
+def reduced_formula(counts):
+    """Hill formula of the element counts divided by their greatest common divisor."""
+    counts = {s: int(round(n)) for s, n in counts.items()}
+    divisor = reduce(gcd, counts.values())
+    return hill_formula({s: n // divisor for s, n in counts.items()})
+
+
+
+def formula_counts(formula):
+    """
+    Element counts of a formula, with parenthesized (or bracketed) groups
+    expanded, e.g. 'Mo2S4' -> {'Mo': 2, 'S': 4}, 'Ca(OH)2' -> {'Ca': 1, 'O': 2, 'H': 2}.
+    An unmatched closing bracket is ignored and an unclosed group counts once.
+    """
+    groups = [Counter()]
+    for symbol, count, opening, closing, multiplier in _formula_count.findall(formula):
+        if symbol:
+            groups[-1][symbol] += float(count) if count else 1
+        elif opening:
+            groups.append(Counter())
+        elif len(groups) > 1:
+            group = groups.pop()
+            factor = float(multiplier) if multiplier else 1
+            for element, n in group.items():
+                groups[-1][element] += n * factor
+    while len(groups) > 1:
+        groups[-2].update(groups.pop())
+    return dict(groups[0])
+
+
+
+def file_digest(filename, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(filename, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+
+def _atomic_dump(obj, path, dump, mode):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, mode) as f:
+        dump(obj, f)
+    os.replace(tmp_path, path)
+
+
+
+def read_structure(filename, cache_dir=None):
+    """
+    Read a structure file into memory, optionally through a parsed-structure cache.
+
+    The cache holds pickled Atoms objects named by the SHA-256 of the file
+    content, plus a small per-path index with the mtime and size seen when the
+    file was last hashed. An unchanged file is therefore served from the cache
+    without being hashed or parsed, a touched-but-identical file is rehashed
+    only, and identical files in different directories share one entry.
+
+    Args:
+    - filename (str): Path to the structure file (any format ase.io.read accepts).
+    - cache_dir (str or None): Cache directory; None disables caching.
+
+    Returns:
+    - Atoms: The parsed structure.
+    """
+    from ase.io import read
+
+    if not cache_dir:
+        return read(filename)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    path = os.path.abspath(filename)
+    stat = os.stat(path)
+    index_file = os.path.join(cache_dir, hashlib.sha1(path.encode()).hexdigest() + ".json")
+
+    digest = None
+    try:
+        with open(index_file, "r") as f:
+            index = json.load(f)
+        if index["mtime_ns"] == stat.st_mtime_ns and index["size"] == stat.st_size:
+            digest = index["sha256"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    if digest is None:
+        digest = file_digest(path)
+        _atomic_dump({"path": path, "mtime_ns": stat.st_mtime_ns, "size": stat.st_size, "sha256": digest},
+                     index_file, json.dump, "w")
+
+    atoms_file = os.path.join(cache_dir, digest + ".pkl")
+    try:
+        with open(atoms_file, "rb") as f:
+            return pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError):
+        pass
+
+    atoms = read(filename)
+    _atomic_dump(atoms, atoms_file, pickle.dump, "wb")
+    return atoms
+
+
+
+def read_structure_counts(filename, cache_dir=None):
+    """
+    Return the element counts of a structure file, scanning CIFs directly and
+    falling back to read_structure for everything the scanner cannot resolve.
+    """
+    if os.path.splitext(filename)[1].lower() == ".cif":
+        counts = read_cif_formula(filename)
+        if counts is not None:
+            return counts
+
+    return dict(Counter(read_structure(filename, cache_dir=cache_dir).get_chemical_symbols()))
+
+
+
+def is_structure_container(filename):
+    """True for multi-structure inputs: extxyz, ASE trajectory or database, tar or zip archive."""
+    return filename.lower().endswith(container_extensions)
+
+
+
+def _material_id(name):
+    return os.path.splitext(os.path.basename(name))[0]
+
+
+
+def _archive_members(filename):
+    """(member name, text) of the structure files of a tar or zip archive, one member at a time."""
+    if zipfile.is_zipfile(filename):
+        with zipfile.ZipFile(filename) as archive:
+            for info in archive.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(archive_member_extensions):
+                    yield info.filename, archive.read(info).decode(errors="replace")
+    else:
+        # Stream mode: members are read in archive order without seeking back
+        with tarfile.open(filename, "r|*") as archive:
+            for member in archive:
+                if member.isfile() and member.name.lower().endswith(archive_member_extensions):
+                    yield member.name, archive.extractfile(member).read().decode(errors="replace")
+
+
+
+def _member_format(name):
+    return "cif" if name.lower().endswith(".cif") else "vasp"
+
+
+
+def iter_structures(filename):
+    """
+    Stream the structures of a multi-structure input without loading it whole.
+
+    extxyz and trajectory files are read frame by frame with ase.io.iread, ASE
+    databases row by row, and tar/zip archives member by member. The material
+    id is the material_id/name of the frame or row (else <file>_<index>) or the
+    member file name without its extension.
+
+    Yields:
+    - (str, Atoms): Material id and structure.
+    """
+    from ase.io import iread, read
+
+    stem = _material_id(filename)
+    lower = filename.lower()
+    if lower.endswith(archive_extensions):
+        for name, text in _archive_members(filename):
+            yield _material_id(name), read(StringIO(text), format=_member_format(name))
+    elif lower.endswith(".db"):
+        from ase.db import connect
+        for row in connect(filename).select():
+            yield _row_material_id(row, stem), row.toatoms()
+    else:
+        for index, atoms in enumerate(iread(filename, index=":")):
+            info = atoms.info
+            material_id = next((str(info[k]) for k in id_keys if k in info), f"{stem}_{index}")
+            yield material_id, atoms
+
+
+
+def _row_material_id(row, stem):
+    return next((str(row.get(k)) for k in id_keys if row.get(k) is not None), f"{stem}_{row.id}")
+
+
+
+def iter_structure_counts(filename):
+    """
+    Stream the element counts of a multi-structure input (see iter_structures).
+    CIF members of archives are scanned as in read_cif_formula and database rows
+    give their symbols, so no Atoms object is built for them.
+
+    Yields:
+    - (str, dict): Material id and element symbol -> number of atoms in the cell.
+    """
+    lower = filename.lower()
+    if lower.endswith(archive_extensions):
+        from ase.io import read
+        for name, text in _archive_members(filename):
+            counts = read_cif_formula(text.splitlines(keepends=True)) if name.lower().endswith(".cif") else None
+            if counts is None:
+                counts = dict(Counter(read(StringIO(text), format=_member_format(name)).get_chemical_symbols()))
+            yield _material_id(name), counts
+    elif lower.endswith(".db"):
+        from ase.db import connect
+        stem = _material_id(filename)
+        for row in connect(filename).select():
+            yield _row_material_id(row, stem), dict(Counter(row.symbols))
+    else:
+        for material_id, atoms in iter_structures(filename):
+            yield material_id, dict(Counter(atoms.get_chemical_symbols()))
+
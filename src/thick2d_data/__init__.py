@@ -0,0 +1,6 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  Data files shipped with THICK2D (see reference_data.py).
+
+"""
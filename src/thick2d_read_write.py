@@ -16,20 +16,29 @@
 import sys
 import os
 import json
-from ase.io import read, write
 import shutil
 import glob
 from math import gcd
 import re
 import subprocess
+from structure_io import read_structure, read_structure_counts
 from write_inputs import write_default_input, write_default_ystool_in, print_default_input_message_0, print_default_input_message_1, print_default_input_message_0
 
 
 
-def append_data(filename,structure_name, thicknessval,matid=None):
+def append_data(filename,structure_name, thicknessval,matid=None,spread=None):
+    append_rows(filename, [(structure_name, thicknessval, matid, spread)])
+
+
+
+def append_rows(filename, rows):
+    """Append (structure name, thickness, material id, spread) rows to a structure_thickness.txt with one open."""
     with open(filename, 'a') as file:
-        matid_str = f", {matid}" if matid is not None else ""
-        file.write(f"{structure_name}, {thicknessval} {matid_str}\n")
+        for structure_name, thicknessval, matid, spread in rows:
+            # An empty material id field keeps the spread in the fourth column
+            matid_str = f", {matid}" if matid is not None else (", " if spread is not None else "")
+            spread_str = f", {spread}" if spread is not None else ""
+            file.write(f"{structure_name}, {thicknessval} {matid_str}{spread_str}\n")
         
     
             
@@ -75,9 +84,13 @@ def read_options_from_input():
         'add_thickness_data': False,
         'vdwgap': 3.5,
         'throughput': False,
+        'export_model': True,
+        'tune_hyperparameters': False,
+        'optimize_noise': False,
         'custom_options': {},  # to store user-defined options
         'job_submit_command': None,
         'structure_file': None,
+        'structure_cache': None,
     }
 
     try:
@@ -93,13 +106,13 @@ def read_options_from_input():
                 key = key.strip()
                 value = value.strip()
 
-                if key in ["structure_file", "job_submit_command"]:
+                if key in ["structure_file", "job_submit_command", "structure_cache"]:
                     options[key] = value
                 elif key == "components":
                     options[key] = value.split()
                 elif key in ["code_type","model_type"]:
                     options[key] = value.upper()
-                elif key in ["optimize","use_ml_model", "throughput","add_thickness_data"]:
+                elif key in ["optimize","use_ml_model", "throughput","add_thickness_data","export_model","tune_hyperparameters","optimize_noise"]:
                     options[key] = value.lower() in ['true', 'yes', '1','on']
                 elif key in options:
                     if key in ['nlayers','vdwgap','num_augmented_samples']:
@@ -125,14 +138,13 @@ def read_options_from_input():
     return options
 
 
-def load_structure(options):
-    options = read_options_from_input()
+def _locate_structure_file(options):
     filename = options.get('structure_file', None)
     
     if filename:
         if not os.path.exists(filename):
             raise FileNotFoundError(f"Provided file {filename} is not found.")
-        return read(filename)
+        return filename
 
     vasp_files = glob.glob("*.vasp")
     cif_files = glob.glob("*.cif")
@@ -148,20 +160,40 @@ def load_structure(options):
             raise RuntimeError("Both VASP and CIF files are present with the same basename. Ambiguous input.")
 
     if vasp_files:
-        return read(vasp_files[0])
+        return vasp_files[0]
     elif cif_files:
-        cif_filename = cif_files[0]
-        vasp_equivalent = os.path.splitext(cif_filename)[0] + ".vasp"
-        cif_orig = os.path.splitext(cif_filename)[0] + "_orig.cif"
-        
-        convert_cif_to_vasp(cif_filename, vasp_equivalent)  
-        os.rename(cif_filename, cif_orig)
-        
-        return read(vasp_equivalent)
+        return cif_files[0]
     else:
         raise FileNotFoundError("Neither VASP nor CIF file is found.")
 
 
+def load_structure(options):
+    """
+    Load the input structure into memory.
+
+    The file is read as-is (no .vasp copy is written and the CIF is not
+    renamed). With `structure_cache = <dir>` in thick2dtool.in, parsed
+    structures are reused across runs until the file changes.
+    """
+    options = read_options_from_input()
+    filename = _locate_structure_file(options)
+    return read_structure(filename, cache_dir=options.get('structure_cache'))
+
+
+def load_structure_composition(options):
+    """
+    Return the element counts of the input structure for composition-only runs.
+
+    CIF files are scanned for their atom sites instead of being parsed into an
+    Atoms object, and no .vasp copy is written. Use load_structure when the
+    coordinates are needed (e.g. optimize = True).
+
+    Returns:
+    - dict: Element symbol -> number of atoms in the cell.
+    """
+    return read_structure_counts(_locate_structure_file(options), cache_dir=options.get('structure_cache'))
+
+
 
 def convert_cif_to_vasp(cif_file, vasp_file):
     """
@@ -172,6 +204,8 @@ def convert_cif_to_vasp(cif_file, vasp_file):
     - vasp_file (str): Path to the output VASP file.
     """
     
+    from ase.io import read, write
+
     # Read the structure from the CIF file
     atoms = read(cif_file)
 
@@ -0,0 +1,238 @@
+"""
+  THICK2D -- Thickness Hierarchy Inference & Calculation Kit for 2D materials
+
+  This program is free software; you can redistribute it and/or modify it under the
+  terms of the GNU General Public License as published by the Free Software Foundation
+  version 3 of the License.
+
+  This program is distributed in the hope that it will be useful, but WITHOUT ANY
+  WARRANTY; without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+  PARTICULAR PURPOSE.  See the GNU General Public License for more details.
+
+  Email: cekuma1@gmail.com
+
+"""
+
+# Incremental SQLite store for user thickness data (add_thickness_data = True).
+# mat_thickness.txt is read from the byte offset reached by the previous run, so
+# appending rows costs O(new rows). Each formula keeps a running sum and count of
+# its thicknesses and, once computed, its feature vector, so only new formulas
+# are featurized. The sums and counts contributed by every text file are kept
+# per file, so if one file is truncated or rewritten only that file is
+# re-ingested from its start (keeping the cached features). A rewrite is detected
+# from the file size and a hash of the 4 KiB before the stored offset; an edit
+# earlier in the file that keeps both unchanged is not noticed (remove the .db
+# file to rebuild it after such an edit).
+
+import os
+import json
+import sqlite3
+import hashlib
+import numpy as np
+
+
+_schema = """
+CREATE TABLE IF NOT EXISTS materials (
+    formula TEXT PRIMARY KEY,
+    thickness_sum REAL NOT NULL,
+    count INTEGER NOT NULL,
+    features BLOB
+);
+CREATE TABLE IF NOT EXISTS contributions (
+    path TEXT NOT NULL,
+    formula TEXT NOT NULL,
+    thickness_sum REAL NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (path, formula)
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    offset INTEGER NOT NULL,
+    tail_sha256 TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Bytes before the stored offset that are re-hashed to detect a rewritten file
+_tail_bytes = 4096
+
+
+
+def parse_thickness_line(line):
+    """
+    Parse one line of mat_thickness.txt ('<formula> <thickness in Å>').
+    Returns (formula, thickness) or None for blank, comment and malformed lines.
+    """
+    tokens = line.split("#", 1)[0].split()
+    if len(tokens) != 2:
+        return None
+    try:
+        return tokens[0], float(tokens[1])
+    except ValueError:
+        return None
+
+
+
+class ThicknessStore:
+    """
+    Per-formula running thickness sums/counts and cached features in SQLite.
+
+    Usage:
+        with ThicknessStore("mat_thickness.db") as store:
+            store.ingest("mat_thickness.txt")
+            store.update_features(featurize)
+            table, features = store.load()
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.conn.close()
+
+    def _tail_digest(self, f, offset):
+        start = max(0, offset - _tail_bytes)
+        f.seek(start)
+        return hashlib.sha256(f.read(offset - start)).hexdigest()
+
+    def _remove_source(self, source):
+        """Take the rows of one text file out of the per-formula sums and forget its offset."""
+        per_file = self.conn.execute("SELECT COUNT(*) FROM contributions").fetchone()[0]
+        if not per_file:
+            # Stores written before per-file contributions were kept cannot separate the files
+            self.conn.execute("UPDATE materials SET thickness_sum = 0, count = 0")
+            self.conn.execute("DELETE FROM contributions")
+            self.conn.execute("DELETE FROM sources")
+            return
+        self.conn.execute("DELETE FROM contributions WHERE path = ?", (source,))
+        self.conn.execute("DELETE FROM sources WHERE path = ?", (source,))
+        self.conn.execute(
+            "UPDATE materials SET "
+            "thickness_sum = COALESCE((SELECT SUM(c.thickness_sum) FROM contributions c WHERE c.formula = materials.formula), 0), "
+            "count = COALESCE((SELECT SUM(c.count) FROM contributions c WHERE c.formula = materials.formula), 0)")
+
+    def ingest(self, text_path, chunk_rows=10000):
+        """
+        Add the rows of `text_path` appended since the last ingest.
+
+        Returns:
+        - int: Number of new thickness records.
+        """
+        if not os.path.exists(text_path):
+            return 0
+
+        source = os.path.abspath(text_path)
+        row = self.conn.execute("SELECT offset, tail_sha256 FROM sources WHERE path = ?", (source,)).fetchone()
+        offset, tail = row if row else (0, None)
+        n_new = 0
+
+        with open(text_path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if offset and (size < offset or self._tail_digest(f, offset) != tail):
+                print(f"{text_path} was modified; rebuilding the thickness store.")
+                # Keep the cached features; formulas no longer in any file are removed below
+                with self.conn:
+                    self._remove_source(source)
+                offset = 0
+
+            f.seek(offset)
+            pending = {}
+
+            def flush():
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT INTO materials (formula, thickness_sum, count) VALUES (?, ?, ?) "
+                        "ON CONFLICT(formula) DO UPDATE SET "
+                        "thickness_sum = thickness_sum + excluded.thickness_sum, count = count + excluded.count",
+                        [(formula, s, c) for formula, (s, c) in pending.items()])
+                    self.conn.executemany(
+                        "INSERT INTO contributions (path, formula, thickness_sum, count) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(path, formula) DO UPDATE SET "
+                        "thickness_sum = thickness_sum + excluded.thickness_sum, count = count + excluded.count",
+                        [(source, formula, s, c) for formula, (s, c) in pending.items()])
+                    self.conn.execute(
+                        "INSERT OR REPLACE INTO sources (path, offset, tail_sha256) VALUES (?, ?, ?)",
+                        (source, offset, self._tail_digest(f, offset)))
+                    f.seek(offset)
+                pending.clear()
+
+            for line in f:
+                offset += len(line)
+                parsed = parse_thickness_line(line.decode("utf-8", errors="replace"))
+                if parsed is not None:
+                    formula, thickness = parsed
+                    s, c = pending.get(formula, (0.0, 0))
+                    pending[formula] = (s + thickness, c + 1)
+                    n_new += 1
+                if len(pending) >= chunk_rows:
+                    flush()
+            flush()
+
+        with self.conn:
+            self.conn.execute("DELETE FROM materials WHERE count = 0")
+        return n_new
+
+    def update_features(self, featurize, chunk_rows=1000):
+        """
+        Compute the features of formulas that have none yet.
+
+        Args:
+        - featurize (callable): list of formulas -> pd.DataFrame of features
+          (one row per formula, in order). Its columns are recorded; if they
+          change (e.g. another featurizer version), all features are recomputed.
+        """
+        columns = self.feature_columns()
+        while True:
+            formulas = [r[0] for r in self.conn.execute(
+                "SELECT formula FROM materials WHERE features IS NULL ORDER BY formula LIMIT ?", (chunk_rows,))]
+            if not formulas:
+                return
+            features = featurize(formulas)
+            if columns is not None and list(features.columns) != columns:
+                print("Feature columns changed; recomputing the cached features.")
+                with self.conn:
+                    self.conn.execute("UPDATE materials SET features = NULL")
+                columns = None
+                continue
+            values = features.to_numpy(dtype=np.float64)
+            with self.conn:
+                if columns is None:
+                    columns = [str(c) for c in features.columns]
+                    self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('feature_columns', ?)",
+                                      (json.dumps(columns),))
+                self.conn.executemany("UPDATE materials SET features = ? WHERE formula = ?",
+                                      [(values[i].tobytes(), formula) for i, formula in enumerate(formulas)])
+
+    def feature_columns(self):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'feature_columns'").fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load(self):
+        """
+        Returns:
+        - (pd.DataFrame, pd.DataFrame or None): Thickness table (MaterialName,
+          Thickness_Sum, Count) and the cached features indexed by formula.
+        """
+        import pandas as pd
+
+        rows = self.conn.execute("SELECT formula, thickness_sum, count, features FROM materials ORDER BY formula").fetchall()
+        table = pd.DataFrame([r[:3] for r in rows], columns=["MaterialName", "Thickness_Sum", "Count"])
+
+        columns = self.feature_columns()
+        cached = [r for r in rows if r[3] is not None]
+        if columns is None or not cached:
+            return table, None
+        matrix = np.frombuffer(b"".join(r[3] for r in cached), dtype=np.float64).reshape(len(cached), len(columns))
+        features = pd.DataFrame(matrix, columns=columns, index=pd.Index([r[0] for r in cached], name="MaterialName"))
+        return table, features
@@ -0,0 +1,81 @@
+from pathlib import Path
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+HAS_ASE = all(importlib.util.find_spec(m) is not None for m in ("numpy", "ase"))
+
+if HAS_ASE:
+    import numpy as np
+    from ase.build import mx2
+    from ase.io import write
+    from active_learning import (reduced_formula, select_uncertain, nearest_distance, layer_thickness,
+                                 learn_from_jobs, learned_marker)
+    from executors import prepare_batch, set_job_state
+    from results_store import ResultsStore
+
+
+@unittest.skipUnless(HAS_ASE, "numpy/ase are not installed")
+class ActiveLearningTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_reduced_formula_is_hill_ordered(self):
+        self.assertEqual(reduced_formula({"S": 4, "Mo": 2}), "MoS2")
+        self.assertEqual(reduced_formula({"C": 6.0}), "C")
+
+    def test_select_uncertain_takes_the_top_fraction(self):
+        results = [{"file": f"{i}.cif", "uncertainty": u} for i, u in enumerate([0.1, float("inf"), 0.5, 0.2])]
+        self.assertEqual([r["file"] for r in select_uncertain(results, 0.5)], ["1.cif", "2.cif"])
+        self.assertEqual(len(select_uncertain(results, 0.01)), 1)
+        self.assertEqual(select_uncertain(results, 0), [])
+
+    def test_nearest_distance(self):
+        reference = np.array([[0.0, 0.0], [3.0, 4.0]])
+        np.testing.assert_allclose(nearest_distance(np.array([[3.0, 4.0], [0.0, 1.0]]), reference), [0.0, 1.0], atol=1e-7)
+        self.assertTrue(np.isinf(nearest_distance(np.ones((1, 2)), np.zeros((0, 2)))).all())
+
+    def test_layer_thickness_ignores_vacuum(self):
+        atoms = mx2("MoS2", vacuum=8.0)
+        extent = np.ptp(atoms.positions[:, 2])
+        self.assertAlmostEqual(layer_thickness(atoms, vdwgap=3.5), extent + 3.5, places=6)
+        atoms.center(vacuum=15.0, axis=2)
+        self.assertAlmostEqual(layer_thickness(atoms, vdwgap=0.0), extent, places=6)
+
+    def test_learn_from_jobs_appends_each_job_once(self):
+        structures, control = self.root / "structures", self.root / "control"
+        structures.mkdir()
+        control.mkdir()
+        atoms = mx2("MoS2", vacuum=8.0)
+        write(str(structures / "MoS2.cif"), atoms)
+        (control / "thick2dtool.in").write_text("structure_file = x.cif\nvdwgap = 3.0\n")
+        jobs = prepare_batch(str(structures), str(control), str(self.root / "batch"), overrides={"optimize": "True"})
+        self.assertIn("optimize = True\n", (Path(jobs[0]) / "thick2dtool.in").read_text())
+
+        data_path = str(control / "mat_thickness.txt")
+        self.assertEqual(learn_from_jobs(jobs, data_path), 0)
+        os.makedirs(os.path.join(jobs[0], "OPT"))
+        write(os.path.join(jobs[0], "OPT", "optimized_structure.cif"), atoms)
+        set_job_state(jobs[0], "done", [0.0, 1.0])
+        self.assertEqual(learn_from_jobs(jobs, data_path), 1)
+        self.assertEqual(learn_from_jobs(jobs, data_path), 0)
+        self.assertTrue(os.path.exists(os.path.join(jobs[0], learned_marker)))
+
+        formula, thickness = Path(data_path).read_text().split()
+        self.assertEqual(formula, "MoS2")
+        self.assertAlmostEqual(float(thickness), np.ptp(atoms.positions[:, 2]) + 3.0, places=3)
+        with ResultsStore(str(control / "thick2d_results.db")) as store:
+            self.assertEqual([(r["formula"], r["source"]) for r in store.query()], [("MoS2", "DFT")])
+
+
+if __name__ == "__main__":
+    unittest.main()
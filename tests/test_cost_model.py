@@ -0,0 +1,87 @@
+from pathlib import Path
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+HAS_ASE = all(importlib.util.find_spec(m) is not None for m in ("numpy", "ase"))
+
+if HAS_ASE:
+    import numpy as np
+    from ase.build import mx2
+    from ase.io import write
+    from cost_model import CostModel, structure_features, valence_electrons, longest_first, mark_reused_relaxation
+    from executors import prepare_batch, order_by_cost, record_runtimes, set_job_state
+
+
+@unittest.skipUnless(HAS_ASE, "numpy/ase are not installed")
+class CostModelTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_valence_from_potcar_upf_and_fallback(self):
+        (self.root / "Mo_pv").mkdir()
+        (self.root / "Mo_pv" / "POTCAR").write_text("  PAW_PBE Mo_pv 08Apr2002\n   POMASS =   95.940; ZVAL   =   12.000    mass and valenz\n")
+        (self.root / "S.upf").write_text('<PP_HEADER\n   z_valence="6.000000000000000E+000"\n/>\n')
+        (self.root / "Se.UPF").write_text("<PP_HEADER>\n    6.00000000000      Z valence\n</PP_HEADER>\n")
+        self.assertEqual(valence_electrons("Mo", str(self.root), "VASP"), 12.0)
+        self.assertEqual(valence_electrons("S", str(self.root), "QE"), 6.0)
+        self.assertEqual(valence_electrons("Se", str(self.root), "QE"), 6.0)
+        self.assertEqual(valence_electrons("W", str(self.root), "VASP"), 20)  # 74 - 54
+
+    def test_larger_cells_cost_more_and_fit_uses_runtimes(self):
+        small = structure_features(mx2("MoS2", vacuum=8))
+        large = structure_features(mx2("MoS2", vacuum=8) * (3, 3, 1))
+        model = CostModel()
+        self.assertGreater(model.predict(large), model.predict(small))
+        self.assertEqual(longest_first(["small", "large"], [model.predict(small), model.predict(large)]),
+                         ["large", "small"])
+
+        # Runtimes that grow with the cube of the electrons pull the fitted exponent above the prior
+        path = self.root / "runtimes.json"
+        model = CostModel(str(path), regularization=1e-3)
+        for n in (1, 2, 3, 4):
+            features = structure_features(mx2("MoS2", vacuum=8) * (n, n, 1))
+            model.record(features, 10.0 * features["electrons"] ** 3 / features["kpoints"], name=str(n))
+        model.save()
+        reloaded = CostModel(str(path), regularization=1e-3)
+        self.assertEqual(len(reloaded.records), 4)
+        features = structure_features(mx2("MoS2", vacuum=8) * (5, 5, 1))
+        expected = 10.0 * features["electrons"] ** 3 / features["kpoints"]
+        self.assertLess(abs(np.log(reloaded.predict(features) / expected)), 0.5)
+
+    def test_batch_is_ordered_longest_first_and_runtimes_recorded(self):
+        structures, control = self.root / "s", self.root / "c"
+        structures.mkdir()
+        control.mkdir()
+        write(structures / "a_small.cif", mx2("MoS2", vacuum=8))
+        write(structures / "b_large.cif", mx2("MoS2", vacuum=8) * (4, 4, 1))
+        (control / "thick2dtool.in").write_text("optimize = True\nstructure_file = x.cif\n")
+        jobs = prepare_batch(str(structures), str(control), str(self.root / "batch"))
+
+        model = CostModel(str(self.root / "runtimes.json"))
+        self.assertEqual([os.path.basename(j) for j in order_by_cost(jobs, model)], ["b_large", "a_small"])
+
+        set_job_state(jobs[0], "done", [100, 160])
+        set_job_state(jobs[1], "failed", [100, 120])
+        self.assertEqual(record_runtimes(jobs, model), 1)
+        self.assertEqual(record_runtimes(jobs, model), 0)
+        self.assertEqual(CostModel(model.path).records[0]["runtime"], 60.0)
+
+        # A rerun that took its structure from the relaxed-structure cache is not a relaxation time
+        mark_reused_relaxation(jobs[1], "relaxed-structure cache")
+        set_job_state(jobs[1], "done", [200, 205])
+        self.assertEqual(record_runtimes(jobs, model), 0)
+        self.assertEqual(len(CostModel(model.path).records), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
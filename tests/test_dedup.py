@@ -0,0 +1,82 @@
+from pathlib import Path
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+HAS_SPGLIB = all(importlib.util.find_spec(m) is not None for m in ("numpy", "ase", "spglib"))
+
+if HAS_SPGLIB:
+    from ase.build import mx2, graphene
+    from ase.io import write
+    from dedup import DuplicateFinder, find_duplicates, read_duplicates, duplicates_name
+    from executors import prepare_batch, deduplicate_batch, batch_jobs, collect_results, FakeExecutor
+
+
+def shifted_supercell(atoms):
+    atoms = atoms.repeat((1, 2, 1))
+    atoms.rattle(0.001, seed=2)
+    atoms.translate([0.2, 0.4, 0.1])
+    atoms.wrap()
+    return atoms
+
+
+@unittest.skipUnless(HAS_SPGLIB, "numpy/ase/spglib are not installed")
+class DedupTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_find_duplicates(self):
+        mos2 = mx2("MoS2", vacuum=8.0)
+        structures = [("a", mos2), ("b", shifted_supercell(mos2)), ("c", mx2("MoS2", a=3.4, vacuum=8.0)),
+                      ("d", mx2("WS2", vacuum=8.0)), ("e", graphene(vacuum=8.0)), ("f", mx2("MoS2", a=3.401, vacuum=8.0))]
+        self.assertEqual(find_duplicates(structures), {"a": "a", "b": "a", "c": "c", "d": "d", "e": "e", "f": "c"})
+
+    def test_only_nearby_lattices_are_compared(self):
+        finder = DuplicateFinder()
+        for i in range(20):
+            finder.add(str(i), mx2("MoS2", a=3.0 + 0.1 * i, vacuum=8.0))
+        finder.add("copy", mx2("MoS2", a=3.5, vacuum=8.0))
+        self.assertLessEqual(finder.comparisons, 3)
+
+    def test_batch_runs_representatives_and_reports_duplicates(self):
+        structures, control, batch = self.root / "structures", self.root / "control", self.root / "batch"
+        structures.mkdir()
+        control.mkdir()
+        mos2 = mx2("MoS2", vacuum=8.0)
+        write(str(structures / "MoS2.cif"), mos2)
+        write(str(structures / "MoS2_copy.cif"), shifted_supercell(mos2))
+        write(str(structures / "WS2.cif"), mx2("WS2", vacuum=8.0))
+        (control / "thick2dtool.in").write_text("structure_file = x.cif\n")
+
+        unique = deduplicate_batch(str(structures), str(batch))
+        self.assertEqual(unique, ["MoS2.cif", "WS2.cif"])
+        self.assertEqual(read_duplicates(str(batch / duplicates_name)), {"MoS2_copy.cif": "MoS2.cif"})
+
+        jobs = prepare_batch(str(structures), str(control), str(batch), unique)
+        self.assertFalse((batch / "MoS2_copy").exists())
+
+        def run(job):
+            name = os.path.basename(job)
+            with open(os.path.join(job, "structure_thickness.txt"), "w") as f:
+                f.write(f"{name}, 6.5 , {name}\n")
+        FakeExecutor(run).submit(jobs)
+
+        all_jobs, duplicates = batch_jobs(str(structures), str(batch))
+        self.assertEqual(sorted(all_jobs), sorted(jobs))
+        results = collect_results(all_jobs, duplicates=duplicates)
+        copy = [r for r in results if r["job"] == "MoS2_copy"]
+        self.assertEqual(len(copy), 1)
+        self.assertEqual((copy[0]["material_id"], copy[0]["duplicate_of"], copy[0]["thickness"]), ("MoS2_copy", "MoS2", 6.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
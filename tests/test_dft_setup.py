@@ -0,0 +1,54 @@
+from pathlib import Path
+import importlib.util
+import os
+import sys
+import unittest
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+HAS_ASE = all(importlib.util.find_spec(m) is not None for m in ("numpy", "ase"))
+
+if HAS_ASE:
+    from ase.build import mx2
+    from dft_setup import (vacuum_axis, kpoint_mesh, detect_cores, vasp_parallel_settings,
+                           qe_parallel_flags, add_qe_parallel_flags)
+
+
+@unittest.skipUnless(HAS_ASE, "numpy/ase are not installed")
+class DftSetupTests(unittest.TestCase):
+    def test_mesh_follows_cell_size_with_one_point_along_vacuum(self):
+        cell = mx2("MoS2", vacuum=10)
+        self.assertEqual(vacuum_axis(cell), 2)
+        self.assertEqual(kpoint_mesh(cell, 0.3), [8, 8, 1])
+        self.assertEqual(kpoint_mesh(cell * (4, 4, 1), 0.3), [2, 2, 1])
+
+    def test_core_count_sources(self):
+        with mock.patch.dict(os.environ, {"SLURM_NTASKS": "48"}, clear=True):
+            self.assertEqual(detect_cores("mpirun -np 32 vasp_std > log"), 32)
+            self.assertEqual(detect_cores("srun --ntasks=16 vasp_std"), 16)
+            self.assertEqual(detect_cores("vasp_std > log"), 48)
+            self.assertEqual(detect_cores("mpirun -np 32 vasp_std", ncores="8"), 8)
+            self.assertEqual(detect_cores("mpirun --bind-to core -n 24 vasp_std"), 24)
+            # -n of the program or of another command is not a rank count
+            self.assertEqual(detect_cores("mpirun vasp_std -n 4 > log"), 48)
+            self.assertEqual(detect_cores("head -n 5 INCAR; vasp_std"), 48)
+        with mock.patch.dict(os.environ, {}, clear=True):
+            self.assertIsNone(detect_cores("vasp_std"))
+
+    def test_parallel_settings_divide_the_ranks(self):
+        self.assertEqual(vasp_parallel_settings(32, [8, 8, 1]), {"kpar": 8, "npar": 2})
+        self.assertEqual(vasp_parallel_settings(32, [1, 1, 1]), {"kpar": 1, "npar": 4})
+        self.assertEqual(vasp_parallel_settings(1, [8, 8, 1]), {"kpar": 1, "npar": 1})
+        self.assertEqual(qe_parallel_flags(32, [8, 8, 1]), {"-nk": 8, "-nd": 4})
+
+    def test_qe_flags_are_inserted_after_pw_x(self):
+        command = "mpirun -np 32 pw.x -in espresso.pwi > espresso.pwo"
+        self.assertEqual(add_qe_parallel_flags(command, {"-nk": 8, "-nd": 4}),
+                         "mpirun -np 32 pw.x -nk 8 -nd 4 -in espresso.pwi > espresso.pwo")
+        self.assertEqual(add_qe_parallel_flags("mpirun -np 4 pw.x -nk 2", {"-nk": 4}), "mpirun -np 4 pw.x -nk 2")
+
+
+if __name__ == "__main__":
+    unittest.main()
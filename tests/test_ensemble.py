@@ -0,0 +1,47 @@
+from pathlib import Path
+import importlib.util
+import sys
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+HAS_SKLEARN = all(importlib.util.find_spec(m) is not None for m in ("numpy", "sklearn"))
+
+if HAS_SKLEARN:
+    import numpy as np
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.linear_model import LinearRegression
+    from ensemble import ThicknessEnsemble, prediction_spread, tree_std
+
+
+@unittest.skipUnless(HAS_SKLEARN, "numpy/scikit-learn are not installed")
+class EnsembleTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = rng.normal(size=(80, 3))
+        self.y = 2.0 * self.X[:, 0] + 0.1 * rng.normal(size=80)
+        self.forest = RandomForestRegressor(n_estimators=20, random_state=0).fit(self.X, self.y)
+        self.linear = LinearRegression().fit(self.X, self.y)
+
+    def test_forest_spread_is_tree_std(self):
+        prediction, spread = prediction_spread(self.forest, self.X[:5])
+        np.testing.assert_allclose(prediction, self.forest.predict(self.X[:5]))
+        per_tree = np.stack([t.predict(self.X[:5].astype(np.float32)) for t in self.forest.estimators_])
+        np.testing.assert_allclose(spread, per_tree.std(axis=0))
+        self.assertIsNone(tree_std(self.linear, self.X[:5]))
+        self.assertIsNone(prediction_spread(self.linear, self.X[:5])[1])
+
+    def test_ensemble_combines_member_and_tree_variance(self):
+        ensemble = ThicknessEnsemble([self.forest, self.linear])
+        mean, spread = ensemble.predict_with_spread(self.X[:5])
+        members = np.stack([self.forest.predict(self.X[:5]), self.linear.predict(self.X[:5])])
+        np.testing.assert_allclose(mean, members.mean(axis=0))
+        np.testing.assert_allclose(ensemble.predict(self.X[:5]), mean)
+        expected = np.sqrt(members.var(axis=0) + tree_std(self.forest, self.X[:5]) ** 2 / 2)
+        np.testing.assert_allclose(spread, expected)
+        self.assertEqual(ensemble.names, ["RandomForestRegressor", "LinearRegression"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+from pathlib import Path
+import os
+import sys
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from executors import (prepare_batch, job_state, batch_status, collect_results, store_results, FakeExecutor,
+                       LocalExecutor, SlurmArrayExecutor, read_thickness_rows)
+from thick2d_read_write import append_rows
+from results_store import ResultsStore
+
+
+def write_thickness(directory, thickness):
+    name = os.path.basename(directory)
+    with open(os.path.join(directory, "structure_thickness.txt"), "w") as f:
+        f.write("#Material, Thickness (Ang), Material_id, Spread (Ang)\n")
+        f.write(f"{name}, {thickness} , {name}, 0.1\n")
+
+
+class ExecutorTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        root = Path(self.tmp.name)
+        self.structures = root / "structures"
+        self.control = root / "control"
+        self.batch = root / "batch"
+        self.structures.mkdir()
+        self.control.mkdir()
+        for name in ("MoS2.cif", "WSe2.cif", "notes.txt"):
+            (self.structures / name).write_text("data\n")
+        (self.control / "thick2dtool.in").write_text("# comment\nstructure_file = x.cif\nthroughput = False\n")
+        (self.control / "INCARs").write_text("# Step: DFT Optimization\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_prepare_batch_writes_job_directories(self):
+        jobs = prepare_batch(str(self.structures), str(self.control), str(self.batch))
+        self.assertEqual([os.path.basename(j) for j in jobs], ["MoS2", "WSe2"])
+        control = (Path(jobs[0]) / "thick2dtool.in").read_text()
+        self.assertIn("structure_file = MoS2.cif\n", control)
+        self.assertIn("throughput = True\n", control)
+        self.assertTrue((Path(jobs[0]) / "INCARs").exists())
+        self.assertEqual(batch_status(jobs)["new"], 2)
+
+    def test_jobs_share_the_trained_model(self):
+        (self.control / "ml_model").mkdir()
+        (self.control / "ml_model" / "best_thickness_model.pkl").write_bytes(b"model")
+        (self.control / "mat_thickness.txt").write_text("MoS2, 6.5\n")
+        jobs = prepare_batch(str(self.structures), str(self.control), str(self.batch))
+        # thick2d runs in the job directory and looks for ./ml_model
+        model_path = os.path.join(jobs[1], "ml_model", "best_thickness_model.pkl")
+        self.assertTrue(os.path.samefile(model_path, self.control / "ml_model" / "best_thickness_model.pkl"))
+        self.assertEqual((Path(jobs[1]) / "mat_thickness.txt").read_text(), "MoS2, 6.5\n")
+        # A model trained later in the control directory is seen by the prepared jobs
+        (self.control / "ml_model" / "best_thickness_model_classic.json").write_text("{}")
+        self.assertTrue((Path(jobs[0]) / "ml_model" / "best_thickness_model_classic.json").exists())
+        self.assertEqual(prepare_batch(str(self.structures), str(self.control), str(self.batch)), jobs)
+
+    def test_fake_executor_tracks_states_and_collects_results(self):
+        jobs = prepare_batch(str(self.structures), str(self.control), str(self.batch))
+
+        def run(directory):
+            if directory.endswith("WSe2"):
+                raise RuntimeError("SCF did not converge")
+            write_thickness(directory, 6.5)
+
+        self.assertEqual(FakeExecutor(run).submit(jobs), ["done", "failed"])
+        self.assertEqual([job_state(j) for j in jobs], ["done", "failed"])
+
+        # Only the failed job is resubmitted
+        seen = []
+        FakeExecutor(lambda d: (seen.append(d), write_thickness(d, 7.0))).submit(jobs)
+        self.assertEqual(seen, [jobs[1]])
+
+        output = self.batch / "batch_thickness.txt"
+        results = collect_results(jobs, str(output))
+        self.assertEqual([(r["material"], r["thickness"], r["spread"]) for r in results],
+                         [("MoS2", 6.5, 0.1), ("WSe2", 7.0, 0.1)])
+        self.assertEqual(len(output.read_text().splitlines()), 3)
+
+        store_results(results, str(self.batch / "thick2d_results.db"))
+        with ResultsStore(str(self.batch / "thick2d_results.db")) as store:
+            self.assertEqual([r["material_id"] for r in store.query(elements=["W"])], ["WSe2"])
+
+    def test_thickness_rows_keep_their_columns(self):
+        path = str(self.batch.parent / "structure_thickness.txt")
+        rows = [("MoS2", 6.5, None, 0.1), ("WS2", 6.2, "w1", None), ("GaSe", 8.0, None, None), ("InSe", 8.3, "i1", 0.2)]
+        append_rows(path, rows)
+        self.assertEqual(read_thickness_rows(path), rows)
+
+    def test_local_executor_runs_the_job_command(self):
+        jobs = prepare_batch(str(self.structures), str(self.control), str(self.batch))
+        command = (f"{sys.executable} -c \"import os; n = os.path.basename(os.getcwd()); "
+                   "open('structure_thickness.txt', 'w').write(n + ', 6.0 , ' + n + chr(10))\"")
+        self.assertEqual(LocalExecutor(workers=2, command=command).submit(jobs), ["done", "done"])
+        self.assertEqual([r["thickness"] for r in collect_results(jobs)], [6.0, 6.0])
+        self.assertEqual(LocalExecutor(command="false").submit(prepare_batch(
+            str(self.structures), str(self.control), str(self.batch))), [])
+
+    def test_slurm_array_script(self):
+        jobs = prepare_batch(str(self.structures), str(self.control), str(self.batch))
+        script = SlurmArrayExecutor(max_parallel=8, sbatch_options=["--time=01:00:00"], submit=False).submit(jobs)
+        text = Path(script).read_text()
+        self.assertIn("#SBATCH --array=0-1%8", text)
+        self.assertIn("#SBATCH --time=01:00:00", text)
+        self.assertIn("SLURM_ARRAY_TASK_ID", text)
+        self.assertEqual((self.batch / "thick2d_jobs.txt").read_text().split(), jobs)
+        self.assertEqual(batch_status(jobs)["new"], 2)
+
+    def test_slurm_jobs_are_queued_only_after_sbatch_succeeds(self):
+        jobs = prepare_batch(str(self.structures), str(self.control), str(self.batch))
+        executor = SlurmArrayExecutor()
+        with mock.patch("executors.subprocess.run", side_effect=subprocess.CalledProcessError(1, "sbatch")):
+            with self.assertRaises(subprocess.CalledProcessError):
+                executor.submit(jobs)
+        self.assertEqual(batch_status(jobs)["new"], 2)
+
+        accepted = subprocess.CompletedProcess(["sbatch"], 0, stdout="Submitted batch job 42\n", stderr="")
+        with mock.patch("executors.subprocess.run", return_value=accepted) as run:
+            executor.submit(jobs)
+        self.assertEqual(run.call_args[0][0][0], "sbatch")
+        self.assertEqual(batch_status(jobs)["queued"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
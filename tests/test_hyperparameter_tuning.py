@@ -0,0 +1,54 @@
+from pathlib import Path
+import importlib.util
+import json
+import sys
+import tempfile
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+HAS_SKLEARN = all(importlib.util.find_spec(m) is not None for m in ("numpy", "scipy", "sklearn"))
+
+if HAS_SKLEARN:
+    import numpy as np
+    from sklearn.model_selection import ShuffleSplit
+    from sklearn.tree import DecisionTreeRegressor
+    from hyperparameter_tuning import dataset_digest, tune_models
+
+
+@unittest.skipUnless(HAS_SKLEARN, "numpy/scipy/scikit-learn are not installed")
+class HyperparameterTuningTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.X = rng.normal(size=(90, 3))
+        self.y = self.X[:, 0] + 0.1 * rng.normal(size=90)
+        self.cv = ShuffleSplit(n_splits=2, test_size=0.3, random_state=0)
+
+    def test_digest_depends_on_data_and_settings(self):
+        key = dataset_digest(self.X, self.y, 5, "shuffle")
+        self.assertEqual(key, dataset_digest(self.X.copy(), self.y.copy(), 5, "shuffle"))
+        self.assertNotEqual(key, dataset_digest(self.X, self.y, 6, "shuffle"))
+        self.assertNotEqual(key, dataset_digest(self.X[:-1], self.y[:-1], 5, "shuffle"))
+
+    def test_search_result_is_persisted_and_reused(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = Path(tmp) / "tuned.json"
+            key = dataset_digest(self.X, self.y)
+            (model,) = tune_models([DecisionTreeRegressor()], self.X, self.y, key, str(cache), self.cv,
+                                   n_candidates=4, n_jobs=1, random_state=0)
+            tuned = json.loads(cache.read_text())
+            params = tuned[f"DecisionTreeRegressor:{key}"]["params"]
+            self.assertEqual({p: model.get_params()[p] for p in params}, params)
+
+            # A cached entry is applied without searching again
+            params = {"max_depth": 3, "min_samples_leaf": 7}
+            tuned[f"DecisionTreeRegressor:{key}"]["params"] = params
+            cache.write_text(json.dumps(tuned))
+            (model,) = tune_models([DecisionTreeRegressor()], self.X, self.y, key, str(cache), None)
+            self.assertEqual(model.max_depth, 3)
+            self.assertEqual(model.min_samples_leaf, 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+from pathlib import Path
+import json
+import sys
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from instrumentation import stage  # noqa: E402
+
+
+class StageTimingTests(unittest.TestCase):
+    def test_stage_logs_json_record_with_extra_fields(self):
+        with self.assertLogs("thick2d.stages", level="INFO") as logs:
+            with stage("predict/model_predict", model="ExtraTreesRegressor") as record:
+                record["rows"] = 3
+
+        payload = json.loads(logs.records[0].getMessage())
+        self.assertEqual(payload["stage"], "predict/model_predict")
+        self.assertEqual(payload["status"], "ok")
+        self.assertEqual(payload["model"], "ExtraTreesRegressor")
+        self.assertEqual(payload["rows"], 3)
+        self.assertGreaterEqual(payload["wall_s"], 0)
+        self.assertIn("cpu_s", payload)
+
+    def test_failed_stage_is_logged_and_reraised(self):
+        with self.assertLogs("thick2d.stages", level="INFO") as logs:
+            with self.assertRaises(RuntimeError):
+                with stage("optimize"):
+                    raise RuntimeError("VASP failed")
+
+        self.assertEqual(json.loads(logs.records[0].getMessage())["status"], "error")
+
+
+if __name__ == "__main__":
+    unittest.main()
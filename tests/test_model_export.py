@@ -0,0 +1,179 @@
+from pathlib import Path
+import importlib.util
+import json
+import sys
+import tempfile
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+HAS_NUMPY = importlib.util.find_spec("numpy") is not None
+
+if HAS_NUMPY:
+    import numpy as np
+    from model_export import (NumpyMLP, export_dnn_weights, export_inference_model, load_exported_model,
+                              remove_exported_model, CompiledFeatureSchema, stack_thickness, predict_exported,
+                              feature_schema_name)
+
+
+class _Layer:
+    def __init__(self, config, weights=()):
+        self._config = config
+        self._weights = list(weights)
+
+    def get_config(self):
+        return dict(self._config)
+
+    def get_weights(self):
+        return list(self._weights)
+
+
+class Dense(_Layer):
+    pass
+
+
+class BatchNormalization(_Layer):
+    pass
+
+
+class Activation(_Layer):
+    pass
+
+
+class GaussianNoise(_Layer):
+    pass
+
+
+class Dropout(_Layer):
+    pass
+
+
+class _Sequential:
+    def __init__(self, layers):
+        self.layers = layers
+
+
+@unittest.skipUnless(HAS_NUMPY, "numpy is not installed")
+class NumpyDNNExportTests(unittest.TestCase):
+    def test_folded_weights_reproduce_reference_forward_pass(self):
+        rng = np.random.default_rng(0)
+        W1, b1 = rng.normal(size=(5, 4)), rng.normal(size=4)
+        W2, b2 = rng.normal(size=(4, 4)), rng.normal(size=4)
+        W3, b3 = rng.normal(size=(4, 1)), rng.normal(size=1)
+        bn1 = [rng.uniform(0.5, 1.5, 4), rng.normal(size=4), rng.normal(size=4), rng.uniform(0.5, 2.0, 4)]
+        bn2 = [rng.uniform(0.5, 1.5, 4), rng.normal(size=4), rng.normal(size=4), rng.uniform(0.5, 2.0, 4)]
+        eps = 1e-3
+
+        model = _Sequential([
+            Dense({"activation": "linear"}, [W1, b1]),
+            GaussianNoise({}),
+            Activation({"activation": "relu"}),
+            BatchNormalization({"epsilon": eps}, bn1),
+            Dense({"activation": "linear"}, [W2, b2]),
+            Activation({"activation": "relu"}),
+            BatchNormalization({"epsilon": eps}, bn2),
+            Dropout({}),
+            Dense({"activation": "linear"}, [W3, b3]),
+        ])
+
+        def batch_norm(h, params):
+            gamma, beta, mean, var = params
+            return gamma * (h - mean) / np.sqrt(var + eps) + beta
+
+        X = rng.normal(size=(7, 5))
+        h = batch_norm(np.maximum(X @ W1 + b1, 0), bn1)
+        h = batch_norm(np.maximum(h @ W2 + b2, 0), bn2)
+        expected = (h @ W3 + b3).ravel()
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "weights.npz"
+            export_dnn_weights(model, path)
+            mlp = NumpyMLP(path, manifest={})
+            self.assertEqual(len(mlp.kernels), 3)
+            np.testing.assert_allclose(mlp.predict(X), expected, rtol=1e-10, atol=1e-10)
+
+
+@unittest.skipUnless(HAS_NUMPY, "numpy is not installed")
+class CompiledFeatureSchemaTests(unittest.TestCase):
+    def setUp(self):
+        # s, p, d, f, total valence electrons
+        self.elements = {
+            "symbols": ["H", "Mo", "S"],
+            "valence": [[1, 0, 0, 0, 1], [1, 0, 5, 0, 6], [2, 4, 0, 0, 6]],
+            "valence_labels": ["avg s valence electrons", "avg p valence electrons", "avg d valence electrons",
+                               "avg f valence electrons", "frac s valence electrons", "frac p valence electrons",
+                               "frac d valence electrons", "frac f valence electrons"],
+            "mass": [1.0, 96.0, 32.0],
+        }
+        self.columns = ["S", "avg d valence electrons", "frac s valence electrons", "Mo", "MolWeight"]
+
+    def test_features_are_written_in_schema_order_and_scaled(self):
+        schema = {"columns": self.columns, "mean": [0.5, 1.0, 0.0, 0.0, 100.0],
+                  "scale": [0.5, 2.0, 1.0, 1.0, 10.0], "elements": self.elements}
+        X = CompiledFeatureSchema(schema).transform(["MoS2", "S"])
+
+        raw_mos2 = np.array([2 / 3, 5 / 3, (5 / 3) / 6, 1 / 3, 160.0])
+        raw_s = np.array([1.0, 0.0, 2 / 6, 0.0, 32.0])
+        expected = (np.vstack([raw_mos2, raw_s]) - schema["mean"]) / schema["scale"]
+        self.assertEqual(X.dtype, np.float32)
+        np.testing.assert_allclose(X, expected, rtol=1e-6)
+
+    def test_unknown_elements_and_old_schemas_are_not_compiled(self):
+        schema = {"columns": self.columns, "mean": [0] * 5, "scale": [1] * 5, "elements": self.elements}
+        self.assertIsNone(CompiledFeatureSchema(schema).transform(["WS2"]))
+        self.assertIsNone(CompiledFeatureSchema(schema).transform(["Mo(S2)"]))
+        del schema["elements"]
+        self.assertIsNone(CompiledFeatureSchema(schema).transform(["MoS2"]))
+
+    def test_predict_exported_from_numpy_weights(self):
+        schema = {"columns": self.columns, "mean": [0.0] * 5, "scale": [1.0] * 5, "elements": self.elements,
+                  "dataset_sha256": "abc"}
+        W, b = np.array([[1.0], [0.0], [0.0], [0.0], [0.01]]), np.array([3.0])
+        with tempfile.TemporaryDirectory() as tmp:
+            (Path(tmp) / "best_thickness_model.keras").write_bytes(b"keras model")
+            # Only the NumPy weights are written; the ONNX export of the stand-in model is skipped
+            export_inference_model(_Sequential([Dense({"activation": "linear"}, [W, b])]), tmp, "dnn", 5)
+            self.assertIsNone(predict_exported(["MoS2"], tmp, "dnn"))
+            (Path(tmp) / feature_schema_name).write_text(json.dumps(schema))
+
+            predictions, algorithm = predict_exported(["MoS2"], tmp, "dnn", dataset_sha256="abc")
+            self.assertEqual(algorithm, "_Sequential")
+            np.testing.assert_allclose(predictions, [3.0 + 2 / 3 + 1.6], rtol=1e-6)
+            self.assertIsNone(predict_exported(["MoS2"], tmp, "dnn", dataset_sha256="other"))
+            self.assertIsNone(predict_exported(["WS2"], tmp, "dnn"))
+            self.assertIsNone(predict_exported(["MoS2"], tmp, "classic"))
+
+    def test_export_of_another_model_is_not_loaded(self):
+        W, b = np.array([[1.0]]), np.array([0.0])
+        with tempfile.TemporaryDirectory() as tmp:
+            model_path = Path(tmp) / "best_thickness_model.keras"
+            model_path.write_bytes(b"first model")
+            export_inference_model(_Sequential([Dense({"activation": "linear"}, [W, b])]), tmp, "dnn", 1)
+            self.assertIsNotNone(load_exported_model(tmp, "dnn"))
+
+            model_path.write_bytes(b"retrained model")
+            self.assertIsNone(load_exported_model(tmp, "dnn"))
+            model_path.unlink()
+            self.assertIsNone(load_exported_model(tmp, "dnn"))
+
+            remove_exported_model(tmp, "dnn")
+            self.assertEqual(list(Path(tmp).iterdir()), [])
+
+
+@unittest.skipUnless(HAS_NUMPY, "numpy is not installed")
+class StackThicknessTests(unittest.TestCase):
+    def test_float32_and_float64_outputs_agree(self):
+        single, _ = stack_thickness(np.array([6.5], dtype=np.float32) + np.float32(4.7e-6), None, 1, 3.5)
+        self.assertEqual(single.tolist(), [6.5])
+        self.assertEqual(stack_thickness(np.array([6.5]), None, 1, 3.5)[0].tolist(), [6.5])
+
+    def test_layers_and_spread(self):
+        thickness, spread = stack_thickness(np.array([6.5]), np.array([0.1]), 3, 3.5)
+        self.assertEqual(thickness.tolist(), [23.0])
+        np.testing.assert_allclose(spread, [0.3])
+        self.assertIsNone(stack_thickness(np.array([6.5, 7.0]), np.zeros(2), 1, 3.5)[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
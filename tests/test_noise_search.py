@@ -0,0 +1,37 @@
+from pathlib import Path
+import importlib.util
+import json
+import sys
+import tempfile
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+HAS_TF = all(importlib.util.find_spec(m) is not None for m in ("numpy", "tensorflow", "bayes_opt"))
+
+if HAS_TF:
+    import numpy as np
+    from noise_search import search_noise, pbounds
+
+
+@unittest.skipUnless(HAS_TF, "numpy/tensorflow/bayes_opt are not installed")
+class NoiseSearchTests(unittest.TestCase):
+    def test_parallel_trials_and_cache(self):
+        rng = np.random.RandomState(0)
+        X = rng.rand(40, 3)
+        y = X.sum(axis=1)
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = str(Path(tmp) / "noise_search.json")
+            noise, nodes = search_noise(X[:30], y[:30], X[30:], y[30:], n_layers=1, n_trials=2, init_points=2,
+                                        epochs=2, patience=1, workers=2, cache_path=cache_path, dataset_key="tiny")
+            self.assertTrue(pbounds['noise_amount'][0] <= noise <= pbounds['noise_amount'][1])
+            self.assertTrue(pbounds['nodes'][0] <= nodes <= pbounds['nodes'][1])
+            with open(cache_path, "r") as f:
+                self.assertEqual(len(json.load(f)), 1)
+            self.assertEqual(search_noise(X[:30], y[:30], X[30:], y[30:], n_layers=1, n_trials=2, epochs=2,
+                                          workers=2, cache_path=cache_path, dataset_key="tiny"), (noise, nodes))
+
+
+if __name__ == "__main__":
+    unittest.main()
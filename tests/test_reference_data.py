@@ -0,0 +1,50 @@
+from pathlib import Path
+import importlib.util
+import sys
+import tempfile
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+HAS_PANDAS = all(importlib.util.find_spec(m) is not None for m in ("numpy", "pandas"))
+
+if HAS_PANDAS:
+    import numpy as np
+    import pandas as pd
+    from reference_data import build_reference_dataset, load_reference_dataset, default_reference_dataset
+
+
+def _featurize(formulas):
+    return pd.DataFrame({"length": [float(len(f)) for f in formulas]})
+
+
+@unittest.skipUnless(HAS_PANDAS, "numpy/pandas are not installed")
+class ReferenceDatasetTests(unittest.TestCase):
+    def test_build_averages_duplicates_and_loads_memory_mapped(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            csv = Path(tmp) / "thickness.csv"
+            csv.write_text("# comment\nMaterialName,Thickness_Ang\nWS2,6.2\nMoS2,6.5  # note\nWS2,6.4\n")
+            digest = build_reference_dataset(str(csv), tmp, _featurize, version="2")
+
+            dataset = load_reference_dataset(tmp, verify=True)
+            self.assertEqual(dataset.sha256, digest)
+            self.assertEqual(dataset.version, "2")
+            self.assertEqual(dataset.table["MaterialName"].tolist(), ["MoS2", "WS2"])
+            np.testing.assert_allclose(dataset.table["Thickness_Ang"], [6.5, 6.3])
+            self.assertEqual(dataset.features.loc["MoS2", "length"], 4.0)
+
+            features = np.load(Path(tmp) / "features.npy", mmap_mode="r+")
+            features[0, 0] = 99.0
+            features.flush()
+            with self.assertRaises(ValueError):
+                load_reference_dataset(tmp, verify=True)
+
+    def test_shipped_dataset_matches_its_manifest(self):
+        dataset = load_reference_dataset(default_reference_dataset, verify=True)
+        self.assertEqual(len(dataset.table), dataset.manifest["n_rows"])
+        self.assertTrue(dataset.table["MaterialName"].is_unique)
+
+
+if __name__ == "__main__":
+    unittest.main()
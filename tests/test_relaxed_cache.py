@@ -0,0 +1,69 @@
+from pathlib import Path
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+HAS_SPGLIB = all(importlib.util.find_spec(m) is not None for m in ("numpy", "ase", "spglib"))
+
+if HAS_SPGLIB:
+    import numpy as np
+    from ase.build import mx2
+    from relaxed_cache import RelaxedStructureCache, structure_keys, structures_match, settings_tag
+
+
+@unittest.skipUnless(HAS_SPGLIB, "numpy/ase/spglib are not installed")
+class RelaxedCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.atoms = mx2("MoS2", vacuum=8.0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def equivalent_copy(self):
+        atoms = self.atoms.repeat((2, 1, 1))
+        atoms.rattle(0.001, seed=1)
+        atoms.translate([0.3, 0.1, 0.2])
+        atoms.wrap()
+        return atoms
+
+    def test_keys_ignore_supercell_and_origin(self):
+        self.assertEqual(structure_keys(self.atoms)[:2], structure_keys(self.equivalent_copy())[:2])
+        self.assertNotEqual(structure_keys(self.atoms)[1], structure_keys(mx2("MoS2", a=3.3, vacuum=8.0))[1])
+        self.assertNotEqual(structure_keys(self.atoms, "a")[0], structure_keys(self.atoms, "b")[0])
+
+    def test_structures_match_within_tolerance(self):
+        self.assertTrue(structures_match(self.atoms, self.equivalent_copy()))
+        self.assertTrue(structures_match(self.atoms, mx2("MoS2", a=3.19, vacuum=8.0)))
+        self.assertFalse(structures_match(self.atoms, mx2("MoS2", a=3.3, vacuum=8.0)))
+        self.assertFalse(structures_match(self.atoms, mx2("MoS2", thickness=3.4, vacuum=8.0)))
+
+    def test_settings_tag_ignores_parallelization(self):
+        self.assertEqual(settings_tag("vasp", {"encut": 500, "kpar": 2, "kpts": [8, 8, 1]}),
+                         settings_tag("VASP", {"encut": 500, "npar": 4, "kpts": (8, 8, 1)}))
+        self.assertNotEqual(settings_tag("VASP", {"encut": 500}), settings_tag("VASP", {"encut": 520}))
+
+    def test_store_and_lookup(self):
+        cache = RelaxedStructureCache(self.tmp.name)
+        relaxed = self.atoms.copy()
+        relaxed.positions[:, 2] *= 1.01
+        self.assertIsNone(cache.lookup(self.atoms, "tag"))
+
+        entry = cache.store(self.atoms, relaxed, "tag", source="here")
+        self.assertEqual(cache.store(self.equivalent_copy(), relaxed, "tag"), entry)
+        self.assertEqual(len(os.listdir(os.path.dirname(entry))), 1)
+
+        found = cache.lookup(self.equivalent_copy(), "tag")
+        np.testing.assert_allclose(found.positions, relaxed.positions, atol=1e-6)
+        self.assertIsNone(cache.lookup(self.atoms, "other settings"))
+        # A slightly strained copy falls into another lattice bin but is still found by the tolerance fallback
+        self.assertIsNotNone(cache.lookup(mx2("MoS2", a=3.174, vacuum=8.0), "tag"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+from pathlib import Path
+import sys
+import tempfile
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from results_store import ResultsStore, formula_key, latest_result, main
+
+
+class ResultsStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.path = str(self.root / "thick2d_results.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_formula_key_reduces_and_lists_elements(self):
+        self.assertEqual(formula_key("Mo2S4"), ("MoS2", ["Mo", "S"]))
+        self.assertEqual(formula_key("S2W"), ("S2W", ["S", "W"]))
+        self.assertEqual(formula_key("Ca0.5O"), ("Ca0.5O", ["Ca", "O"]))
+        self.assertEqual(formula_key("Ca(OH)2"), ("CaH2O2", ["Ca", "H", "O"]))
+        self.assertEqual(formula_key("K4[Fe(CN)6]"), ("C6FeK4N6", ["C", "Fe", "K", "N"]))
+        self.assertEqual(formula_key("(Mo2S4)2"), ("MoS2", ["Mo", "S"]))
+        with self.assertRaises(ValueError):
+            formula_key("unknown")
+
+    def test_query_by_elements_formula_and_thickness(self):
+        with ResultsStore(self.path) as store:
+            store.add_many([
+                {"formula": "Mo2S4", "thickness": 6.5, "material_id": "a", "model_version": "classic/abc",
+                 "timings": {"predict_s": 0.1}},
+                {"formula": "MoSe2", "thickness": 7.2, "material_id": "b"},
+                {"formula": "WS2", "thickness": 6.1, "material_id": "c", "source": "DFT"},
+                {"formula": "MoS2", "thickness": 6.9, "material_id": "d", "source": "lookup"},
+            ])
+            self.assertEqual(len(store), 4)
+            thin = store.query(elements=["Mo"], max_thickness=7.0)
+            self.assertEqual([r["material_id"] for r in thin], ["a", "d"])
+            self.assertEqual(thin[0]["formula"], "MoS2")
+            self.assertEqual(thin[0]["name"], "Mo2S4")
+            self.assertEqual(thin[0]["timings"], {"predict_s": 0.1})
+            self.assertEqual([r["material_id"] for r in store.query(elements=["Mo", "Se"])], ["b"])
+            self.assertEqual([r["material_id"] for r in store.query(formula="S4Mo2")], ["a", "d"])
+            self.assertEqual([r["material_id"] for r in store.query(min_thickness=6.9)], ["d", "b"])
+            self.assertEqual([r["material_id"] for r in store.query(source="DFT")], ["c"])
+            self.assertEqual(store.query(elements=["Nb"]), [])
+            with self.assertRaises(ValueError):
+                store.add("MoS2", 6.5, source="guess")
+        self.assertEqual(latest_result(self.path)["material_id"], "d")
+        self.assertIsNone(latest_result(str(self.root / "missing.db")))
+
+    def test_import_thickness_file(self):
+        table = self.root / "structure_thickness.txt"
+        table.write_text("#Material, Thickness (Ang), Material_id\n"
+                         "Fe2K4O14P4, 6.26 , x1\n"
+                         "I2N2Ti2, 5.42 , x2, 0.3\n")
+        self.assertEqual(main(["--db", self.path, "import", str(table), "--model-version", "shipped"]), 0)
+        with ResultsStore(self.path) as store:
+            rows = store.query(elements=["Ti"])
+        self.assertEqual([(r["formula"], r["spread"], r["source"], r["model_version"]) for r in rows],
+                         [("INTi", 0.3, "lookup", "shipped")])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+from pathlib import Path
+import importlib.util
+import shutil
+import sys
+import tarfile
+import tempfile
+import unittest
+import zipfile
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+from structure_io import (hill_formula, read_cif_formula, is_structure_container, iter_structures,  # noqa: E402
+                          iter_structure_counts)
+
+HAS_ASE = importlib.util.find_spec("ase") is not None
+
+
+SYMMETRIC_CIF = """data_MoS2
+_cell_length_a 3.19
+_cell_formula_units_Z 2
+_chemical_formula_sum 'Mo1 S2'
+_symmetry_space_group_name_H-M 'P 63/m m c'
+loop_
+ _symmetry_equiv_pos_as_xyz
+  'x, y, z'
+  '-x, -y, -z'
+loop_
+ _atom_site_label
+ _atom_site_fract_x
+ _atom_site_fract_y
+ _atom_site_fract_z
+  Mo1 0.3333 0.6667 0.25
+  S1 0.3333 0.6667 0.621
+"""
+
+
+class CifScannerTests(unittest.TestCase):
+    def test_example_cifs_match_expected_composition(self):
+        expected = {
+            "MoS2/MoS2.cif": {"Mo": 1, "S": 2},
+            "GeSe/GeSe.cif": {"Ge": 2, "Se": 2},
+            "Graphene/graphene.cif": {"C": 2},
+        }
+        for name, counts in expected.items():
+            with self.subTest(name=name):
+                self.assertEqual(read_cif_formula(ROOT / "examples" / name), counts)
+
+    def test_symmetric_cif_uses_formula_sum_and_z(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "sym.cif"
+            path.write_text(SYMMETRIC_CIF)
+            self.assertEqual(read_cif_formula(path), {"Mo": 2, "S": 4})
+
+    def test_symmetric_cif_without_formula_needs_full_parse(self):
+        source = SYMMETRIC_CIF.replace("_chemical_formula_sum 'Mo1 S2'\n", "")
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "sym.cif"
+            path.write_text(source)
+            self.assertIsNone(read_cif_formula(path))
+
+    def test_hill_formula_ordering(self):
+        self.assertEqual(hill_formula({"S": 2, "Mo": 1}), "MoS2")
+        self.assertEqual(hill_formula({"O": 1, "H": 4, "C": 1}), "CH4O")
+
+
+@unittest.skipUnless(HAS_ASE, "ase is not installed")
+class ContainerTests(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_container_extensions(self):
+        for name in ("a.extxyz", "a.db", "a.traj", "a.tar.gz", "A.ZIP"):
+            self.assertTrue(is_structure_container(name), name)
+        for name in ("a.cif", "a.vasp", "a.xyz"):
+            self.assertFalse(is_structure_container(name), name)
+
+    def test_extxyz_and_db_stream_with_material_ids(self):
+        from ase.build import mx2
+        from ase.db import connect
+        from ase.io import write
+
+        frames = [mx2("MoS2", vacuum=8.0), mx2("WSe2", vacuum=8.0)]
+        frames[0].info["material_id"] = "mp-2815"
+        write(str(self.root / "set.extxyz"), frames)
+        db = connect(str(self.root / "set.db"))
+        db.write(frames[0], material_id="mp-2815")
+        db.write(frames[1])
+
+        expected = [("mp-2815", {"Mo": 1, "S": 2}), ("set_1", {"W": 1, "Se": 2})]
+        self.assertEqual(list(iter_structure_counts(str(self.root / "set.extxyz"))), expected)
+        self.assertEqual([m for m, _ in iter_structure_counts(str(self.root / "set.db"))], ["mp-2815", "set_2"])
+        self.assertEqual([a.get_chemical_formula() for _, a in iter_structures(str(self.root / "set.db"))], ["MoS2", "Se2W"])
+
+    def test_cif_archives(self):
+        cifs = self.root / "cifs"
+        cifs.mkdir()
+        for name in ("MoS2/MoS2.cif", "GeSe/GeSe.cif"):
+            shutil.copy(ROOT / "examples" / name, cifs)
+        (cifs / "notes.txt").write_text("not a structure\n")
+        with tarfile.open(self.root / "set.tar.gz", "w:gz") as archive:
+            archive.add(cifs, arcname="cifs")
+        with zipfile.ZipFile(self.root / "set.zip", "w") as archive:
+            for path in sorted(cifs.iterdir()):
+                archive.write(path, f"cifs/{path.name}")
+
+        for name in ("set.tar.gz", "set.zip"):
+            with self.subTest(name=name):
+                counts = dict(iter_structure_counts(str(self.root / name)))
+                self.assertEqual(counts, {"MoS2": {"Mo": 1, "S": 2}, "GeSe": {"Ge": 2, "Se": 2}})
+                formulas = {m: a.get_chemical_formula() for m, a in iter_structures(str(self.root / name))}
+                self.assertEqual(formulas, {"MoS2": "MoS2", "GeSe": "Ge2Se2"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+from pathlib import Path
+import importlib.util
+import sys
+import tempfile
+import unittest
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT / "src"))
+
+HAS_PANDAS = all(importlib.util.find_spec(m) is not None for m in ("numpy", "pandas"))
+
+if HAS_PANDAS:
+    import pandas as pd
+    from thickness_store import ThicknessStore, parse_thickness_line
+
+
+def _featurize(calls):
+    def featurize(formulas):
+        calls.extend(formulas)
+        return pd.DataFrame({"length": [float(len(f)) for f in formulas], "upper": [float(sum(c.isupper() for c in f)) for f in formulas]})
+    return featurize
+
+
+@unittest.skipUnless(HAS_PANDAS, "numpy/pandas are not installed")
+class ThicknessStoreTests(unittest.TestCase):
+    def test_parse_line(self):
+        self.assertEqual(parse_thickness_line("MoS2  6.5  # bulk\n"), ("MoS2", 6.5))
+        self.assertIsNone(parse_thickness_line("# comment"))
+        self.assertIsNone(parse_thickness_line("MoS2 thick"))
+
+    def test_appends_are_incremental_and_features_cached(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            text = Path(tmp) / "mat_thickness.txt"
+            text.write_text("MoS2 6.6\nGaSe 8.0\nGaSe 8.4\n")
+            calls = []
+            with ThicknessStore(str(Path(tmp) / "store.db")) as store:
+                self.assertEqual(store.ingest(str(text)), 3)
+                store.update_features(_featurize(calls))
+                self.assertEqual(store.ingest(str(text)), 0)
+
+                with open(text, "a") as f:
+                    f.write("GaSe 8.2\nInSe 7.0\n")
+                self.assertEqual(store.ingest(str(text)), 2)
+                store.update_features(_featurize(calls))
+                table, features = store.load()
+
+            self.assertEqual(sorted(calls), ["GaSe", "InSe", "MoS2"])
+            gase = table.set_index("MaterialName").loc["GaSe"]
+            self.assertEqual(int(gase["Count"]), 3)
+            self.assertAlmostEqual(gase["Thickness_Sum"], 24.6)
+            self.assertEqual(list(features.columns), ["length", "upper"])
+            self.assertEqual(features.loc["InSe", "upper"], 2.0)
+
+    def test_rewritten_file_is_reingested(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            text = Path(tmp) / "mat_thickness.txt"
+            text.write_text("MoS2 6.6\nGaSe 8.0\n")
+            calls = []
+            with ThicknessStore(str(Path(tmp) / "store.db")) as store:
+                store.ingest(str(text))
+                store.update_features(_featurize(calls))
+                text.write_text("GaSe 9.0\n")
+                self.assertEqual(store.ingest(str(text)), 1)
+                store.update_features(_featurize(calls))
+                table, features = store.load()
+
+            self.assertEqual(table["MaterialName"].tolist(), ["GaSe"])
+            self.assertEqual(table["Thickness_Sum"].tolist(), [9.0])
+            self.assertEqual(sorted(calls), ["GaSe", "MoS2"])
+            self.assertEqual(list(features.index), ["GaSe"])
+
+    def test_rewriting_one_file_keeps_the_others(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            first, second = Path(tmp) / "first.txt", Path(tmp) / "second.txt"
+            first.write_text("MoS2 6.6\nGaSe 8.0\n")
+            second.write_text("GaSe 8.4\nInSe 7.0\n")
+            with ThicknessStore(str(Path(tmp) / "store.db")) as store:
+                store.ingest(str(first))
+                store.ingest(str(second))
+                first.write_text("GaSe 9.0\n")
+                self.assertEqual(store.ingest(str(first)), 1)
+                self.assertEqual(store.ingest(str(second)), 0)
+                table, _ = store.load()
+
+            table = table.set_index("MaterialName")
+            self.assertEqual(sorted(table.index), ["GaSe", "InSe"])
+            self.assertEqual(int(table.loc["GaSe", "Count"]), 2)
+            self.assertAlmostEqual(table.loc["GaSe", "Thickness_Sum"], 17.4)
+            self.assertAlmostEqual(table.loc["InSe", "Thickness_Sum"], 7.0)
+
+
+if __name__ == "__main__":
+    unittest.main()